@@ -0,0 +1,443 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Normalização de textos para a pesquisa do OrçaFácil
+As descrições do SINAPI vêm em maiúsculas, com acentos e abreviações
+variadas; a chave normalizada de cada descrição é calculada uma única vez,
+na importação, e serve tanto para a pesquisa quanto para a ordenação.
+Também contém o índice em memória usado na pesquisa enquanto se digita, o
+cache dos resultados da pesquisa no banco e a correção de erros de digitação
+"""
+
+import re
+import math
+import time
+import heapq
+import unicodedata
+from array import array
+from collections import Counter, OrderedDict
+from functools import lru_cache
+
+# Quantidade de pesquisas guardadas no cache de resultados
+TAMANHO_CACHE_PESQUISA = 64
+
+# Relevância da pesquisa no banco: pesos das colunas do índice (tipo, codigo,
+# descricao_norm) e parâmetros k1 e b da função bm25 do FTS5
+PESOS_BM25 = (0.0, 10.0, 1.0)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Correção de erros de digitação: tamanho mínimo das palavras corrigidas,
+# maior distância de edição aceita e quantas letras do início de cada palavra
+# geram deleções no vocabulário (ver delecoes)
+MINIMO_CORRECAO = 4
+DISTANCIA_CORRECAO = 2
+PREFIXO_DELECOES = 7
+
+# Abreviações com barra, comuns nas descrições ("P/ ESGOTO", "C/ TAMPA")
+ABREVIACOES_BARRA = {
+    'p': 'para',
+    'c': 'com',
+    's': 'sem',
+}
+
+# Abreviações usuais nas descrições do SINAPI (já sem acentos e em minúsculas)
+ABREVIACOES = {
+    'aprox': 'aproximadamente',
+    'alt': 'altura',
+    'compr': 'comprimento',
+    'cx': 'caixa',
+    'diam': 'diametro',
+    'equip': 'equipamento',
+    'esp': 'espessura',
+    'exec': 'execucao',
+    'ext': 'externo',
+    'fornec': 'fornecimento',
+    'galv': 'galvanizado',
+    'incl': 'inclusive',
+    'instal': 'instalacao',
+    'int': 'interno',
+    'larg': 'largura',
+    'manut': 'manutencao',
+    'ref': 'referencia',
+    'rosc': 'roscavel',
+    'sold': 'soldavel',
+    'tp': 'tipo',
+    'unid': 'unidade',
+}
+
+
+def _palavras(texto):
+    """Palavras de um texto, sem acentos, em minúsculas e com as abreviações com barra por extenso"""
+    texto = unicodedata.normalize('NFKD', str(texto)).casefold()
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r'\b([pcs])/', lambda m: f" {ABREVIACOES_BARRA[m.group(1)]} ", texto)
+    return re.findall(r'[^\W_]+', texto)
+
+
+@lru_cache(maxsize=65536)
+def normalizar_texto(texto):
+    """
+    Chave de pesquisa e ordenação de uma descrição
+
+    Sem acentos, em minúsculas, só com letras e números separados por um
+    espaço e com as abreviações usuais por extenso.
+    Ex: "TUBO PVC P/ ESGOTO, DIAM. 100 MM" -> "tubo pvc para esgoto diametro 100 mm"
+    """
+    if texto is None:
+        return ''
+    return ' '.join(ABREVIACOES.get(palavra, palavra) for palavra in _palavras(texto))
+
+
+def consulta_fts(termo):
+    """
+    Monta a consulta FTS5 de um termo digitado
+
+    Cada palavra vira um prefixo entre aspas ("tubo"* AND "pvc"*): a pesquisa
+    encontra as descrições com todas as palavras, mesmo incompletas, e a
+    pontuação digitada não é interpretada como sintaxe do FTS5. Uma palavra
+    que é abreviação também procura a forma por extenso, que é a indexada.
+    """
+    partes = []
+    for palavra in _palavras(termo):
+        if palavra in ABREVIACOES:
+            partes.append(f'("{palavra}"* OR "{ABREVIACOES[palavra]}"*)')
+        else:
+            partes.append(f'"{palavra}"*')
+    return ' AND '.join(partes)
+
+
+def frases_fts(termo):
+    """Prefixos da consulta FTS5 de um termo, um para cada frase dela (ver consulta_fts)"""
+    frases = []
+    for palavra in _palavras(termo):
+        frases.append(palavra)
+        if palavra in ABREVIACOES:
+            frases.append(ABREVIACOES[palavra])
+    return frases
+
+
+def bm25(frases, codigo, descricao_norm, linhas_indice, media_palavras, acertos):
+    """
+    Relevância de uma linha do índice de busca, calculada como a função bm25 do FTS5
+
+    Args:
+        frases: Prefixos da consulta (ver frases_fts)
+        codigo: Código da linha
+        descricao_norm: Descrição normalizada da linha
+        linhas_indice: Quantidade de linhas do índice
+        media_palavras: Média de palavras por linha do índice
+        acertos: Prefixo -> quantidade de linhas do índice que o contêm
+
+    Returns:
+        Pontuação negativa, como a do FTS5 (menor é mais relevante)
+    """
+    colunas = (_palavras(codigo), (descricao_norm or '').split())
+    tamanho = sum(len(palavras) for palavras in colunas)
+    pontuacao = 0.0
+    for frase in frases:
+        frequencia = sum(
+            peso * sum(palavra.startswith(frase) for palavra in palavras)
+            for peso, palavras in zip(PESOS_BM25[1:], colunas)
+        )
+        idf = math.log((linhas_indice - acertos[frase] + 0.5) / (acertos[frase] + 0.5))
+        if idf <= 0:
+            idf = 1e-6
+        pontuacao += idf * (frequencia * (BM25_K1 + 1)) / (
+            frequencia + BM25_K1 * (1 - BM25_B + BM25_B * tamanho / media_palavras))
+    return -pontuacao
+
+
+def trigramas(palavra):
+    """Trigramas (sequências de 3 letras) de uma palavra"""
+    return {palavra[i:i + 3] for i in range(len(palavra) - 2)}
+
+
+class IndiceTrigramas:
+    """
+    Índice de trigramas em memória para a pesquisa enquanto se digita
+
+    Cada entrada é uma linha de resultado, (codigo, descricao, unidade, preco,
+    data_referencia), e é indexada pelos trigramas das palavras do código e
+    da descrição normalizada. A pesquisa cruza as listas de entradas dos
+    trigramas digitados, começando pelas menores, e confere as poucas
+    candidatas que sobram; nada é consultado no banco.
+    """
+
+    # Abaixo desta quantidade de candidatas, os demais trigramas não são cruzados
+    CANDIDATAS_CONFERIDAS = 256
+
+    # Acima desta quantidade de candidatas, não há ordenação por relevância
+    CANDIDATAS_ORDENADAS = 5000
+
+    def __init__(self, entradas):
+        """
+        Monta o índice
+
+        Args:
+            entradas: Linhas de resultado, de preferência já em ordem de
+                      descrição (é a ordem dos resultados sem relevância)
+        """
+        self.entradas = list(entradas)
+        self.textos = []
+        listas = {}
+        for posicao, (codigo, descricao, *_) in enumerate(self.entradas):
+            texto = f"{str(codigo).strip().casefold()} {normalizar_texto(descricao)}"
+            self.textos.append(texto)
+            for trigrama in {t for palavra in texto.split() for t in trigramas(palavra)}:
+                listas.setdefault(trigrama, []).append(posicao)
+
+        # Listas compactas: as posições de cada trigrama ficam em um array de inteiros
+        self.listas = {trigrama: array('I', posicoes) for trigrama, posicoes in listas.items()}
+
+    def __len__(self):
+        return len(self.entradas)
+
+    def pesquisar(self, termo, limite=50, prazo=None):
+        """
+        Pesquisa as entradas que contêm todas as palavras do termo
+
+        Palavras com 3 letras ou mais podem aparecer em qualquer ponto do
+        texto; as mais curtas (ou a sua forma por extenso, se forem uma
+        abreviação), só no início de uma palavra. Os resultados vêm
+        ordenados pelo código digitado por inteiro, depois pelas palavras
+        encontradas no início e por fim pelas descrições mais curtas.
+
+        Args:
+            termo: Texto digitado
+            limite: Quantidade máxima de resultados
+            prazo: Instante (time.perf_counter) em que a pesquisa deve parar,
+                   devolvendo o que já encontrou (None: sem prazo)
+
+        Returns:
+            Lista de entradas
+        """
+        # As descrições indexadas têm as abreviações por extenso, e "diam"
+        # ou "galv" já são o início da forma por extenso
+        palavras = _palavras(termo)
+        if not palavras:
+            return []
+
+        # Cruza as listas dos trigramas, das menores para as maiores
+        listas = sorted(
+            (self.listas.get(trigrama, ()) for palavra in palavras for trigrama in trigramas(palavra)),
+            key=len
+        )
+        if listas:
+            candidatas = set(listas[0])
+            for lista in listas[1:]:
+                if len(candidatas) <= self.CANDIDATAS_CONFERIDAS:
+                    break
+                candidatas.intersection_update(lista)
+            candidatas = sorted(candidatas)
+        else:
+            candidatas = range(len(self.entradas))
+
+        longas = [palavra for palavra in palavras if len(palavra) >= 3]
+        curtas = [(' ' + palavra, ' ' + ABREVIACOES.get(palavra, palavra)) for palavra in palavras if len(palavra) < 3]
+        ordenar = len(candidatas) <= self.CANDIDATAS_ORDENADAS
+        codigo = str(termo).strip().casefold()
+
+        encontradas = []
+        for n, posicao in enumerate(candidatas):
+            if prazo is not None and n % 512 == 0 and time.perf_counter() > prazo:
+                break
+            texto = ' ' + self.textos[posicao]
+            if (all(palavra in texto for palavra in longas)
+                    and all(palavra in texto or extenso in texto for palavra, extenso in curtas)):
+                encontradas.append(posicao)
+                if not ordenar and len(encontradas) >= limite:
+                    break
+
+        if ordenar:
+            def relevancia(posicao):
+                texto = ' ' + self.textos[posicao]
+                return (
+                    not texto.startswith(f' {codigo} '),
+                    sum(f' {palavra}' not in texto for palavra in longas),
+                    len(texto),
+                )
+            encontradas = heapq.nsmallest(limite, encontradas, key=relevancia)
+
+        return [self.entradas[posicao] for posicao in encontradas[:limite]]
+
+
+def corresponde(termo, codigo, descricao_norm):
+    """
+    Indica se uma linha atende a um termo como na consulta FTS5 (ver consulta_fts)
+
+    Cada palavra do termo tem de ser o início de uma palavra do código ou da
+    descrição normalizada (ou, se for uma abreviação, a forma por extenso).
+    """
+    palavras = _palavras(codigo) + (descricao_norm or '').split()
+    return all(
+        any(p.startswith(procurada) or p.startswith(ABREVIACOES.get(procurada, procurada)) for p in palavras)
+        for procurada in _palavras(termo)
+    )
+
+
+class CachePesquisa:
+    """
+    Cache LRU dos resultados da pesquisa no banco
+
+    As entradas são identificadas por (tipo, base, termo). Cada uma guarda as
+    linhas encontradas e se elas são todas as que atendem ao termo; nesse
+    caso, um termo que apenas continua o guardado ('conc' -> 'concr') é
+    respondido filtrando essas linhas, sem voltar ao banco. As entradas
+    valem para uma geração dos dados: quando ela muda (uma importação), o
+    cache inteiro é descartado.
+
+    A ordem das linhas depende do termo (relevância bm25), então as linhas
+    filtradas passam por `ordenar(termo, linhas)` antes de serem devolvidas;
+    sem essa função, só as pesquisas repetidas são respondidas pelo cache.
+    """
+
+    def __init__(self, tamanho=TAMANHO_CACHE_PESQUISA, ordenar=None):
+        self.tamanho = tamanho
+        self.ordenar = ordenar
+        self.geracao = None
+        self.entradas = OrderedDict()  # (tipo, base, termo) -> (linhas, completo)
+
+    def _chave_termo(self, termo):
+        """Termo como entra na chave (sem espaços nas pontas e sem distinção de maiúsculas)"""
+        return str(termo).strip().casefold()
+
+    def obter(self, geracao, tipo, base, termo, limite):
+        """
+        Obtém as linhas de uma pesquisa, se o cache puder respondê-la
+
+        Returns:
+            Lista de linhas (com a descrição normalizada na última coluna)
+            ou None se for preciso consultar o banco
+        """
+        if geracao != self.geracao:
+            self.entradas.clear()
+            self.geracao = geracao
+            return None
+
+        chave_termo = self._chave_termo(termo)
+        chave = (tipo, base, chave_termo)
+        if chave in self.entradas:
+            linhas, completo = self.entradas[chave]
+            if completo or len(linhas) >= limite:
+                self.entradas.move_to_end(chave)
+                return linhas
+            return None
+
+        if self.ordenar is None:
+            return None
+
+        # O termo guardado mais longo do qual o novo é continuação
+        anteriores = [
+            chave_anterior for chave_anterior, (_, completo) in self.entradas.items()
+            if completo and chave_anterior[:2] == (tipo, base) and chave_termo.startswith(chave_anterior[2])
+        ]
+        if not anteriores:
+            return None
+        anterior = max(anteriores, key=lambda c: len(c[2]))
+        self.entradas.move_to_end(anterior)
+
+        linhas = [linha for linha in self.entradas[anterior][0] if corresponde(termo, linha[0], linha[-1])]
+        linhas = self.ordenar(termo, linhas)
+        # O código digitado por inteiro vem primeiro, como na consulta ao banco
+        linhas.sort(key=lambda linha: linha[0] != termo.strip())
+        self.guardar(geracao, tipo, base, termo, linhas, True)
+        return linhas
+
+    def guardar(self, geracao, tipo, base, termo, linhas, completo):
+        """Guarda as linhas de uma pesquisa, descartando as menos usadas recentemente"""
+        if geracao != self.geracao:
+            self.entradas.clear()
+            self.geracao = geracao
+
+        chave = (tipo, base, self._chave_termo(termo))
+        self.entradas[chave] = (linhas, completo)
+        self.entradas.move_to_end(chave)
+        while len(self.entradas) > self.tamanho:
+            self.entradas.popitem(last=False)
+
+
+def palavra_corrigivel(palavra):
+    """Indica se uma palavra entra no vocabulário de correção (só letras, sem códigos e medidas)"""
+    return len(palavra) >= MINIMO_CORRECAO and palavra.isalpha()
+
+
+def contar_palavras(descricoes):
+    """Quantas descrições normalizadas têm cada palavra do vocabulário de correção"""
+    return Counter(
+        palavra for descricao in descricoes
+        for palavra in set((descricao or '').split()) if palavra_corrigivel(palavra)
+    )
+
+
+def distancia_tolerada(palavra):
+    """Maior distância de edição aceita na correção de uma palavra (1 para palavras curtas)"""
+    return 1 if len(palavra) < 6 else DISTANCIA_CORRECAO
+
+
+def delecoes(palavra):
+    """
+    Deleções de uma palavra para o índice de correção (estilo SymSpell)
+
+    São as variações do início da palavra (PREFIXO_DELECOES letras) com até
+    DISTANCIA_CORRECAO letras a menos, incluindo o próprio início. Duas
+    palavras a até essa distância de edição têm sempre uma deleção em comum,
+    de modo que as candidatas a correção de uma palavra digitada saem de uma
+    consulta pelas suas deleções, sem percorrer o vocabulário.
+    """
+    resultado = {palavra[:PREFIXO_DELECOES]}
+    fronteira = resultado
+    for _ in range(DISTANCIA_CORRECAO):
+        fronteira = {p[:i] + p[i + 1:] for p in fronteira for i in range(len(p))}
+        resultado |= fronteira
+    return resultado
+
+
+def distancia_edicao(a, b, maximo=DISTANCIA_CORRECAO):
+    """
+    Distância de edição entre duas palavras (inclusões, remoções, trocas e
+    transposições de letras vizinhas)
+
+    Para assim que a distância passa do máximo, devolvendo maximo + 1.
+    """
+    if abs(len(a) - len(b)) > maximo:
+        return maximo + 1
+
+    anterior2 = None
+    anterior = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        atual = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            atual[j] = min(
+                anterior[j] + 1,
+                atual[j - 1] + 1,
+                anterior[j - 1] + (ca != cb),
+            )
+            if anterior2 is not None and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                atual[j] = min(atual[j], anterior2[j - 2] + 1)
+        if min(atual) > maximo:
+            return maximo + 1
+        anterior2, anterior = anterior, atual
+    return min(anterior[-1], maximo + 1)
+
+
+def melhor_correcao(palavra, candidatas):
+    """
+    Escolhe a correção de uma palavra entre palavras do vocabulário
+
+    Args:
+        palavra: Palavra digitada (normalizada)
+        candidatas: Pares (palavra do vocabulário, frequência)
+
+    Returns:
+        A candidata mais próxima (a mais frequente, no empate) ou None se
+        nenhuma estiver dentro da distância tolerada
+    """
+    maximo = distancia_tolerada(palavra)
+    melhor = None
+    for candidata, frequencia in candidatas:
+        distancia = distancia_edicao(palavra, candidata, maximo)
+        if distancia <= maximo and (melhor is None or (distancia, -frequencia) < melhor[0]):
+            melhor = ((distancia, -frequencia), candidata)
+    return melhor[1] if melhor else None
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Cache de planilhas SINAPI já processadas para o OrçaFácil
+Guarda em disco as tabelas normalizadas extraídas de cada planilha, de modo
+que importar de novo o mesmo arquivo não precise abrir o Excel
+"""
+
+import os
+import time
+import pickle
+import hashlib
+
+# Diretório padrão do cache (compartilhado entre bancos de dados)
+DIRETORIO_CACHE = os.path.join(os.path.expanduser('~'), '.orcafacil', 'cache')
+
+# Limites para a limpeza automática
+TAMANHO_MAXIMO_CACHE = 500 * 1024 * 1024  # 500 MB
+IDADE_MAXIMA_CACHE = 90 * 24 * 60 * 60  # 90 dias
+
+# Muda sempre que o formato das tabelas guardadas mudar
+VERSAO_CACHE = 1
+
+EXTENSAO = '.pkl'
+
+
+class CachePlanilhas:
+    """
+    Cache em disco das tabelas normalizadas das planilhas SINAPI
+
+    Cada entrada é um arquivo com uma sequência de lotes serializados com
+    pickle, identificado pelo SHA-256 do arquivo de origem combinado com o
+    mapeamento de colunas usado na leitura.
+    """
+
+    def __init__(self, diretorio=DIRETORIO_CACHE, tamanho_maximo=TAMANHO_MAXIMO_CACHE,
+                 idade_maxima=IDADE_MAXIMA_CACHE):
+        """Inicializa o cache, criando o diretório se necessário"""
+        self.diretorio = diretorio
+        self.tamanho_maximo = tamanho_maximo
+        self.idade_maxima = idade_maxima
+        os.makedirs(self.diretorio, exist_ok=True)
+
+    def chave(self, arquivo, *partes):
+        """
+        Calcula a chave de uma entrada
+
+        Args:
+            arquivo: Caminho do arquivo de origem ou o seu conteúdo (bytes);
+                     o conteúdo entra no hash
+            partes: Demais dados que influenciam a leitura (aba, mapeamento...)
+        """
+        sha = hashlib.sha256()
+        if isinstance(arquivo, bytes):
+            sha.update(arquivo)
+        else:
+            with open(arquivo, 'rb') as f:
+                for bloco in iter(lambda: f.read(1024 * 1024), b''):
+                    sha.update(bloco)
+
+        sha.update(repr((VERSAO_CACHE,) + partes).encode('utf-8'))
+        return sha.hexdigest()
+
+    def _caminho(self, chave):
+        """Caminho do arquivo de uma entrada"""
+        return os.path.join(self.diretorio, chave + EXTENSAO)
+
+    def contem(self, chave):
+        """Indica se a entrada existe"""
+        return os.path.exists(self._caminho(chave))
+
+    def ler(self, chave):
+        """Gera os lotes guardados em uma entrada"""
+        caminho = self._caminho(chave)
+
+        # Marca a entrada como usada recentemente
+        os.utime(caminho)
+
+        with open(caminho, 'rb') as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    return
+
+    def obter(self, chave, gerar, aplicar_limites=True):
+        """
+        Gera os lotes de uma entrada, processando a planilha apenas se necessário
+
+        Em caso de falta, os lotes produzidos por `gerar()` são repassados ao
+        chamador e gravados ao mesmo tempo; a entrada só passa a existir quando
+        a leitura termina sem erros.
+        """
+        if self.contem(chave):
+            print("♻️ Usando dados já processados do cache")
+            yield from self.ler(chave)
+            return
+
+        caminho = self._caminho(chave)
+        temporario = f"{caminho}.{os.getpid()}.tmp"
+        concluido = False
+        try:
+            with open(temporario, 'wb') as f:
+                for lote in gerar():
+                    pickle.dump(lote, f, protocol=pickle.HIGHEST_PROTOCOL)
+                    yield lote
+            os.replace(temporario, caminho)
+            concluido = True
+        finally:
+            if not concluido and os.path.exists(temporario):
+                os.remove(temporario)
+
+        if aplicar_limites:
+            self.aplicar_limites()
+
+    def _entradas(self):
+        """Lista (caminho, tamanho, última utilização) das entradas, das mais antigas para as mais novas"""
+        entradas = []
+        for nome in os.listdir(self.diretorio):
+            if not nome.endswith(EXTENSAO):
+                continue
+            caminho = os.path.join(self.diretorio, nome)
+            try:
+                info = os.stat(caminho)
+            except OSError:
+                continue
+            entradas.append((caminho, info.st_size, info.st_mtime))
+
+        return sorted(entradas, key=lambda e: e[2])
+
+    def tamanho_total(self):
+        """Tamanho ocupado pelo cache em bytes"""
+        return sum(tamanho for _, tamanho, _ in self._entradas())
+
+    def aplicar_limites(self):
+        """Remove as entradas vencidas e as menos usadas até respeitar o tamanho máximo"""
+        limite_idade = time.time() - self.idade_maxima
+        entradas = self._entradas()
+        total = sum(tamanho for _, tamanho, _ in entradas)
+
+        removidas = 0
+        for caminho, tamanho, usado_em in entradas:
+            if usado_em >= limite_idade and total <= self.tamanho_maximo:
+                continue
+            try:
+                os.remove(caminho)
+                total -= tamanho
+                removidas += 1
+            except OSError as e:
+                print(f"Erro ao remover entrada do cache {caminho}: {str(e)}")
+
+        return removidas
+
+    def limpar(self):
+        """Remove todas as entradas do cache e devolve quantas foram removidas"""
+        removidas = 0
+        for caminho, _, _ in self._entradas():
+            try:
+                os.remove(caminho)
+                removidas += 1
+            except OSError as e:
+                print(f"Erro ao remover entrada do cache {caminho}: {str(e)}")
+
+        return removidas
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Consultas canceláveis para o OrçaFácil
+As consultas longas rodam com um progress handler do SQLite, que a cada
+tantas instruções confere se a consulta ainda é a mais recente, atualiza a
+interface e informa o andamento; uma consulta mais nova ou o botão Cancelar
+interrompem a que estiver em andamento
+"""
+
+import time
+import sqlite3
+
+
+class ConsultaCancelada(Exception):
+    """A consulta foi interrompida por uma consulta mais nova ou pelo usuário"""
+
+
+class ConsultaOcupada(Exception):
+    """
+    A conexão já está executando uma consulta
+
+    Acontece quando uma nova consulta é pedida durante a atualização da
+    interface feita por outra; a anterior é cancelada e a nova deve ser
+    pedida de novo quando ela terminar.
+    """
+
+
+class ExecutorConsultas:
+    """Executa consultas canceláveis em uma conexão, uma de cada vez"""
+
+    # Instruções da máquina virtual do SQLite entre duas verificações
+    INSTRUCOES_VERIFICACAO = 1000
+
+    # Intervalo mínimo entre duas chamadas de ao_progredir (s)
+    INTERVALO_PROGRESSO = 0.05
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.atual = 0  # número da consulta mais recente; as anteriores são canceladas
+        self.ocupada = False
+
+    def executar(self, funcao, *args, ao_progredir=None, **kwargs):
+        """
+        Executa uma função que faz consultas na conexão, de modo cancelável
+
+        Args:
+            funcao: Função a executar (ex: um método de pesquisa do SinapiManager)
+            ao_progredir: Função chamada com os segundos decorridos, no máximo
+                          a cada INTERVALO_PROGRESSO, enquanto o SQLite trabalha
+                          (ex: atualizar a interface e mostrar o andamento)
+
+        Returns:
+            O retorno da função
+
+        Raises:
+            ConsultaCancelada: se a consulta foi cancelada antes de terminar
+            ConsultaOcupada: se outra consulta está em andamento (e foi cancelada)
+        """
+        if self.ocupada:
+            self.cancelar()
+            raise ConsultaOcupada("Outra consulta está em andamento")
+
+        self.atual += 1
+        numero = self.atual
+        inicio = time.perf_counter()
+        proximo_aviso = [inicio + self.INTERVALO_PROGRESSO]
+
+        def verificar():
+            # Um valor diferente de zero faz o SQLite interromper a consulta
+            if numero != self.atual:
+                return 1
+            if ao_progredir is not None:
+                agora = time.perf_counter()
+                if agora >= proximo_aviso[0]:
+                    proximo_aviso[0] = agora + self.INTERVALO_PROGRESSO
+                    ao_progredir(agora - inicio)
+            return int(numero != self.atual)
+
+        self.ocupada = True
+        self.conn.set_progress_handler(verificar, self.INSTRUCOES_VERIFICACAO)
+        try:
+            resultado = funcao(*args, **kwargs)
+        except sqlite3.OperationalError as e:
+            if numero != self.atual:
+                raise ConsultaCancelada("Consulta cancelada") from e
+            raise
+        finally:
+            self.conn.set_progress_handler(None, 0)
+            self.ocupada = False
+
+        # Cancelada depois da última consulta: o resultado já não interessa
+        if numero != self.atual:
+            raise ConsultaCancelada("Consulta cancelada")
+        return resultado
+
+    def cancelar(self):
+        """Cancela a consulta em andamento, se houver (pode ser chamado de outra thread)"""
+        self.atual += 1
+        if self.ocupada:
+            self.conn.interrupt()
@@ -0,0 +1,359 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Correspondência em lote de planilhas de quantitativos com o SINAPI
+Cada linha da planilha do cliente (descrição livre) é comparada com as
+descrições da base por um índice invertido de palavras: só as descrições
+que têm alguma palavra pouco comum em comum com a linha são pontuadas
+(blocagem), e as linhas são divididas entre vários processos
+"""
+
+import os
+import math
+from dataclasses import dataclass, field
+from typing import List, Optional
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+import pandas as pd
+
+from database.busca import normalizar_texto
+from database.planilhas import (
+    PlanilhaInvalida,
+    abrir_planilha,
+    converter_valor,
+    iterar_colunas,
+    localizar_cabecalho,
+    mapear_colunas,
+    texto_celula,
+)
+
+# Quantidade de candidatos guardados para cada linha
+TOP_CANDIDATOS = 5
+
+# Quantidade de linhas enviadas de cada vez a um processo
+LINHAS_POR_TAREFA = 500
+
+# Palavras presentes em mais desta fração das descrições pontuam, mas não
+# trazem candidatos (sem isso, "tubo" traria centenas de descrições por linha)
+FRACAO_BLOCAGEM = 0.02
+
+# Multiplicador da pontuação quando a unidade da linha é a do candidato
+BONUS_UNIDADE = 1.15
+
+# Palavras que não ajudam a distinguir as descrições
+PALAVRAS_VAZIAS = {
+    'a', 'o', 'as', 'os', 'e', 'ou', 'de', 'da', 'do', 'das', 'dos', 'em', 'na', 'no',
+    'nas', 'nos', 'para', 'com', 'sem', 'por', 'ate', 'um', 'uma', 'ao', 'aos',
+}
+
+# Nomes internos -> possíveis títulos de coluna da planilha do cliente
+MAPEAMENTO_CLIENTE = {
+    'descricao': ['DESCRICAO', 'DISCRIMINACAO', 'ESPECIFICACAO', 'SERVICO'],
+    'unidade': ['UNIDADE', 'UND', 'UN'],
+    'quantidade': ['QUANTIDADE', 'QTDE', 'QTD', 'QUANT'],
+}
+
+# Textos que identificam a linha de cabeçalho da planilha do cliente
+MARCADORES_CLIENTE = ['DESCRICAO', 'DISCRIMINACAO', 'ESPECIFICACAO']
+
+
+@dataclass
+class LinhaCliente:
+    """Uma linha da planilha de quantitativos do cliente"""
+    numero: int  # linha na planilha (1-based)
+    descricao: str
+    unidade: str = ""
+    quantidade: float = 0.0
+
+
+@dataclass
+class Candidato:
+    """Um item SINAPI candidato a corresponder a uma linha"""
+    tipo: str  # 'insumo' ou 'composicao'
+    codigo: str
+    descricao: str
+    unidade: str
+    preco: float
+    pontuacao: float  # 0 a 1 (similaridade das palavras, com o bônus da unidade)
+
+
+@dataclass
+class Correspondencia:
+    """Os candidatos de uma linha e o escolhido na revisão"""
+    linha: LinhaCliente
+    candidatos: List[Candidato] = field(default_factory=list)
+    escolhido: Optional[int] = 0  # índice em candidatos; None: nenhum serve
+
+    @property
+    def escolha(self) -> Optional[Candidato]:
+        if self.escolhido is None or self.escolhido >= len(self.candidatos):
+            return None
+        return self.candidatos[self.escolhido]
+
+
+def palavras_descricao(descricao_norm):
+    """Palavras distintas de uma descrição normalizada, sem as palavras vazias"""
+    return {palavra for palavra in descricao_norm.split() if palavra not in PALAVRAS_VAZIAS}
+
+
+def unidade_normalizada(unidade):
+    """Unidade comparável entre o cliente e o SINAPI ("M²" e "m2" são a mesma)"""
+    return normalizar_texto(unidade).replace(' ', '')
+
+
+class IndiceCorrespondencia:
+    """
+    Índice invertido das descrições de uma base para a correspondência
+
+    Cada palavra tem o peso idf (palavras raras pesam mais) e a pontuação de
+    um candidato é o cosseno entre as palavras da linha e as da descrição.
+    As listas de cada palavra são arrays ordenados do NumPy, de modo que
+    conferir quais candidatos têm uma palavra é uma busca binária vetorizada.
+    """
+
+    def __init__(self, entradas):
+        """
+        Monta o índice
+
+        Args:
+            entradas: Linhas (tipo, codigo, descricao, unidade, preco, descricao_norm)
+        """
+        self.entradas = [tuple(entrada[:5]) for entrada in entradas]
+
+        # Unidades como números, para comparar todos os candidatos de uma vez
+        self.codigos_unidades = {}
+        self.unidades = np.array([
+            self.codigos_unidades.setdefault(unidade_normalizada(entrada[3]), len(self.codigos_unidades))
+            for entrada in self.entradas
+        ], dtype=np.int32)
+
+        listas = {}
+        palavras_entradas = []
+        for posicao, entrada in enumerate(entradas):
+            palavras = palavras_descricao(entrada[5] or '')
+            palavras_entradas.append(palavras)
+            for palavra in palavras:
+                listas.setdefault(palavra, []).append(posicao)
+
+        total = max(len(self.entradas), 1)
+        self.listas = {palavra: np.array(posicoes, dtype=np.int32) for palavra, posicoes in listas.items()}
+        self.pesos = {palavra: math.log(1 + total / len(posicoes)) for palavra, posicoes in listas.items()}
+        self.normas = np.array([
+            math.sqrt(sum(self.pesos[palavra] ** 2 for palavra in palavras)) or 1.0
+            for palavras in palavras_entradas
+        ])
+        self.limite_blocagem = max(1, int(total * FRACAO_BLOCAGEM))
+
+    def __len__(self):
+        return len(self.entradas)
+
+    def candidatos(self, linha, top=TOP_CANDIDATOS):
+        """
+        Pontua as descrições para uma linha do cliente
+
+        Returns:
+            Lista de Candidato, da maior para a menor pontuação
+        """
+        palavras = [p for p in palavras_descricao(normalizar_texto(linha.descricao)) if p in self.listas]
+        if not palavras:
+            return []
+
+        # Blocagem: os candidatos vêm só das palavras pouco comuns (ou, se
+        # todas forem comuns, da mais rara delas)
+        raras = [p for p in palavras if len(self.listas[p]) <= self.limite_blocagem]
+        if not raras:
+            raras = [min(palavras, key=lambda p: len(self.listas[p]))]
+        posicoes = np.unique(np.concatenate([self.listas[p] for p in raras]))
+
+        pontos = np.zeros(len(posicoes))
+        for palavra in palavras:
+            lista = self.listas[palavra]
+            indices = np.minimum(np.searchsorted(lista, posicoes), len(lista) - 1)
+            pontos += (lista[indices] == posicoes) * self.pesos[palavra] ** 2
+
+        norma_linha = math.sqrt(sum(self.pesos[p] ** 2 for p in palavras))
+        pontos /= norma_linha * self.normas[posicoes]
+
+        unidade = self.codigos_unidades.get(unidade_normalizada(linha.unidade))
+        if unidade is not None:
+            pontos[self.unidades[posicoes] == unidade] *= BONUS_UNIDADE
+
+        melhores = np.argsort(-pontos, kind='stable')[:top]
+        return [
+            Candidato(*self.entradas[posicoes[i]], pontuacao=round(min(float(pontos[i]), 1.0), 4))
+            for i in melhores
+        ]
+
+
+def ler_planilha_cliente(arquivo, aba=None):
+    """
+    Lê as linhas de uma planilha de quantitativos (XLSX ou CSV)
+
+    O cabeçalho é procurado nas primeiras linhas pela coluna de descrição;
+    unidade e quantidade são opcionais. Linhas sem descrição são ignoradas.
+
+    Raises:
+        PlanilhaInvalida: se não houver coluna de descrição
+    """
+    if os.path.splitext(arquivo)[1].lower() in ('.csv', '.txt'):
+        try:
+            df = pd.read_csv(arquivo, sep=None, engine='python', dtype=str, encoding='utf-8-sig')
+        except UnicodeDecodeError:
+            df = pd.read_csv(arquivo, sep=None, engine='python', dtype=str, encoding='latin-1')
+
+        colunas = mapear_colunas(list(df.columns), MAPEAMENTO_CLIENTE)
+        if 'descricao' not in colunas:
+            raise PlanilhaInvalida(f"Coluna de descrição não encontrada. Colunas: {list(df.columns)}")
+        # Linha 1 é o cabeçalho
+        valores = (
+            (numero, tuple(None if pd.isna(linha[i]) else linha[i] for i in colunas.values()))
+            for numero, linha in enumerate(df.itertuples(index=False, name=None), start=2)
+        )
+        return _linhas_cliente(valores, colunas)
+
+    wb = abrir_planilha(arquivo)
+    try:
+        ws = wb[aba] if aba else wb.worksheets[0]
+        linha_cabecalho, cabecalhos = localizar_cabecalho(ws, MARCADORES_CLIENTE)
+        if linha_cabecalho is None:
+            raise PlanilhaInvalida(f"Cabeçalho com a coluna de descrição não encontrado na aba '{ws.title}'")
+
+        colunas = mapear_colunas(cabecalhos, MAPEAMENTO_CLIENTE)
+        valores = enumerate(iterar_colunas(ws, linha_cabecalho, colunas), start=linha_cabecalho + 1)
+        return _linhas_cliente(valores, colunas)
+    finally:
+        wb.close()
+
+
+def converter_quantidade(valor, decimal_virgula=True):
+    """
+    Converte a quantidade de uma linha do cliente
+
+    Com decimal_virgula=False (nenhuma quantidade da planilha tem vírgula),
+    um texto com um único ponto ("2.5") é decimal, e não milhar.
+    """
+    if not decimal_virgula and isinstance(valor, str) and valor.count('.') == 1:
+        return converter_valor(valor, separador_milhar=False)
+    return converter_valor(valor)
+
+
+def _linhas_cliente(valores, colunas):
+    """
+    Monta as LinhaCliente a partir de (número, valores na ordem de colunas)
+
+    A convenção decimal das quantidades em texto vem da própria coluna: se
+    alguma tem vírgula, a vírgula é o decimal e o ponto separa milhares.
+    """
+    nomes = list(colunas)
+    valores = list(valores)
+    quantidades = [dict(zip(nomes, linha)).get('quantidade') for _, linha in valores]
+    decimal_virgula = any(isinstance(valor, str) and ',' in valor for valor in quantidades)
+
+    linhas = []
+    for numero, linha in valores:
+        dados = dict(zip(nomes, linha))
+        descricao = texto_celula(dados['descricao'])
+        if not descricao:
+            continue
+        linhas.append(LinhaCliente(
+            numero=numero,
+            descricao=descricao,
+            unidade=texto_celula(dados.get('unidade')),
+            quantidade=converter_quantidade(dados.get('quantidade'), decimal_virgula),
+        ))
+    return linhas
+
+
+# Índice de cada processo da pontuação, montado uma vez na criação do processo
+_indice_processo = None
+
+
+def _iniciar_processo(entradas):
+    """Monta o índice no processo (executado em outro processo)"""
+    global _indice_processo
+    _indice_processo = IndiceCorrespondencia(entradas)
+
+
+def _pontuar_linhas(linhas, top):
+    """Candidatos de um bloco de linhas (executado em outro processo)"""
+    return [_indice_processo.candidatos(linha, top) for linha in linhas]
+
+
+def corresponder(entradas, linhas, top=TOP_CANDIDATOS, max_processos=None, ao_aguardar=None):
+    """
+    Encontra os candidatos de cada linha do cliente
+
+    As linhas são divididas em blocos de LINHAS_POR_TAREFA pontuados em
+    processos separados, cada um com o seu índice; poucas linhas são
+    pontuadas aqui mesmo.
+
+    Args:
+        entradas: Linhas (tipo, codigo, descricao, unidade, preco, descricao_norm) da base
+        linhas: Lista de LinhaCliente
+        top: Quantidade de candidatos por linha
+        max_processos: Número máximo de processos (padrão: um por bloco, até o nº de CPUs)
+        ao_aguardar: Função chamada periodicamente enquanto espera (ex: atualizar a interface)
+
+    Returns:
+        Lista de Correspondencia, na ordem das linhas
+    """
+    blocos = [linhas[i:i + LINHAS_POR_TAREFA] for i in range(0, len(linhas), LINHAS_POR_TAREFA)]
+    max_processos = max_processos or min(len(blocos), os.cpu_count() or 1)
+
+    if max_processos <= 1:
+        indice = IndiceCorrespondencia(entradas)
+        return [Correspondencia(linha, indice.candidatos(linha, top)) for linha in linhas]
+
+    resultados = {}
+    with ProcessPoolExecutor(max_workers=max_processos, initializer=_iniciar_processo,
+                             initargs=(list(entradas),)) as executor:
+        futuros = {executor.submit(_pontuar_linhas, bloco, top): n for n, bloco in enumerate(blocos)}
+        pendentes = set(futuros)
+        while pendentes:
+            prontos, pendentes = wait(pendentes, timeout=0.1, return_when=FIRST_COMPLETED)
+            if ao_aguardar:
+                ao_aguardar()
+            for futuro in prontos:
+                resultados[futuros[futuro]] = futuro.result()
+
+    return [
+        Correspondencia(linha, candidatos)
+        for n, bloco in enumerate(blocos)
+        for linha, candidatos in zip(bloco, resultados[n])
+    ]
+
+
+def exportar_correspondencias(correspondencias, arquivo):
+    """
+    Grava os candidatos de cada linha em XLSX ou CSV
+
+    Uma linha por candidato, com a sua posição e pontuação; a coluna
+    'escolhido' marca o candidato escolhido na revisão.
+    """
+    registros = []
+    for correspondencia in correspondencias:
+        linha = correspondencia.linha
+        for posicao, candidato in enumerate(correspondencia.candidatos):
+            registros.append({
+                'linha': linha.numero,
+                'descricao_cliente': linha.descricao,
+                'unidade_cliente': linha.unidade,
+                'quantidade': linha.quantidade,
+                'posicao': posicao + 1,
+                'tipo': candidato.tipo,
+                'codigo': candidato.codigo,
+                'descricao_sinapi': candidato.descricao,
+                'unidade_sinapi': candidato.unidade,
+                'preco': candidato.preco,
+                'pontuacao': candidato.pontuacao,
+                'escolhido': 'X' if posicao == correspondencia.escolhido else '',
+            })
+
+    df = pd.DataFrame(registros)
+    if os.path.splitext(arquivo)[1].lower() == '.csv':
+        df.to_csv(arquivo, index=False, sep=';', decimal=',', encoding='utf-8-sig')
+    else:
+        df.to_excel(arquivo, index=False)
+    return len(registros)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Curva ABC do orçamento para o OrçaFácil
+Ordena os itens (serviços do orçamento ou insumos desdobrados) pelo total,
+acumula os percentuais e classifica em A, B e C, tudo em arrays NumPy
+"""
+
+import numpy as np
+
+from models.projeto import CurvaABC
+
+# Percentuais acumulados que fecham as classes A e B (o restante é C)
+LIMITES_ABC = (80.0, 95.0)
+
+CLASSES_ABC = np.array(['A', 'B', 'C'])
+
+
+def validar_limites(limites):
+    """
+    Confere os limites das classes A e B
+
+    Raises:
+        ValueError: se não for 0 < A < B <= 100
+    """
+    limite_a, limite_b = limites
+    if not 0 < limite_a < limite_b <= 100:
+        raise ValueError("Os limites devem ser 0 < A < B <= 100 (percentual acumulado)")
+    return float(limite_a), float(limite_b)
+
+
+def classificar(quantidades, precos, limites=LIMITES_ABC):
+    """
+    Calcula a curva ABC de arrays de quantidades e preços
+
+    Um item é da classe A se o acumulado antes dele ainda não atingiu o
+    limite A (de modo que o item que cruza o limite ainda é A), e assim por
+    diante; itens de total igual mantêm a ordem original.
+
+    Args:
+        quantidades: Array de quantidades
+        precos: Array de preços unitários
+        limites: (limite A, limite B) em percentual acumulado
+
+    Returns:
+        Tupla (ordem, totais, participações %, acumulados %, classes), com
+        os quatro últimos arrays já na ordem da curva
+    """
+    limites = np.array(validar_limites(limites))
+    totais = np.asarray(quantidades, dtype=np.float64) * np.asarray(precos, dtype=np.float64)
+    ordem = np.argsort(-totais, kind='stable')
+    totais = totais[ordem]
+
+    soma = totais.sum()
+    participacoes = totais / soma * 100 if soma else np.zeros_like(totais)
+    acumulados = np.cumsum(participacoes)
+    anteriores = acumulados - participacoes
+    classes = CLASSES_ABC[np.searchsorted(limites, anteriores, side='right')]
+    return ordem, totais, participacoes, acumulados, classes
+
+
+def curva_abc(linhas, limites=LIMITES_ABC):
+    """
+    Monta a curva ABC de linhas de relatório
+
+    Args:
+        linhas: Sequência de (tipo, codigo, descricao, unidade, quantidade, preco, ...)
+        limites: (limite A, limite B) em percentual acumulado
+
+    Returns:
+        CurvaABC
+    """
+    linhas = list(linhas)
+    quantidades = np.fromiter((linha[4] or 0 for linha in linhas), dtype=np.float64, count=len(linhas))
+    precos = np.fromiter((linha[5] or 0 for linha in linhas), dtype=np.float64, count=len(linhas))
+    ordem, totais, participacoes, acumulados, classes = classificar(quantidades, precos, limites)
+
+    quantidades, precos = quantidades.tolist(), precos.tolist()
+    curva = [
+        tuple(linhas[i][:4]) + (quantidades[i], precos[i], total, participacao, acumulado, classe)
+        for i, total, participacao, acumulado, classe in zip(
+            ordem.tolist(), totais.tolist(), participacoes.tolist(), acumulados.tolist(), classes.tolist())
+    ]
+    return CurvaABC(limites=validar_limites(limites), linhas=curva, total=float(totais.sum()))
@@ -0,0 +1,377 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Cálculo do custo das composições a partir dos preços dos insumos
+As composições de uma base formam um grafo de dependência (uma composição
+usa insumos e outras composições), guardado em arrays NumPy no formato CSR:
+os itens de cada composição ficam contíguos, e o custo de todas as
+composições de um mesmo nível da ordem topológica é calculado de uma vez.
+O mesmo grafo desdobra orçamentos em insumos e avalia cenários de preços
+"""
+
+import operator
+from functools import reduce
+from itertools import combinations
+
+import numpy as np
+
+
+class CicloComposicoes(Exception):
+    """Composições que usam umas às outras em ciclo (o custo não pode ser calculado)"""
+
+    def __init__(self, codigos):
+        self.codigos = list(codigos)
+        exemplo = ", ".join(self.codigos[:10]) + (" ..." if len(self.codigos) > 10 else "")
+        super().__init__(f"{len(self.codigos)} composições formam ciclos: {exemplo}")
+
+
+def _posicoes(codigos, procurados):
+    """
+    Posição de cada código procurado em codigos (-1 se não estiver)
+
+    Um código repetido em codigos é encontrado na primeira ocorrência.
+    """
+    if len(codigos) == 0:
+        return np.full(len(procurados), -1, dtype=np.int64)
+
+    ordem = np.argsort(codigos, kind='stable')
+    ordenados = codigos[ordem]
+    posicoes = np.searchsorted(ordenados, procurados)
+    posicoes[posicoes == len(ordenados)] = 0
+    encontrados = ordenados[posicoes] == procurados
+    return np.where(encontrados, ordem[posicoes], -1)
+
+
+def _intervalos(inicios, fins):
+    """Concatena os intervalos [inicio, fim) em um único array de posições"""
+    tamanhos = fins - inicios
+    total = int(tamanhos.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    deslocamentos = np.cumsum(tamanhos) - tamanhos
+    return np.repeat(inicios - deslocamentos, tamanhos) + np.arange(total)
+
+
+def combinacoes(cenarios):
+    """Cenários com cada combinação de dois ou mais dos cenários dados (ex: aço + mão de obra)"""
+    return [
+        reduce(operator.add, grupo)
+        for quantidade in range(2, len(cenarios) + 1)
+        for grupo in combinations(cenarios, quantidade)
+    ]
+
+
+class GrafoComposicoes:
+    """
+    Grafo de dependência das composições de uma base
+
+    Os vértices são os insumos (posições 0 a n_insumos - 1) seguidos das
+    composições. As arestas de cada composição, ordenadas por nível, ficam
+    em filhos (vértice do item) e coeficientes; como no SQL de
+    obter_itens_composicao, um código que é insumo e composição é tratado
+    como insumo. Composições sem itens mantêm o custo da planilha.
+
+    valores guarda o preço de cada vértice como está no banco (precos_insumos
+    e custos são partes dele) e é mantido em dia por propagar.
+    """
+
+    def __init__(self, composicoes, insumos, itens):
+        """
+        Args:
+            composicoes: Sequência de (codigo, custo_total da planilha)
+            insumos: Sequência de (codigo, preco_mediano)
+            itens: Sequência de (codigo_composicao, codigo_item, coeficiente)
+
+        Raises:
+            CicloComposicoes: se alguma composição depende de si mesma
+        """
+        self.codigos_composicoes, custos = self._colunas(composicoes)
+        self.codigos_insumos, precos = self._colunas(insumos)
+        self.n_insumos = len(self.codigos_insumos)
+        self.n_composicoes = len(self.codigos_composicoes)
+        self.valores = np.concatenate([precos, custos])
+        self.precos_insumos = self.valores[:self.n_insumos]
+        self.custos = self.valores[self.n_insumos:]
+        self._posicao_composicao = None
+        self._posicao_insumo = None
+        self._usos_inicio = None  # CSR inverso (vértice -> composições que o usam), montado sob demanda
+        self._usos = None
+
+        # Arestas: composição (posição entre as composições) -> vértice do item
+        codigos_pais, codigos_itens, coeficientes = self._colunas_itens(itens)
+        pais = _posicoes(self.codigos_composicoes, codigos_pais)
+        filhos = _posicoes(self.codigos_insumos, codigos_itens)
+        sub = _posicoes(self.codigos_composicoes, codigos_itens)
+        filhos = np.where(filhos >= 0, filhos, np.where(sub >= 0, sub + self.n_insumos, -1))
+
+        # Itens de composições ou com códigos que não existem na base não entram
+        validas = (pais >= 0) & (filhos >= 0)
+        self.itens_ausentes = int(np.count_nonzero(pais >= 0) - np.count_nonzero(validas))
+        pais, filhos, coeficientes = pais[validas], filhos[validas], coeficientes[validas]
+
+        self.niveis = self._ordenar_niveis(pais, filhos)
+
+        # CSR com as linhas (composições) na ordem dos níveis: os itens da
+        # composição c são filhos[inicio[c]:fim[c]] e cada nível é uma fatia
+        # contígua das arestas
+        ordem = np.lexsort((pais, self.niveis[pais]))
+        self.pais = pais[ordem].astype(np.int32)
+        self.filhos = filhos[ordem].astype(np.int32)
+        self.coeficientes = coeficientes[ordem]
+
+        novas = np.flatnonzero(np.diff(self.pais, prepend=-1) != 0)
+        self.inicio = np.zeros(self.n_composicoes, dtype=np.int64)
+        self.fim = np.zeros(self.n_composicoes, dtype=np.int64)
+        self.inicio[self.pais[novas]] = novas
+        self.fim[self.pais[novas]] = np.append(novas[1:], len(self.pais))
+
+        # Para cada nível: fatia das arestas, composições e início de cada uma na fatia
+        self._niveis = []
+        limites = np.searchsorted(self.niveis[self.pais], np.arange(self.niveis.max(initial=0) + 2))
+        for a, b in zip(limites[:-1], limites[1:]):
+            if b > a:
+                linhas = novas[(novas >= a) & (novas < b)]
+                self._niveis.append((slice(a, b), self.pais[linhas], linhas - a))
+
+    @staticmethod
+    def _colunas(linhas):
+        """Separa (codigo, valor) em um array de códigos e um de valores (None vira 0)"""
+        linhas = list(linhas)
+        codigos = np.array([str(codigo) for codigo, _ in linhas], dtype=str)
+        valores = np.array([valor or 0.0 for _, valor in linhas], dtype=np.float64)
+        return codigos, valores
+
+    @staticmethod
+    def _colunas_itens(itens):
+        """Separa os itens em arrays de composição, item e coeficiente (None vira 0)"""
+        itens = list(itens)
+        pais = np.array([str(item[0]) for item in itens], dtype=str)
+        filhos = np.array([str(item[1]) for item in itens], dtype=str)
+        coeficientes = np.array([item[2] or 0.0 for item in itens], dtype=np.float64)
+        return pais, filhos, coeficientes
+
+    def _ordenar_niveis(self, pais, filhos):
+        """
+        Nível de cada composição na ordem topológica (algoritmo de Kahn)
+
+        Nível 0: composição só com insumos (ou sem itens); nível k: usa alguma
+        composição de nível k - 1. Cada rodada resolve um nível inteiro.
+
+        Raises:
+            CicloComposicoes: com as composições dos ciclos (e as que ligam
+                              um ciclo a outro)
+        """
+        sub = filhos >= self.n_insumos
+        pais_sub, filhos_sub = pais[sub], filhos[sub] - self.n_insumos
+        pendentes = np.bincount(pais_sub, minlength=self.n_composicoes)
+        niveis = np.full(self.n_composicoes, -1, dtype=np.int64)
+
+        fronteira = pendentes == 0
+        nivel = 0
+        while fronteira.any():
+            niveis[fronteira] = nivel
+            # Cada composição da fronteira deixa de ser pendente para quem a usa
+            pendentes -= np.bincount(pais_sub[fronteira[filhos_sub]], minlength=self.n_composicoes)
+            fronteira = (pendentes == 0) & (niveis < 0)
+            nivel += 1
+
+        if (niveis < 0).any():
+            raise CicloComposicoes(self.codigos_composicoes[self._em_ciclo(niveis < 0, pais_sub, filhos_sub)].tolist())
+        return niveis
+
+    def _em_ciclo(self, restantes, pais_sub, filhos_sub):
+        """Das composições não ordenadas, descarta as que só dependem de um ciclo"""
+        restantes = restantes.copy()
+        while True:
+            # Uma composição que nenhuma restante usa não está em ciclo
+            usadas = np.zeros(self.n_composicoes, dtype=bool)
+            usadas[filhos_sub[restantes[pais_sub] & restantes[filhos_sub]]] = True
+            if not (restantes & ~usadas).any():
+                return np.flatnonzero(restantes)
+            restantes &= usadas
+
+    def calcular(self, precos_insumos=None):
+        """
+        Calcula o custo de todas as composições, nível por nível
+
+        Args:
+            precos_insumos: Array com o preço de cada insumo, na ordem de
+                            codigos_insumos (None: os preços da base)
+
+        Returns:
+            Array com o custo de cada composição, na ordem de codigos_composicoes
+        """
+        valores = self.valores.copy()
+        if precos_insumos is not None:
+            valores[:self.n_insumos] = precos_insumos
+
+        # Composições de um nível só usam itens de níveis anteriores
+        for fatia, composicoes, inicios in self._niveis:
+            parcelas = self.coeficientes[fatia] * valores[self.filhos[fatia]]
+            valores[self.n_insumos + composicoes] = np.add.reduceat(parcelas, inicios)
+
+        return valores[self.n_insumos:].copy()
+
+    def dependentes(self, vertices):
+        """
+        Composições que usam algum dos vértices, direta ou indiretamente
+
+        Percorre só as arestas do subgrafo afetado (pelo CSR inverso).
+
+        Args:
+            vertices: Array de vértices (insumos: posição; composições: n_insumos + posição)
+
+        Returns:
+            Array com as posições das composições, sem repetição
+        """
+        if self._usos is None:
+            ordem = np.argsort(self.filhos, kind='stable')
+            self._usos = self.pais[ordem]
+            self._usos_inicio = np.searchsorted(self.filhos[ordem], np.arange(self.n_insumos + self.n_composicoes + 1))
+
+        encontradas = []
+        marcadas = np.zeros(self.n_composicoes, dtype=bool)
+        fronteira = np.asarray(vertices, dtype=np.int64)
+        while len(fronteira):
+            pais = np.unique(self._usos[_intervalos(self._usos_inicio[fronteira], self._usos_inicio[fronteira + 1])])
+            pais = pais[~marcadas[pais]]
+            marcadas[pais] = True
+            encontradas.append(pais)
+            fronteira = pais.astype(np.int64) + self.n_insumos
+
+        return np.concatenate(encontradas) if encontradas else np.zeros(0, dtype=np.int64)
+
+    def descendentes(self, composicoes):
+        """
+        Composições usadas pelas dadas, direta ou indiretamente, incluindo elas mesmas
+
+        Args:
+            composicoes: Array com as posições das composições
+
+        Returns:
+            Array com as posições, sem repetição
+        """
+        marcadas = np.zeros(self.n_composicoes, dtype=bool)
+        fronteira = np.unique(np.asarray(composicoes, dtype=np.int64))
+        while len(fronteira):
+            marcadas[fronteira] = True
+            filhos = self.filhos[_intervalos(self.inicio[fronteira], self.fim[fronteira])].astype(np.int64)
+            filhos = np.unique(filhos[filhos >= self.n_insumos] - self.n_insumos)
+            fronteira = filhos[~marcadas[filhos]]
+        return np.flatnonzero(marcadas)
+
+    def propagar(self, insumos, precos):
+        """
+        Altera o preço de insumos e recalcula só as composições que dependem deles
+
+        O trabalho é proporcional ao subgrafo afetado: as composições são
+        recalculadas nível por nível, só com as suas arestas. Cada custo
+        recebe apenas a variação causada pelos novos preços (coeficiente x
+        variação do item), de modo que o custo publicado na planilha, com os
+        seus arredondamentos e itens que não estão na base, é mantido; com
+        custos que já batem com os itens, o resultado é o mesmo de calcular.
+
+        Args:
+            insumos: Array com as posições dos insumos alterados
+            precos: Array com os novos preços
+
+        Returns:
+            Tupla (posições das composições recalculadas, custos anteriores)
+        """
+        insumos = np.asarray(insumos, dtype=np.int64)
+        variacoes = np.zeros(len(self.valores))
+        variacoes[insumos] = np.asarray(precos, dtype=np.float64) - self.precos_insumos[insumos]
+        self.precos_insumos[insumos] = precos
+
+        afetadas = self.dependentes(insumos)
+        anteriores = self.custos[afetadas].copy()
+
+        # Em ordem de nível: cada nível usa as variações já calculadas dos anteriores
+        afetadas_por_nivel = afetadas[np.argsort(self.niveis[afetadas], kind='stable')]
+        niveis = self.niveis[afetadas_por_nivel]
+        limites = np.flatnonzero(np.diff(niveis, prepend=-1, append=-1) != 0)
+        for a, b in zip(limites[:-1], limites[1:]):
+            composicoes = afetadas_por_nivel[a:b]
+            arestas = _intervalos(self.inicio[composicoes], self.fim[composicoes])
+            parcelas = self.coeficientes[arestas] * variacoes[self.filhos[arestas]]
+            tamanhos = self.fim[composicoes] - self.inicio[composicoes]
+            variacao = np.add.reduceat(parcelas, np.cumsum(tamanhos) - tamanhos)
+            variacoes[self.n_insumos + composicoes] = variacao
+            self.custos[composicoes] += variacao
+
+        return afetadas, anteriores
+
+    def explodir(self, demanda):
+        """
+        Desdobra quantidades de composições nas quantidades dos seus itens
+
+        Os níveis são percorridos de cima para baixo: quando um nível é
+        desdobrado, as composições dele já receberam toda a quantidade das
+        que as usam.
+
+        Args:
+            demanda: Array (vértices) ou (vértices x colunas) com a quantidade
+                     de cada vértice (ex: uma coluna por projeto)
+
+        Returns:
+            Array do mesmo formato, com quantidade só nos insumos e nas
+            composições sem itens
+        """
+        quantidades = np.array(demanda, dtype=np.float64)
+        formato = (-1,) + (1,) * (quantidades.ndim - 1)
+        for fatia, composicoes, _ in reversed(self._niveis):
+            origem = quantidades[self.n_insumos + self.pais[fatia]]
+            np.add.at(quantidades, self.filhos[fatia], self.coeficientes[fatia].reshape(formato) * origem)
+            quantidades[self.n_insumos + composicoes] = 0
+        return quantidades
+
+    def avaliar(self, demanda, multiplicadores):
+        """
+        Custo de demandas em vários cenários de preço de uma vez
+
+        As demandas são desdobradas em insumos uma única vez; cada cenário é
+        uma coluna de multiplicadores, e os custos de todos saem de um
+        produto de matrizes. Composições sem itens entram com o custo gravado.
+
+        Args:
+            demanda: Array (vértices x colunas) com as quantidades
+            multiplicadores: Array (n_insumos x cenários) com o fator do preço
+                             de cada insumo em cada cenário
+
+        Returns:
+            Array (colunas x cenários) com os custos
+        """
+        explodida = self.explodir(demanda)
+        insumos = explodida[:self.n_insumos] * self.precos_insumos[:, None]
+        fixos = explodida[self.n_insumos:].T @ self.custos
+        return insumos.T @ multiplicadores + fixos[:, None]
+
+    def vertices(self, tipos, codigos):
+        """
+        Vértice de cada item de orçamento
+
+        Args:
+            tipos: Sequência de 'insumo' ou 'composicao'
+            codigos: Sequência de códigos
+
+        Returns:
+            Array com o vértice de cada item (-1 se não estiver na base)
+        """
+        codigos = np.array([str(codigo) for codigo in codigos], dtype=str)
+        insumos = _posicoes(self.codigos_insumos, codigos)
+        composicoes = _posicoes(self.codigos_composicoes, codigos)
+        composicoes = np.where(composicoes >= 0, composicoes + self.n_insumos, -1)
+        return np.where(np.asarray(tipos) == 'insumo', insumos, composicoes)
+
+    def posicao_composicao(self, codigo):
+        """Posição de uma composição nos arrays (None se não estiver na base)"""
+        if self._posicao_composicao is None:
+            self._posicao_composicao = {c: i for i, c in enumerate(self.codigos_composicoes.tolist())}
+        return self._posicao_composicao.get(str(codigo))
+
+    def posicao_insumo(self, codigo):
+        """Posição de um insumo nos arrays (None se não estiver na base)"""
+        if self._posicao_insumo is None:
+            self._posicao_insumo = {c: i for i, c in enumerate(self.codigos_insumos.tolist())}
+        return self._posicao_insumo.get(str(codigo))
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Acesso às planilhas SINAPI para o OrçaFácil
+As planilhas podem vir soltas (.xlsx) ou dentro do ZIP oficial de cada UF;
+em ambos os casos o conteúdo é lido uma única vez para a memória, sem
+extrair nem copiar arquivos para o disco
+"""
+
+import os
+import re
+import zipfile
+
+from database.planilhas import PlanilhaInvalida, normalizar_cabecalho
+from models.projeto import BaseSinapi
+
+# Extensões das planilhas procuradas dentro do ZIP
+EXTENSOES_PLANILHA = ('.xlsx', '.xlsm')
+
+# Regimes de desoneração publicados pelo SINAPI
+REGIME_DESONERADO = 'desonerado'
+REGIME_NAO_DESONERADO = 'nao_desonerado'
+
+REGIMES = {
+    REGIME_DESONERADO: "Desonerado",
+    REGIME_NAO_DESONERADO: "Não desonerado",
+}
+
+# Unidades da federação (o SINAPI publica uma base por UF)
+UFS = (
+    'AC', 'AL', 'AM', 'AP', 'BA', 'CE', 'DF', 'ES', 'GO', 'MA', 'MG', 'MS', 'MT', 'PA',
+    'PB', 'PE', 'PI', 'PR', 'RJ', 'RN', 'RO', 'RR', 'RS', 'SC', 'SE', 'SP', 'TO',
+)
+
+
+def eh_zip(arquivo):
+    """Indica se o arquivo é um pacote ZIP do SINAPI (e não uma planilha)"""
+    return str(arquivo).lower().endswith('.zip')
+
+
+def _nome_normalizado(nome):
+    """Nome do arquivo em maiúsculas, sem acentos e só com letras e números"""
+    return re.sub(r'[^A-Z0-9]', '', normalizar_cabecalho(os.path.basename(nome)))
+
+
+def tipos_da_planilha(nome):
+    """
+    Deduz pelo nome do arquivo quais tipos de dados a planilha contém
+
+    Returns:
+        Lista com 'insumos' e/ou 'composicoes' (ambos se o nome não indicar)
+    """
+    nome = _nome_normalizado(nome)
+    if 'FAMILIA' in nome:
+        # Relatório de famílias de insumos, não é uma tabela de preços
+        return []
+    if 'INSUMO' in nome:
+        return ['insumos']
+    if 'COMPOSIC' in nome:
+        return ['composicoes']
+    return ['insumos', 'composicoes']
+
+
+def regime_da_planilha(nome):
+    """Deduz pelo nome do arquivo o regime de desoneração (ou None se não indicar)"""
+    nome = _nome_normalizado(nome)
+    if 'NAODESONERADO' in nome or 'SEMDESONERACAO' in nome:
+        return REGIME_NAO_DESONERADO
+    if 'DESONERADO' in nome:
+        return REGIME_DESONERADO
+    return None
+
+
+def base_da_planilha(*nomes):
+    """
+    Deduz pelos nomes dos arquivos a UF, o regime e o mês de referência
+
+    Os nomes são consultados em ordem (ex: o membro do ZIP e depois o
+    próprio ZIP); o primeiro que indicar cada informação prevalece.
+    Ex: SINAPI_Preco_Ref_Insumos_AM_202412_Desonerado.xlsx -> AM 2024-12 desonerado
+    """
+    uf = regime = data_referencia = None
+    for nome in nomes:
+        if not nome:
+            continue
+        texto = normalizar_cabecalho(os.path.basename(nome))
+        partes = re.split(r'[^A-Z0-9]+', texto)
+
+        uf = uf or next((parte for parte in partes if parte in UFS), None)
+        regime = regime or regime_da_planilha(nome)
+        if data_referencia is None:
+            mes = re.search(r'(?<!\d)(20\d{2})[_-]?(0[1-9]|1[0-2])(?!\d)', texto)
+            if mes:
+                data_referencia = f"{mes.group(1)}-{mes.group(2)}"
+
+    return BaseSinapi(uf, regime, data_referencia)
+
+
+def listar_membros(arquivo):
+    """Lista as planilhas contidas em um ZIP"""
+    with zipfile.ZipFile(arquivo) as pacote:
+        return [
+            info.filename for info in pacote.infolist()
+            if not info.is_dir() and info.filename.lower().endswith(EXTENSOES_PLANILHA)
+        ]
+
+
+def selecionar_membro(membros, tipo, regime=REGIME_DESONERADO):
+    """
+    Escolhe, pelo nome, a planilha de um tipo e regime dentre as de um ZIP
+
+    Para composições, a planilha analítica (que traz os itens) tem
+    preferência sobre a sintética.
+
+    Returns:
+        Nome do membro ou None se nenhum corresponder
+    """
+    candidatos = [
+        membro for membro in membros
+        if tipo in tipos_da_planilha(membro) and regime_da_planilha(membro) in (regime, None)
+    ]
+    if not candidatos:
+        return None
+
+    # Nomes explícitos (tipo e regime no nome) antes dos genéricos
+    def prioridade(membro):
+        nome = _nome_normalizado(membro)
+        return (
+            regime_da_planilha(membro) is None,
+            len(tipos_da_planilha(membro)) > 1,
+            'SINTETICO' in nome,
+            nome,
+        )
+
+    return min(candidatos, key=prioridade)
+
+
+def localizar_planilha(arquivo, tipo, regime=REGIME_DESONERADO):
+    """
+    Localiza a planilha de um tipo em um arquivo
+
+    Returns:
+        Nome do membro do ZIP, ou None se o arquivo já é a própria planilha
+
+    Raises:
+        PlanilhaInvalida: se o ZIP não contém uma planilha do tipo e regime
+    """
+    if not eh_zip(arquivo):
+        return None
+
+    membro = selecionar_membro(listar_membros(arquivo), tipo, regime)
+    if membro is None:
+        raise PlanilhaInvalida(
+            f"O pacote {os.path.basename(arquivo)} não contém planilha de {tipo} "
+            f"({REGIMES.get(regime, regime)})"
+        )
+    return membro
+
+
+def ler_conteudo(arquivo, membro=None):
+    """
+    Lê o conteúdo de uma planilha em uma única leitura sequencial
+
+    Args:
+        arquivo: Caminho da planilha ou do ZIP
+        membro: Nome da planilha dentro do ZIP (None para planilhas soltas)
+
+    Returns:
+        Bytes da planilha, que podem ser passados diretamente aos leitores
+    """
+    if membro is None:
+        with open(arquivo, 'rb') as f:
+            return f.read()
+
+    with zipfile.ZipFile(arquivo) as pacote:
+        return pacote.read(membro)
+
+
+def nome_fonte(arquivo, membro=None):
+    """Nome da planilha para exibição nas mensagens"""
+    return os.path.basename(membro or arquivo)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Importação de várias planilhas SINAPI em paralelo para o OrçaFácil
+O processamento das planilhas (a parte pesada) roda em processos separados,
+que deixam as tabelas normalizadas no cache; a gravação no SQLite continua
+sendo feita por um único escritor
+"""
+
+from dataclasses import dataclass
+from typing import Optional
+
+from database.cache import CachePlanilhas
+from database.layouts import VERSAO_LAYOUTS, RegistroLayouts
+from database.fontes import (
+    REGIME_DESONERADO,
+    eh_zip,
+    listar_membros,
+    selecionar_membro,
+    tipos_da_planilha,
+    ler_conteudo,
+    nome_fonte,
+)
+from database.planilhas import (
+    MAPEAMENTO_INSUMOS,
+    MAPEAMENTO_COMPOSICOES,
+    DTYPES_INSUMOS,
+    FORMATO_LOTES_COMPOSICOES,
+    abrir_planilha,
+    localizar_aba,
+    ler_aba_insumos,
+    ler_aba_composicoes,
+)
+
+# Leitor de cada tipo de aba e os dados que identificam a leitura no cache
+LEITORES = {
+    'insumos': (ler_aba_insumos, (MAPEAMENTO_INSUMOS, DTYPES_INSUMOS, VERSAO_LAYOUTS)),
+    'composicoes': (ler_aba_composicoes, (MAPEAMENTO_COMPOSICOES, VERSAO_LAYOUTS, FORMATO_LOTES_COMPOSICOES)),
+}
+
+
+@dataclass
+class TarefaImportacao:
+    """Uma planilha a importar"""
+    tipo: str  # 'insumos' ou 'composicoes'
+    arquivo: str
+    mes_ref: Optional[str] = None
+    aba: Optional[str] = None  # None: descoberta pelo nome ou cabeçalho
+    membro: Optional[str] = None  # planilha dentro do ZIP, se for o caso
+    uf: Optional[str] = None  # None: deduzida pelo nome do arquivo
+    regime: Optional[str] = None  # None: deduzido pelo nome do arquivo
+
+    @property
+    def nome(self):
+        """Nome da planilha para exibição"""
+        return nome_fonte(self.arquivo, self.membro)
+
+
+def chave_planilha(cache, tipo, conteudo, aba=None):
+    """Chave do cache para a leitura de um tipo de dado de uma planilha (caminho ou bytes)"""
+    return cache.chave(conteudo, tipo, aba, *LEITORES[tipo][1])
+
+
+def tipos_do_arquivo(arquivo):
+    """Deduz pelo nome do arquivo quais tipos de dados ele contém"""
+    if eh_zip(arquivo):
+        return [
+            tipo for tipo in LEITORES
+            if any(tipo in tipos_da_planilha(membro) for membro in listar_membros(arquivo))
+        ]
+    return tipos_da_planilha(arquivo) or list(LEITORES)
+
+
+def tarefas_do_arquivo(arquivo, tipos, mes_ref=None, regime=None, uf=None):
+    """
+    Monta as tarefas de importação de um arquivo
+
+    Para um ZIP, escolhe pelo nome a planilha de cada tipo no regime
+    informado (desonerado, se não informado); tipos sem planilha
+    correspondente ficam de fora.
+    """
+    if not eh_zip(arquivo):
+        return [
+            TarefaImportacao(tipo, arquivo, mes_ref, uf=uf, regime=regime)
+            for tipo in tipos_do_arquivo(arquivo) if tipo in tipos
+        ]
+
+    membros = listar_membros(arquivo)
+    tarefas = []
+    for tipo in tipos:
+        membro = selecionar_membro(membros, tipo, regime or REGIME_DESONERADO)
+        if membro is not None:
+            tarefas.append(TarefaImportacao(tipo, arquivo, mes_ref, membro=membro, uf=uf, regime=regime))
+    return tarefas
+
+
+def preparar_planilha(arquivo, membro, abas, diretorio_cache):
+    """
+    Processa as abas de uma planilha e deixa o resultado no cache (executado em outro processo)
+
+    A planilha (solta ou dentro do ZIP) é lida uma única vez para a memória e
+    aberta uma única vez; o mesmo conteúdo serve para o hash do cache e para
+    a leitura de todas as abas.
+
+    Args:
+        arquivo: Caminho da planilha ou do ZIP
+        membro: Nome da planilha dentro do ZIP (None para planilhas soltas)
+        abas: Dicionário tipo -> nome da aba (None para descobrir a aba)
+        diretorio_cache: Diretório do cache compartilhado com o escritor
+
+    Returns:
+        Dicionário tipo -> chave da entrada do cache; um tipo que não pôde
+        ser lido fica com a exceção correspondente no lugar da chave
+    """
+    cache = CachePlanilhas(diretorio_cache)
+    conteudo = ler_conteudo(arquivo, membro)
+    chaves = {tipo: chave_planilha(cache, tipo, conteudo, aba) for tipo, aba in abas.items()}
+
+    # Tudo já processado: nem abre a planilha
+    faltantes = [tipo for tipo, chave in chaves.items() if not cache.contem(chave)]
+    if not faltantes:
+        return chaves
+
+    resultados = dict(chaves)
+    layouts = RegistroLayouts(diretorio_cache)
+    wb = abrir_planilha(conteudo)
+    try:
+        for tipo in faltantes:
+            leitor = LEITORES[tipo][0]
+            try:
+                ws = localizar_aba(wb, tipo, abas[tipo])
+                # Os limites do cache são aplicados pelo escritor, ao final
+                for _ in cache.obter(chaves[tipo], lambda: leitor(ws, layouts=layouts), aplicar_limites=False):
+                    pass
+            except Exception as e:
+                resultados[tipo] = e
+    finally:
+        wb.close()
+
+    return resultados
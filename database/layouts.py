@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Registro de layouts das planilhas SINAPI para o OrçaFácil
+Cada geração de planilha do SINAPI tem um cabeçalho fixo; a impressão digital
+desse cabeçalho leva direto ao mapa de colunas já conhecido, e a detecção
+aproximada das colunas só é usada para layouts novos
+"""
+
+import os
+import json
+import hashlib
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Tuple
+
+from database.planilhas import (
+    MAPEAMENTO_INSUMOS,
+    MAPEAMENTO_COMPOSICOES,
+    DTYPES_INSUMOS,
+    celula_vazia,
+    normalizar_cabecalho,
+    mapear_colunas,
+)
+
+# Muda sempre que os layouts embutidos mudarem (entra na chave do cache)
+VERSAO_LAYOUTS = 2
+
+# Arquivo com os layouts confirmados em importações anteriores
+ARQUIVO_LAYOUTS = 'layouts.json'
+
+MAPEAMENTOS = {
+    'insumos': MAPEAMENTO_INSUMOS,
+    'composicoes': MAPEAMENTO_COMPOSICOES,
+}
+
+DTYPES = {
+    'insumos': DTYPES_INSUMOS,
+    'composicoes': {},
+}
+
+
+def titulos_cabecalho(cabecalhos):
+    """Títulos normalizados da linha de cabeçalho, sem as colunas vazias do final"""
+    titulos = [normalizar_cabecalho(col) if not celula_vazia(col) else '' for col in cabecalhos]
+    while titulos and not titulos[-1]:
+        titulos.pop()
+    return tuple(titulos)
+
+
+def impressao_cabecalho(tipo, titulos):
+    """Impressão digital de um cabeçalho (tipo + títulos normalizados, em ordem)"""
+    return hashlib.sha1(repr((tipo, tuple(titulos))).encode('utf-8')).hexdigest()[:16]
+
+
+@dataclass
+class LayoutPlanilha:
+    """Um formato conhecido de planilha SINAPI e o seu mapa de colunas"""
+    nome: str
+    tipo: str  # 'insumos' ou 'composicoes'
+    cabecalho: Tuple[str, ...]
+    colunas: Dict[str, int]  # nome interno -> índice da coluna (0-based)
+    dtypes: Dict[str, object] = field(default_factory=dict)
+    # False se alguma coluna foi detectada só de forma aproximada (não é registrado)
+    exato: bool = True
+
+    @property
+    def impressao(self) -> str:
+        return impressao_cabecalho(self.tipo, self.cabecalho)
+
+    @classmethod
+    def por_titulos(cls, nome, tipo, cabecalho, colunas):
+        """Cria um layout indicando as colunas pelo título (primeira ocorrência)"""
+        cabecalho = titulos_cabecalho(cabecalho)
+        return cls(
+            nome=nome,
+            tipo=tipo,
+            cabecalho=cabecalho,
+            colunas={interno: cabecalho.index(normalizar_cabecalho(titulo)) for interno, titulo in colunas.items()},
+            dtypes=DTYPES[tipo],
+        )
+
+
+# Layouts das gerações de planilhas publicadas pela Caixa
+LAYOUTS_CONHECIDOS = [
+    LayoutPlanilha.por_titulos(
+        "SINAPI Preço de Insumos (2017+)",
+        'insumos',
+        ['CODIGO', 'DESCRICAO DO INSUMO', 'UNIDADE DE MEDIDA', 'ORIGEM DO PRECO', 'PRECO MEDIANO R$'],
+        {
+            'codigo': 'CODIGO',
+            'descricao': 'DESCRICAO DO INSUMO',
+            'unidade': 'UNIDADE DE MEDIDA',
+            'preco': 'PRECO MEDIANO R$',
+        },
+    ),
+    LayoutPlanilha.por_titulos(
+        "SINAPI Custo de Composições Sintético (2017+)",
+        'composicoes',
+        ['DESCRICAO DA CLASSE', 'SIGLA DA CLASSE', 'DESCRICAO DO TIPO 1', 'SIGLA DO TIPO 1',
+         'CODIGO DO AGRUPADOR', 'DESCRICAO DO AGRUPADOR', 'CODIGO DA COMPOSICAO',
+         'DESCRICAO DA COMPOSICAO', 'UNIDADE', 'ORIGEM DE PRECO', 'CUSTO TOTAL', 'VINCULO'],
+        {
+            'codigo_composicao': 'CODIGO DA COMPOSICAO',
+            'descricao_composicao': 'DESCRICAO DA COMPOSICAO',
+            'unidade_composicao': 'UNIDADE',
+            'custo_total': 'CUSTO TOTAL',
+        },
+    ),
+    LayoutPlanilha.por_titulos(
+        "SINAPI Custo de Composições Analítico (2017+)",
+        'composicoes',
+        ['DESCRICAO DA CLASSE', 'SIGLA DA CLASSE', 'DESCRICAO DO TIPO 1', 'SIGLA DO TIPO 1',
+         'CODIGO DO AGRUPADOR', 'DESCRICAO DO AGRUPADOR', 'CODIGO DA COMPOSICAO',
+         'DESCRICAO DA COMPOSICAO', 'UNIDADE', 'ORIGEM DE PRECO', 'CUSTO TOTAL', 'TIPO ITEM',
+         'CODIGO ITEM', 'DESCRICAO ITEM', 'UNIDADE ITEM', 'ORIGEM DE PRECO ITEM', 'COEFICIENTE',
+         'PRECO UNITARIO', 'CUSTO TOTAL ITEM', 'CUSTO MAO DE OBRA', '%MAO DE OBRA', 'CUSTO MATERIAL',
+         '%MATERIAL', 'CUSTO EQUIPAMENTO', '%EQUIPAMENTO', 'CUSTO SERVICOS TERCEIROS',
+         '%SERVICOS TERCEIROS', 'CUSTOS OUTROS', '%OUTROS', 'VINCULO'],
+        {
+            'codigo_composicao': 'CODIGO DA COMPOSICAO',
+            'descricao_composicao': 'DESCRICAO DA COMPOSICAO',
+            'unidade_composicao': 'UNIDADE',
+            'custo_total': 'CUSTO TOTAL',
+            'codigo_item': 'CODIGO ITEM',
+            'coeficiente': 'COEFICIENTE',
+        },
+    ),
+]
+
+
+def colunas_exatas(titulos, colunas, mapeamento):
+    """Indica se todas as colunas encontradas casaram com um título exato do mapeamento"""
+    return all(
+        titulos[indice] in {normalizar_cabecalho(possivel) for possivel in mapeamento[interno]}
+        for interno, indice in colunas.items()
+    )
+
+
+class RegistroLayouts:
+    """
+    Registro dos layouts conhecidos, consultado pela impressão do cabeçalho
+
+    Além dos layouts embutidos, carrega os que foram detectados e confirmados
+    em importações anteriores (guardados em JSON no diretório informado).
+    """
+
+    def __init__(self, diretorio=None):
+        """Carrega os layouts embutidos e os já confirmados"""
+        self.arquivo = os.path.join(diretorio, ARQUIVO_LAYOUTS) if diretorio else None
+        self.layouts = {layout.impressao: layout for layout in LAYOUTS_CONHECIDOS}
+        for layout in self._carregar_confirmados():
+            self.layouts.setdefault(layout.impressao, layout)
+
+    def _carregar_confirmados(self):
+        """Lê os layouts confirmados do arquivo (lista vazia se não existir ou estiver corrompido)"""
+        if not self.arquivo or not os.path.exists(self.arquivo):
+            return []
+        try:
+            with open(self.arquivo, encoding='utf-8') as f:
+                return [
+                    LayoutPlanilha(
+                        nome=dados['nome'],
+                        tipo=dados['tipo'],
+                        cabecalho=tuple(dados['cabecalho']),
+                        colunas=dados['colunas'],
+                        dtypes=DTYPES[dados['tipo']],
+                    )
+                    for dados in json.load(f)
+                ]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ Ignorando layouts salvos em {self.arquivo}: {str(e)}")
+            return []
+
+    def identificar(self, tipo, cabecalhos):
+        """
+        Obtém o mapa de colunas de uma linha de cabeçalho
+
+        Returns:
+            Tupla (layout, conhecido). Se o cabeçalho não é de um layout
+            conhecido, as colunas são detectadas de forma aproximada e o
+            layout devolvido ainda precisa ser confirmado.
+        """
+        titulos = titulos_cabecalho(cabecalhos)
+        layout = self.layouts.get(impressao_cabecalho(tipo, titulos))
+        if layout is not None:
+            print(f"Layout reconhecido: {layout.nome}")
+            return layout, True
+
+        print("Layout desconhecido; detectando as colunas pelos títulos")
+        colunas = mapear_colunas(cabecalhos, MAPEAMENTOS[tipo])
+        layout = LayoutPlanilha(
+            nome=f"Detectado em {datetime.now().strftime('%Y-%m-%d')}",
+            tipo=tipo,
+            cabecalho=titulos,
+            colunas=colunas,
+            dtypes=DTYPES[tipo],
+            exato=colunas_exatas(titulos, colunas, MAPEAMENTOS[tipo]),
+        )
+        return layout, False
+
+    def confirmar(self, layout):
+        """
+        Registra um layout detectado depois de uma leitura bem-sucedida
+
+        Só layouts em que todas as colunas foram encontradas pelo título exato
+        são registrados; um mapa aproximado (ex: 'UN' contido em outro
+        título) continua passando pela detecção a cada importação.
+        """
+        if layout.impressao in self.layouts:
+            return
+        if not layout.exato:
+            titulos = {interno: layout.cabecalho[indice] for interno, indice in layout.colunas.items()}
+            print(f"⚠️ Colunas detectadas de forma aproximada; layout não registrado: {titulos}")
+            return
+        self.layouts[layout.impressao] = layout
+        if not self.arquivo:
+            return
+
+        # Relê o arquivo: outro processo pode ter confirmado layouts nesse meio tempo
+        confirmados = {l.impressao: l for l in self._carregar_confirmados()}
+        confirmados[layout.impressao] = layout
+
+        temporario = f"{self.arquivo}.{os.getpid()}.tmp"
+        try:
+            with open(temporario, 'w', encoding='utf-8') as f:
+                json.dump([
+                    {'nome': l.nome, 'tipo': l.tipo, 'cabecalho': list(l.cabecalho), 'colunas': l.colunas}
+                    for l in confirmados.values()
+                ], f, ensure_ascii=False, indent=2)
+            os.replace(temporario, self.arquivo)
+            print(f"Novo layout registrado: {layout.nome}")
+        except OSError as e:
+            print(f"⚠️ Não foi possível salvar o layout: {str(e)}")
+            if os.path.exists(temporario):
+                os.remove(temporario)
@@ -0,0 +1,411 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Leitura das planilhas SINAPI para o OrçaFácil
+Escolhe as abas pelos metadados da pasta de trabalho, localiza o cabeçalho
+lendo apenas as primeiras linhas e depois lê somente as colunas que serão
+de fato utilizadas
+"""
+
+import io
+import re
+import unicodedata
+import openpyxl
+import pandas as pd
+
+# Quantidade de linhas lidas na primeira passada para encontrar o cabeçalho
+LINHAS_CABECALHO = 50
+
+# Quantidade de linhas acumuladas em cada lote de composições
+TAMANHO_LOTE = 5000
+
+# Formato dos lotes de composições, que entra na chave do cache
+# (2: lotes de planilhas sem as colunas dos itens trazem itens None)
+FORMATO_LOTES_COMPOSICOES = 2
+
+# Textos que identificam a linha de cabeçalho de cada tipo de planilha
+MARCADORES_INSUMOS = ['CODIGO']
+MARCADORES_COMPOSICOES = ['CODIGO DA COMPOSICAO', 'CODIGO COMPOSICAO']
+
+# Nomes de aba (normalizados) de cada tipo de planilha, em ordem de preferência
+ABAS_CONHECIDAS = {
+    'insumos': ['INSUMOS', 'INSUMO'],
+    'composicoes': ['COMPOSICOES', 'COMPOSICAO', 'ANALITICO'],
+}
+
+# Nomes internos -> possíveis títulos de coluna, em ordem de preferência
+MAPEAMENTO_INSUMOS = {
+    'codigo': ['CODIGO', 'COD'],
+    'descricao': ['DESCRICAO DO INSUMO', 'DESCRICAO', 'DESCRI'],
+    'unidade': ['UNIDADE', 'UN'],
+    'preco': ['PRECO MEDIANO', 'PRECO'],
+}
+
+MAPEAMENTO_COMPOSICOES = {
+    'codigo_composicao': ['CODIGO DA COMPOSICAO', 'CODIGO COMPOSICAO', 'CODIGO', 'COD'],
+    'descricao_composicao': ['DESCRICAO DA COMPOSICAO', 'DESCRICAO COMPOSICAO', 'DESCRICAO'],
+    'unidade_composicao': ['UNIDADE'],
+    'custo_total': ['CUSTO TOTAL', 'VALOR TOTAL'],
+    'codigo_item': ['CODIGO ITEM', 'CODIGO DO ITEM', 'COD ITEM'],
+    'coeficiente': ['COEFICIENTE', 'COEF'],
+}
+
+# Tipos das colunas lidas na segunda passada. Preços ficam como 'object'
+# porque misturam números e textos formatados ("1.234,56")
+DTYPES_INSUMOS = {
+    'codigo': 'string',
+    'descricao': 'string',
+    'unidade': 'string',
+    'preco': object,
+}
+
+
+class PlanilhaInvalida(ValueError):
+    """A planilha não tem o cabeçalho ou as colunas esperadas"""
+
+
+def normalizar_cabecalho(valor):
+    """Normaliza um título de coluna: maiúsculas, sem acentos e espaços simples"""
+    texto = unicodedata.normalize('NFKD', str(valor).upper())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return re.sub(r'\s+', ' ', texto).strip()
+
+
+def celula_vazia(valor):
+    """Indica se uma célula lida pelo openpyxl deve ser tratada como vazia"""
+    return valor is None or (isinstance(valor, str) and valor == '')
+
+
+def texto_celula(valor):
+    """Converte o valor de uma célula em texto (números inteiros sem o '.0')"""
+    if celula_vazia(valor):
+        return ''
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    return str(valor).strip()
+
+
+def converter_valor(valor, separador_milhar=True):
+    """Converte um valor de célula (número ou texto como "R$ 1.234,56") para float"""
+    if celula_vazia(valor):
+        return 0.0
+    if isinstance(valor, str):
+        valor = valor.replace('R$', '')
+        if separador_milhar:
+            valor = valor.replace('.', '')
+        try:
+            return float(valor.replace(',', '.').strip())
+        except ValueError:
+            return 0.0
+    return float(valor)
+
+
+def converter_valores(serie, separador_milhar=True):
+    """
+    Converte uma coluna inteira para float de forma vetorizada
+
+    Aceita números ou textos formatados (ex: "R$ 1.234,56"); valores vazios
+    ou inválidos viram 0, como na conversão linha a linha original.
+    """
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.fillna(0).astype(float)
+
+    texto = serie.str.replace('R$', '', regex=False)
+    if separador_milhar:
+        texto = texto.str.replace('.', '', regex=False)
+    texto = texto.str.replace(',', '.', regex=False).str.strip()
+
+    # Textos convertidos; o que não era texto é convertido diretamente
+    convertidos = pd.to_numeric(texto, errors='coerce')
+    numericos = pd.to_numeric(serie.where(texto.isna()), errors='coerce')
+    return convertidos.fillna(numericos).fillna(0).astype(float)
+
+
+def abrir_planilha(arquivo):
+    """
+    Abre a pasta de trabalho em modo somente leitura (linhas lidas sob demanda)
+
+    Aceita o caminho do arquivo ou o seu conteúdo já lido (bytes).
+    """
+    if isinstance(arquivo, bytes):
+        arquivo = io.BytesIO(arquivo)
+    return openpyxl.load_workbook(arquivo, read_only=True, data_only=True)
+
+
+def localizar_cabecalho(ws, marcadores, max_linhas=LINHAS_CABECALHO):
+    """
+    Primeira passada: procura a linha de cabeçalho nas primeiras linhas da aba
+
+    Returns:
+        Tupla (número da linha, 1-based; valores do cabeçalho) ou (None, None)
+    """
+    for numero, linha in enumerate(ws.iter_rows(max_row=max_linhas, values_only=True), start=1):
+        texto = normalizar_cabecalho(' '.join(str(cell) for cell in linha if not celula_vazia(cell)))
+        if any(marcador in texto for marcador in marcadores):
+            return numero, linha
+
+    return None, None
+
+
+def tipo_do_cabecalho(cabecalhos):
+    """Deduz pelo cabeçalho se a aba é de insumos ou de composições (ou None)"""
+    texto = normalizar_cabecalho(' '.join(str(cell) for cell in cabecalhos if not celula_vazia(cell)))
+    if any(marcador in texto for marcador in MARCADORES_COMPOSICOES):
+        return 'composicoes'
+    if any(marcador in texto for marcador in MARCADORES_INSUMOS):
+        return 'insumos'
+    return None
+
+
+def localizar_aba(wb, tipo, aba=None):
+    """
+    Escolhe a aba de um tipo de dado sem diferenciar maiúsculas nem acentos
+
+    A lista de abas vem dos metadados da pasta de trabalho. Tenta, em ordem:
+    a aba informada, os nomes conhecidos do tipo (exatos e depois contidos no
+    nome da aba) e, por fim, a primeira aba cujo cabeçalho (primeiras linhas)
+    indica o tipo. Nenhuma tentativa lê a aba inteira.
+
+    Raises:
+        PlanilhaInvalida: se nenhuma aba corresponder
+    """
+    nomes = {normalizar_cabecalho(nome): nome for nome in wb.sheetnames}
+
+    if aba is not None:
+        if normalizar_cabecalho(aba) in nomes:
+            return wb[nomes[normalizar_cabecalho(aba)]]
+        print(f"⚠️ Aba '{aba}' não encontrada; procurando a aba de {tipo}")
+
+    for conhecido in ABAS_CONHECIDAS[tipo]:
+        if conhecido in nomes:
+            return wb[nomes[conhecido]]
+    for conhecido in ABAS_CONHECIDAS[tipo]:
+        for normalizado, nome in nomes.items():
+            if conhecido in normalizado:
+                return wb[nome]
+
+    # Último recurso: o cabeçalho de cada aba
+    for nome in wb.sheetnames:
+        ws = wb[nome]
+        _, cabecalhos = localizar_cabecalho(ws, MARCADORES_INSUMOS + MARCADORES_COMPOSICOES)
+        if cabecalhos is not None and tipo_do_cabecalho(cabecalhos) == tipo:
+            return ws
+
+    raise PlanilhaInvalida(f"Nenhuma aba de {tipo} encontrada. Abas da planilha: {wb.sheetnames}")
+
+
+def mapear_colunas(cabecalhos, mapeamento):
+    """
+    Resolve o mapeamento de nomes internos para índices de coluna (0-based)
+
+    Para cada candidato, uma coluna com o título exato tem prioridade sobre
+    uma coluna que apenas contém o texto. Nomes sem coluna ficam de fora.
+    """
+    titulos = [normalizar_cabecalho(col) if not celula_vazia(col) else '' for col in cabecalhos]
+
+    colunas = {}
+    for nome_interno, possiveis_nomes in mapeamento.items():
+        for possivel in possiveis_nomes:
+            possivel = normalizar_cabecalho(possivel)
+            indice = next((i for i, titulo in enumerate(titulos) if titulo == possivel), None)
+            if indice is None:
+                indice = next((i for i, titulo in enumerate(titulos) if possivel in titulo), None)
+            if indice is not None:
+                colunas[nome_interno] = indice
+                break
+
+    return colunas
+
+
+def iterar_colunas(ws, linha_cabecalho, colunas):
+    """
+    Segunda passada: percorre as linhas abaixo do cabeçalho
+
+    Lê apenas o intervalo de colunas que contém as colunas mapeadas e devolve,
+    para cada linha, uma tupla com os valores na ordem de `colunas` (células
+    vazias viram None).
+    """
+    indices = list(colunas.values())
+    primeira = min(indices)
+    deslocamentos = [indice - primeira for indice in indices]
+
+    for linha in ws.iter_rows(min_row=linha_cabecalho + 1, min_col=primeira + 1,
+                              max_col=max(indices) + 1, values_only=True):
+        yield tuple(
+            linha[d] if d < len(linha) and not celula_vazia(linha[d]) else None
+            for d in deslocamentos
+        )
+
+
+def ler_colunas(ws, linha_cabecalho, colunas, dtypes=None):
+    """Lê apenas as colunas mapeadas para um DataFrame com os tipos informados"""
+    dtypes = dtypes or {}
+    valores = list(zip(*iterar_colunas(ws, linha_cabecalho, colunas)))
+    if not valores:
+        valores = [()] * len(colunas)
+
+    return pd.DataFrame({
+        nome: pd.Series(list(vals), dtype=dtypes.get(nome, object))
+        for nome, vals in zip(colunas, valores)
+    })
+
+
+def ler_insumos(arquivo, aba=None, layouts=None):
+    """
+    Lê a aba de insumos e devolve a tabela já normalizada (ver ler_aba_insumos)
+
+    Sem aba informada, a aba de insumos é descoberta pelo nome ou cabeçalho.
+    """
+    wb = abrir_planilha(arquivo)
+    try:
+        yield from ler_aba_insumos(localizar_aba(wb, 'insumos', aba), layouts)
+    finally:
+        wb.close()
+
+
+def ler_composicoes(arquivo, aba=None, tamanho_lote=TAMANHO_LOTE, layouts=None):
+    """
+    Lê a aba de composições em modo streaming (ver ler_aba_composicoes)
+
+    Sem aba informada, a aba de composições é descoberta pelo nome ou cabeçalho.
+    """
+    wb = abrir_planilha(arquivo)
+    try:
+        yield from ler_aba_composicoes(localizar_aba(wb, 'composicoes', aba), tamanho_lote, layouts)
+    finally:
+        wb.close()
+
+
+def identificar_colunas(layouts, tipo, cabecalhos, mapeamento):
+    """
+    Obtém o mapa de colunas de um cabeçalho
+
+    Com um registro de layouts (database.layouts.RegistroLayouts), um
+    cabeçalho conhecido vai direto ao mapa registrado; sem registro, ou para
+    cabeçalhos desconhecidos, as colunas são detectadas pelos títulos.
+
+    Returns:
+        Tupla (colunas, layout ou None, layout conhecido?)
+    """
+    if layouts is None:
+        return mapear_colunas(cabecalhos, mapeamento), None, False
+
+    layout, conhecido = layouts.identificar(tipo, cabecalhos)
+    return layout.colunas, layout, conhecido
+
+
+def ler_aba_insumos(ws, layouts=None):
+    """
+    Lê uma aba de insumos já aberta
+
+    Gera um único lote: um DataFrame com as colunas codigo, descricao,
+    unidade e preco_mediano.
+    """
+    # Primeira passada: só as primeiras linhas, para achar o cabeçalho
+    linha_header, cabeçalhos = localizar_cabecalho(ws, MARCADORES_INSUMOS)
+    if linha_header is None:
+        raise PlanilhaInvalida("Não foi possível encontrar a linha de cabeçalho com 'CODIGO'")
+
+    # Identifica as colunas que precisamos
+    colunas, layout, conhecido = identificar_colunas(layouts, 'insumos', cabeçalhos, MAPEAMENTO_INSUMOS)
+    if len(colunas) < len(MAPEAMENTO_INSUMOS):
+        raise PlanilhaInvalida(
+            "Não foi possível identificar todas as colunas necessárias. "
+            f"Colunas encontradas: {list(cabeçalhos)}"
+        )
+
+    print(f"Usando as colunas: {', '.join(str(cabeçalhos[i]) for i in colunas.values())}")
+
+    # Segunda passada: apenas as colunas mapeadas, a partir do cabeçalho
+    df = ler_colunas(ws, linha_header, colunas, layout.dtypes if layout else DTYPES_INSUMOS)
+    if layout is not None and not conhecido:
+        layouts.confirmar(layout)
+
+    # Converte as colunas inteiras de uma vez, em vez de linha a linha
+    df = df[df['codigo'].notna() & df['descricao'].notna()]
+    yield pd.DataFrame({
+        'codigo': df['codigo'].str.strip(),
+        'descricao': df['descricao'].str.strip(),
+        'unidade': df['unidade'].fillna('').str.strip(),
+        'preco_mediano': converter_valores(df['preco']),
+    })
+
+
+def ler_aba_composicoes(ws, tamanho_lote=TAMANHO_LOTE, layouts=None):
+    """
+    Lê uma aba de composições já aberta, em modo streaming
+
+    Gera lotes (composicoes, itens) de tamanho fixo, onde composicoes é uma
+    lista de (codigo, descricao, unidade, custo_total) e itens uma lista de
+    (codigo_composicao, codigo_item, coeficiente). Se a planilha não tem as
+    colunas dos itens (ex: a sintética), itens é None em todos os lotes.
+    """
+    # Primeira passada: só as primeiras linhas, para achar o cabeçalho
+    linha_header, cabeçalhos = localizar_cabecalho(ws, MARCADORES_COMPOSICOES)
+    if linha_header is None:
+        raise PlanilhaInvalida("Não foi possível encontrar a linha de cabeçalho das composições")
+
+    # Mapeia cada nome interno para o índice da coluna na planilha
+    colunas, layout, conhecido = identificar_colunas(layouts, 'composicoes', cabeçalhos, MAPEAMENTO_COMPOSICOES)
+    for nome_interno in MAPEAMENTO_COMPOSICOES:
+        if nome_interno not in colunas and not conhecido:
+            print(f"⚠️ Não foi possível encontrar coluna para {nome_interno}")
+
+    # Verifica se temos as colunas mínimas necessárias. Um layout conhecido
+    # pode não ter itens (ex: a planilha sintética, só com os custos)
+    essenciais = ['codigo_composicao'] if conhecido else ['codigo_composicao', 'codigo_item', 'coeficiente']
+    faltantes = [col for col in essenciais if col not in colunas]
+    if faltantes:
+        raise PlanilhaInvalida(f"Faltam colunas essenciais para importar composições: {faltantes}")
+    com_itens = 'codigo_item' in colunas and 'coeficiente' in colunas
+    if not com_itens:
+        print("⚠️ Planilha sem os itens das composições: só os dados das composições serão gravados")
+
+    print(f"Colunas mapeadas: { {nome: cabeçalhos[i] for nome, i in colunas.items()} }")
+
+    posicoes = {nome: i for i, nome in enumerate(colunas)}
+
+    def valor(linha, nome):
+        """Obtém o valor da coluna mapeada (None se vazia ou ausente)"""
+        return linha[posicoes[nome]] if nome in posicoes else None
+
+    # Percorre as linhas acumulando lotes de tamanho fixo
+    composicoes_processadas = set()
+    lote_composicoes = []
+    lote_itens = [] if com_itens else None
+
+    # Segunda passada: apenas as colunas mapeadas, a partir do cabeçalho
+    for linha in iterar_colunas(ws, linha_header, colunas):
+        codigo_comp = valor(linha, 'codigo_composicao')
+        if codigo_comp is None:
+            continue
+
+        codigo_comp = texto_celula(codigo_comp)
+
+        # A composição entra no lote apenas na primeira vez em que aparece
+        if codigo_comp not in composicoes_processadas:
+            lote_composicoes.append((
+                codigo_comp,
+                texto_celula(valor(linha, 'descricao_composicao')),
+                texto_celula(valor(linha, 'unidade_composicao')),
+                converter_valor(valor(linha, 'custo_total')),
+            ))
+            composicoes_processadas.add(codigo_comp)
+
+        # Relacionamento com o insumo/componente
+        codigo_item = valor(linha, 'codigo_item') if com_itens else None
+        if codigo_item is not None:
+            coeficiente = converter_valor(valor(linha, 'coeficiente'), separador_milhar=False)
+            lote_itens.append((codigo_comp, texto_celula(codigo_item), coeficiente))
+
+        if len(lote_composicoes) + len(lote_itens or ()) >= tamanho_lote:
+            yield lote_composicoes, lote_itens
+            lote_composicoes = []
+            lote_itens = [] if com_itens else None
+
+    if lote_composicoes or lote_itens:
+        yield lote_composicoes, lote_itens
+
+    if layout is not None and not conhecido:
+        layouts.confirmar(layout)
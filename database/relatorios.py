@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Relatórios do orçamento para o OrçaFácil
+Grava em Excel ou CSV os relatórios calculados pelo SinapiManager
+"""
+
+import os
+
+import pandas as pd
+
+# Nome de cada tipo de item nos relatórios
+NOMES_TIPOS = {'insumo': 'Insumo', 'composicao': 'Composição'}
+
+
+def _gravar(df, arquivo, aba):
+    """Grava uma tabela em XLSX (na aba indicada) ou CSV, conforme a extensão"""
+    if os.path.splitext(arquivo)[1].lower() == '.csv':
+        df.to_csv(arquivo, index=False, sep=';', decimal=',', encoding='utf-8-sig')
+    else:
+        df.to_excel(arquivo, sheet_name=aba, index=False)
+
+
+def exportar_relatorio_insumos(linhas, arquivo):
+    """
+    Grava o relatório de insumos de um orçamento em XLSX ou CSV
+
+    Args:
+        linhas: Linhas de SinapiManager.explodir_orcamento
+        arquivo: Caminho do arquivo (.xlsx ou .csv)
+
+    Returns:
+        Quantidade de linhas gravadas
+    """
+    df = pd.DataFrame([
+        {
+            'Tipo': NOMES_TIPOS.get(tipo, tipo),
+            'Código': codigo,
+            'Descrição': descricao,
+            'Unidade': unidade,
+            'Quantidade': quantidade,
+            'Preço Unitário': preco,
+            'Total': total,
+        }
+        for tipo, codigo, descricao, unidade, quantidade, preco, total in linhas
+    ])
+    _gravar(df, arquivo, 'Insumos')
+    return len(df)
+
+
+def exportar_curva_abc(curva, arquivo):
+    """
+    Grava a curva ABC em XLSX ou CSV
+
+    Args:
+        curva: CurvaABC de SinapiManager.curva_abc_orcamento
+        arquivo: Caminho do arquivo (.xlsx ou .csv)
+
+    Returns:
+        Quantidade de linhas gravadas
+    """
+    df = pd.DataFrame([
+        {
+            'Classe': classe,
+            'Tipo': NOMES_TIPOS.get(tipo, tipo),
+            'Código': codigo,
+            'Descrição': descricao,
+            'Unidade': unidade,
+            'Quantidade': quantidade,
+            'Preço Unitário': preco,
+            'Total': total,
+            'Participação (%)': participacao,
+            'Acumulado (%)': acumulado,
+        }
+        for tipo, codigo, descricao, unidade, quantidade, preco, total, participacao, acumulado, classe in curva.linhas
+    ])
+    _gravar(df, arquivo, 'Curva ABC')
+    return len(df)
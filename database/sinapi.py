@@ -7,27 +7,128 @@ Contém a classe principal para manipulação de dados do SINAPI
 """
 
 import os
+import json
 import sqlite3
-import pandas as pd
+import numpy as np
 from datetime import datetime
-import shutil
-import tempfile
-import re
-import atexit
+import time
+import hashlib
+from contextlib import contextmanager
+
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from database.busca import (
+    PESOS_BM25,
+    CachePesquisa,
+    IndiceTrigramas,
+    bm25,
+    consulta_fts,
+    contar_palavras,
+    delecoes,
+    frases_fts,
+    melhor_correcao,
+    normalizar_texto,
+    palavra_corrigivel,
+)
+from database.cache import CachePlanilhas, DIRETORIO_CACHE
+from database.consultas import ConsultaOcupada, ExecutorConsultas
+from database.custos import CicloComposicoes, GrafoComposicoes
+from database.curva_abc import LIMITES_ABC, curva_abc, validar_limites
+from database.correspondencia import TOP_CANDIDATOS, corresponder, ler_planilha_cliente
+from database.fontes import REGIME_DESONERADO, base_da_planilha, localizar_planilha, ler_conteudo
+from database.importacao import chave_planilha, preparar_planilha
+from database.layouts import RegistroLayouts
+from database.planilhas import (
+    TAMANHO_LOTE,
+    PlanilhaInvalida,
+    ler_insumos,
+    ler_composicoes,
+)
+from models.projeto import BaseSinapi, ImpactoProjeto, PaginaPesquisa, ResultadoCenarios, ResumoDelta
+
+# Quantidade de maiores variações de preço guardadas no resumo do delta
+MAIORES_VARIACOES = 10
+
+# Quantidade padrão de resultados de uma pesquisa
+LIMITE_PESQUISA = 50
+
+# Quantidade de linhas trazidas do banco em cada pesquisa; se todas as que
+# atendem ao termo couberem, o cache pode refinar a pesquisa sem o banco
+RESULTADOS_GUARDADOS = 1000
+
+# Quantidade de linhas de cada página da pesquisa paginada
+TAMANHO_PAGINA = 100
+
+# Tabela e coluna de preço pesquisadas para cada tipo de item
+TABELAS_PESQUISA = {
+    'insumo': ('insumos', 'preco_mediano'),
+    'composicao': ('composicoes', 'custo_total'),
+}
+
+# Diferença de custo (R$) abaixo da qual o custo recalculado de uma
+# composição é considerado igual ao da planilha
+TOLERANCIA_CUSTO = 0.005
+
+# Profundidade máxima de sub-composições percorrida ao procurar onde um item
+# é usado (protege contra um ciclo acidental nos dados importados)
+NIVEIS_COMPOSICAO = 20
+
+
+def _novo_hash(*valores):
+    """Inicia o hash de uma linha a partir dos valores informados"""
+    h = hashlib.blake2b(digest_size=8)
+    h.update(repr(valores).encode('utf-8'))
+    return h
+
+
+def _valor_hash(h):
+    """Converte o hash em um inteiro de 64 bits (cabe em uma coluna INTEGER)"""
+    return int.from_bytes(h.digest(), 'big', signed=True)
+
+
+def _hashes_composicoes(hashes, composicoes, itens):
+    """Acumula no hash de cada composição seus dados e, em ordem, seus itens"""
+    for codigo, descricao, unidade, custo_total in composicoes:
+        hashes.setdefault(codigo, _novo_hash(descricao, unidade, custo_total))
+    for codigo, codigo_item, coeficiente in itens:
+        hashes.setdefault(codigo, _novo_hash()).update(repr((codigo_item, coeficiente)).encode('utf-8'))
+
+
+def _chave_busca(tipo, codigo, descricao_norm):
+    """Rowid de uma linha do índice de busca (uma por tipo, código e descrição normalizada)"""
+    return _valor_hash(_novo_hash(tipo, codigo, descricao_norm))
+
+
+def _maiores_variacoes(variacoes):
+    """Ordena (codigo, antigo, novo) pela variação relativa, da maior para a menor"""
+    return sorted(
+        variacoes,
+        key=lambda v: abs(v[2] - v[1]) / max(abs(v[1]), 0.01),
+        reverse=True
+    )[:MAIORES_VARIACOES]
+
 
 class SinapiManager:
     """
     Gerenciador de banco de dados para o SINAPI
     Versão refatorada da classe SinapiImporter original
     """
-    def __init__(self, db_path='orcamento.db'):
+    def __init__(self, db_path='orcamento.db', diretorio_cache=DIRETORIO_CACHE):
         """Inicializa o gerenciador de banco de dados"""
         self.db_path = db_path
         self.conn = None
-        self.temp_files = []  # Lista para controlar arquivos temporários
+        self.busca_textual = True  # Falso se o SQLite não tiver FTS5 (pesquisa com LIKE)
+        self._bases = None  # Bases importadas, guardadas até a próxima gravação
+        self.geracao = 0  # Muda a cada gravação de preços (invalida os caches de consultas)
+        self.cache_pesquisa = CachePesquisa(ordenar=self._ordenar_pesquisa)
+        self._estatisticas_busca = None  # (geração, linhas do índice, média de palavras, acertos)
+        self._grafos = {}  # base -> (geração, GrafoComposicoes)
+        
+        # Cache das planilhas já processadas (evita reprocessar o mesmo arquivo)
+        self.cache = CachePlanilhas(diretorio_cache)
         
-        # Registra a função de limpeza para ser executada ao sair
-        atexit.register(self.limpar_arquivos_temporarios)
+        # Layouts de planilha conhecidos (e os confirmados em importações anteriores)
+        self.layouts = RegistroLayouts(diretorio_cache)
         
         # Inicializa o banco de dados
         self.setup_database()
@@ -40,6 +141,12 @@ class SinapiManager:
         # Conecta ao banco
         self.conn = sqlite3.connect(self.db_path)
         
+        # Consultas longas canceláveis (ver executar_cancelavel)
+        self.consultas = ExecutorConsultas(self.conn)
+        
+        # Disponível no SQL para as migrações que preenchem as chaves de pesquisa
+        self.conn.create_function('normalizar_texto', 1, normalizar_texto, deterministic=True)
+        
         # Se o banco já existe, verifica se precisa atualizar o esquema
         if banco_existente:
             self._verificar_migracoes()
@@ -48,275 +155,604 @@ class SinapiManager:
             self._criar_tabela_insumos()
             self._criar_tabela_composicoes()
             self._criar_tabela_composicao_insumos()
+            self._criar_tabela_explosoes()
             self._criar_tabela_projetos()
             self._criar_tabela_orcamento_itens()
+            self._criar_tabela_busca()
+            self._criar_tabela_vocabulario()
         
         self.conn.commit()
-    
-    def importar_insumos(self, arquivo_excel, aba='insumos', mes_ref=None):
-        """Importa insumos do Excel SINAPI"""
-        if not mes_ref:
-            mes_ref = datetime.now().strftime("%Y-%m")
-            
+
+    @contextmanager
+    def _transacao(self, invalidar=True):
+        """
+        Executa um bloco de gravações dentro de uma única transação explícita
+        
+        Args:
+            invalidar: False para gravações que não mudam preços nem bases (ex:
+                       caches), que mantêm a geração e os dados guardados dela
+        """
+        # Uma gravação pedida enquanto uma consulta atualiza a interface
+        # rodaria dentro dela
+        if self.consultas.ocupada:
+            raise ConsultaOcupada("Aguarde o fim da consulta em andamento")
+
+        # Fecha qualquer transação implícita pendente antes de abrir a nossa
+        if self.conn.in_transaction:
+            self.conn.commit()
+
+        self.conn.execute("BEGIN")
+        try:
+            yield self.conn
+        except Exception:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+        if invalidar:
+            self.geracao += 1
+            self._bases = None
+
+    def importar_insumos(self, arquivo_excel, aba=None, mes_ref=None, delta=False, remover_ausentes=False,
+                         regime=None, uf=None):
+        """
+        Importa insumos do Excel SINAPI
+        
+        O arquivo pode ser a planilha ou o ZIP oficial do SINAPI; no ZIP, a
+        planilha de insumos do regime informado é lida direto do pacote. Sem
+        aba informada, a aba de insumos é descoberta pelo nome ou cabeçalho.
+        
+        Os preços são gravados na base (UF, regime, mês de referência) indicada
+        pelos parâmetros ou, na falta deles, pelo nome do arquivo; importar
+        outro mês ou outra UF não sobrescreve as bases já existentes.
+        
+        Com delta=True, só grava os códigos novos e os que mudaram (comparando o
+        hash de cada linha com o que já está na mesma base) e devolve um
+        ResumoDelta; remover_ausentes=True também apaga da base os códigos que
+        sumiram da planilha.
+        """
         print(f"Importando insumos de {arquivo_excel}...")
+        inicio = time.perf_counter()
         
         try:
-            # Cria uma cópia temporária do arquivo para evitar problemas de permissão
-            temp_file = self._criar_arquivo_temporario(arquivo_excel)
-            
-            # Carrega a planilha sem definir cabeçalho inicialmente
-            df = pd.read_excel(temp_file, sheet_name=aba, header=None)
-            
-            # Encontra a linha que contém 'CODIGO' para determinar onde os cabeçalhos reais estão
-            linha_header = None
-            for i, row in df.iterrows():
-                row_str = ' '.join([str(cell).upper() for cell in row if pd.notna(cell)])
-                if 'CODIGO' in row_str:
-                    linha_header = i
-                    break
-            
-            if linha_header is None:
-                print("❌ Não foi possível encontrar a linha de cabeçalho com 'CODIGO'")
-                return 0
-                
-            # Define esta linha como cabeçalho e recria o DataFrame
-            cabeçalhos = df.iloc[linha_header]
-            df = pd.DataFrame(df.values[linha_header+1:], columns=cabeçalhos)
-            
-            # Identifica as colunas que precisamos
-            col_codigo = next((col for col in df.columns if str(col).strip().upper() == 'CODIGO'), None)
-            col_descricao = next((col for col in df.columns if 'DESCRICAO' in str(col).upper() and 'INSUMO' in str(col).upper()), None)
-            col_unidade = next((col for col in df.columns if 'UNIDADE' in str(col).upper()), None)
-            col_preco = next((col for col in df.columns if 'PRECO' in str(col).upper() and 'MEDIANO' in str(col).upper()), None)
-            
-            # Se não encontrou as colunas, tenta novamente com uma busca mais flexível
-            if not col_codigo:
-                col_codigo = next((col for col in df.columns if 'COD' in str(col).upper()), None)
-            if not col_descricao:
-                col_descricao = next((col for col in df.columns if 'DESCRI' in str(col).upper()), None)
-            if not col_unidade:
-                col_unidade = next((col for col in df.columns if 'UN' in str(col).upper()), None)
-            if not col_preco:
-                col_preco = next((col for col in df.columns if 'PRECO' in str(col).upper() or 'PREÇO' in str(col).upper()), None)
-            
-            # Verifica se encontramos todas as colunas necessárias
-            if not all([col_codigo, col_descricao, col_unidade, col_preco]):
-                print("⚠️ Não foi possível identificar todas as colunas necessárias")
-                print(f"Colunas encontradas: {list(df.columns)}")
-                return 0
-                
-            print(f"Usando as colunas: {col_codigo}, {col_descricao}, {col_unidade}, {col_preco}")
+            # Uma única leitura do arquivo serve para o hash e para o processamento
+            membro = localizar_planilha(arquivo_excel, 'insumos', regime or REGIME_DESONERADO)
+            conteudo = ler_conteudo(arquivo_excel, membro)
+            base = self._resolver_base(arquivo_excel, membro, mes_ref, uf, regime)
             
-            # Processa e insere dados
-            registros = 0
-            for _, row in df.iterrows():
-                codigo = row.get(col_codigo)
-                descricao = row.get(col_descricao)
-                
-                if pd.notna(codigo) and pd.notna(descricao):
-                    # Obtém valores e converte para o formato correto
-                    unidade = row.get(col_unidade, '')
-                    preco = row.get(col_preco, 0)
-                    
-                    if pd.isna(preco):
-                        preco = 0
-                        
-                    # Converte para string/float conforme necessário
-                    codigo = str(codigo).strip()
-                    descricao = str(descricao).strip()
-                    unidade = str(unidade).strip() if pd.notna(unidade) else ''
-                    
-                    # Transforma valores potencialmente formatados (ex: "R$ 10,50") em float
-                    if isinstance(preco, str):
-                        preco = preco.replace('R$', '').replace('.', '').replace(',', '.').strip()
-                        try:
-                            preco = float(preco)
-                        except ValueError:
-                            preco = 0
-                    
-                    self.conn.execute('''
-                    INSERT OR REPLACE INTO insumos 
-                    (codigo, descricao, unidade, preco_mediano, origem, data_referencia, data_atualizacao)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        codigo, 
-                        descricao, 
-                        unidade, 
-                        float(preco),
-                        'SINAPI',
-                        mes_ref,
-                        datetime.now().strftime("%Y-%m-%d")
-                    ))
-                    registros += 1
+            # Se o mesmo arquivo já foi processado, a tabela vem direto do cache
+            lotes = self.cache.obter(
+                chave_planilha(self.cache, 'insumos', conteudo, aba),
+                lambda: ler_insumos(conteudo, aba, layouts=self.layouts)
+            )
+            if delta:
+                resumo = self._gravar_insumos_delta(lotes, base, remover_ausentes)
+                print(f"✅ Delta de insumos ({base}): {resumo}")
+                return resumo
             
-            self.conn.commit()
-            print(f"✅ Importados {registros} insumos com sucesso!")
+            registros = self._gravar_insumos(lotes, base)
+            
+            duracao = max(time.perf_counter() - inicio, 1e-9)
+            print(f"✅ Importados {registros} insumos na base {base}! ({registros / duracao:.0f} linhas/s)")
             return registros
             
+        except PlanilhaInvalida as e:
+            print(f"❌ {str(e)}")
+            return ResumoDelta() if delta else 0
         except Exception as e:
             print(f"❌ Erro ao importar insumos: {str(e)}")
             import traceback
             traceback.print_exc()
-            return 0
+            return ResumoDelta() if delta else 0
 
-    def importar_composicoes(self, arquivo_excel, aba='Composicoes', mes_ref=None):
-        """Importa composições do Excel SINAPI"""
-        if not mes_ref:
-            mes_ref = datetime.now().strftime("%Y-%m")
-            
+    def importar_composicoes(self, arquivo_excel, aba=None, mes_ref=None, tamanho_lote=TAMANHO_LOTE,
+                             delta=False, remover_ausentes=False, regime=None, uf=None):
+        """
+        Importa composições do Excel SINAPI em modo streaming
+        
+        A planilha é lida linha a linha com o openpyxl em modo somente leitura e
+        as gravações são feitas em lotes de tamanho fixo, de modo que o pico de
+        memória não depende do tamanho do arquivo. O arquivo pode ser a planilha
+        ou o ZIP oficial do SINAPI (a planilha analítica do regime informado é
+        lida direto do pacote). Sem aba informada, a aba de composições é
+        descoberta pelo nome ou cabeçalho.
+        
+        A base (UF, regime, mês de referência) é definida como em importar_insumos.
+        
+        Com delta=True, só grava as composições novas e as que mudaram (dados ou
+        itens) e devolve um ResumoDelta; remover_ausentes=True também apaga da
+        base as composições que sumiram da planilha.
+        """
         print(f"Importando composições de {arquivo_excel}...")
+        inicio = time.perf_counter()
         
         try:
-            # Cria uma cópia temporária do arquivo para evitar problemas de permissão
-            temp_file = self._criar_arquivo_temporario(arquivo_excel)
-            
-            # Carrega a planilha sem definir cabeçalho inicialmente
-            df = pd.read_excel(temp_file, sheet_name=aba, header=None)
-            
-            # Encontra a linha que contém cabeçalhos com as palavras-chave que precisamos
-            linha_header = None
-            for i, row in df.iterrows():
-                row_str = ' '.join([str(cell).upper() for cell in row if pd.notna(cell)])
-                if 'CODIGO DA COMPOSICAO' in row_str or 'CODIGO COMPOSICAO' in row_str:
-                    linha_header = i
-                    break
-            
-            if linha_header is None:
-                print("❌ Não foi possível encontrar a linha de cabeçalho das composições")
-                return 0
-                
-            # Define esta linha como cabeçalho e recria o DataFrame
-            cabeçalhos = df.iloc[linha_header]
-            df = pd.DataFrame(df.values[linha_header+1:], columns=cabeçalhos)
-            
-            # Identifica as colunas-chave que precisamos
-            mapeamento_colunas = {
-                'codigo_composicao': ['CODIGO DA COMPOSICAO', 'CODIGO COMPOSICAO', 'CODIGO', 'COD'],
-                'descricao_composicao': ['DESCRICAO DA COMPOSICAO', 'DESCRICAO COMPOSICAO', 'DESCRICAO'],
-                'unidade_composicao': ['UNIDADE'],
-                'custo_total': ['CUSTO TOTAL', 'VALOR TOTAL'],
-                'codigo_item': ['CODIGO ITEM', 'CODIGO DO ITEM', 'COD ITEM'],
-                'tipo_item': ['TIPO ITEM', 'TIPO DE ITEM'],
-                'descricao_item': ['DESCRIÇÃO ITEM', 'DESCRICAO DO ITEM', 'DESCRICAO ITEM'],
-                'unidade_item': ['UNIDADE ITEM'],
-                'coeficiente': ['COEFICIENTE', 'COEF']
-            }
+            # Uma única leitura do arquivo serve para o hash e para o processamento
+            membro = localizar_planilha(arquivo_excel, 'composicoes', regime or REGIME_DESONERADO)
+            conteudo = ler_conteudo(arquivo_excel, membro)
+            base = self._resolver_base(arquivo_excel, membro, mes_ref, uf, regime)
             
-            # Mapeia as colunas reais para os nomes que usaremos
-            colunas_mapeadas = {}
-            for nome_interno, possiveis_nomes in mapeamento_colunas.items():
-                encontrado = False
-                for possivel in possiveis_nomes:
-                    for col in df.columns:
-                        if possivel in str(col).upper():
-                            colunas_mapeadas[nome_interno] = col
-                            encontrado = True
-                            break
-                    if encontrado:
-                        break
-                        
-                if not encontrado:
-                    print(f"⚠️ Não foi possível encontrar coluna para {nome_interno}")
-            
-            # Verifica se temos as colunas mínimas necessárias
-            essenciais = ['codigo_composicao', 'codigo_item', 'coeficiente']
-            if not all(col in colunas_mapeadas for col in essenciais):
-                print("❌ Faltam colunas essenciais para importar composições")
-                missing = [col for col in essenciais if col not in colunas_mapeadas]
-                print(f"Colunas faltantes: {missing}")
-                return 0
-            
-            print(f"Colunas mapeadas: {colunas_mapeadas}")
-            
-            # Vamos iterar pelas linhas e processar composições e seus itens
-            composicoes_processadas = set()
-            registros_composicoes = 0
-            registros_itens = 0
-            
-            for idx, row in df.iterrows():
-                # Obtém o código da composição
-                codigo_comp = row.get(colunas_mapeadas['codigo_composicao'])
-                
-                if pd.isna(codigo_comp):
-                    continue
-                    
-                codigo_comp = str(codigo_comp).strip()
-                
-                # Se ainda não processamos esta composição, insere na tabela de composições
-                if codigo_comp not in composicoes_processadas:
-                    # Extrai os valores das colunas mapeadas se disponíveis
-                    descricao = str(row.get(colunas_mapeadas.get('descricao_composicao', ''), '')).strip() if 'descricao_composicao' in colunas_mapeadas else ''
-                    unidade = str(row.get(colunas_mapeadas.get('unidade_composicao', ''), '')).strip() if 'unidade_composicao' in colunas_mapeadas else ''
-                    
-                    # Trata o custo total
-                    custo_total = 0
-                    if 'custo_total' in colunas_mapeadas:
-                        custo_total = row.get(colunas_mapeadas['custo_total'], 0)
-                        if isinstance(custo_total, str):
-                            custo_total = custo_total.replace('R$', '').replace('.', '').replace(',', '.').strip()
-                            try:
-                                custo_total = float(custo_total)
-                            except ValueError:
-                                custo_total = 0
-                        elif pd.isna(custo_total):
-                            custo_total = 0
-                    
-                    self.conn.execute('''
-                    INSERT OR REPLACE INTO composicoes 
-                    (codigo, descricao, unidade, custo_total, origem, data_referencia, data_atualizacao)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        codigo_comp, 
-                        descricao, 
-                        unidade, 
-                        float(custo_total),
-                        'SINAPI',
-                        mes_ref,
-                        datetime.now().strftime("%Y-%m-%d")
-                    ))
-                    
-                    composicoes_processadas.add(codigo_comp)
-                    registros_composicoes += 1
-                
-                # Agora insere o relacionamento com o insumo/componente
-                codigo_item = row.get(colunas_mapeadas['codigo_item'], None)
-                
-                if pd.notna(codigo_item):
-                    codigo_item = str(codigo_item).strip()
-                    
-                    # Processa o coeficiente
-                    coeficiente = row.get(colunas_mapeadas['coeficiente'], 0)
-                    if isinstance(coeficiente, str):
-                        coeficiente = coeficiente.replace(',', '.').strip()
-                        try:
-                            coeficiente = float(coeficiente)
-                        except ValueError:
-                            coeficiente = 0
-                    elif pd.isna(coeficiente):
-                        coeficiente = 0
-                    
-                    self.conn.execute('''
-                    INSERT OR REPLACE INTO composicao_insumos 
-                    (codigo_composicao, codigo_insumo, coeficiente)
-                    VALUES (?, ?, ?)
-                    ''', (
-                        codigo_comp,
-                        codigo_item, 
-                        float(coeficiente)
-                    ))
-                    
-                    registros_itens += 1
+            # Se o mesmo arquivo já foi processado, os lotes vêm direto do cache
+            chave = chave_planilha(self.cache, 'composicoes', conteudo, aba)
+            lotes = self.cache.obter(
+                chave,
+                lambda: ler_composicoes(conteudo, aba, tamanho_lote, layouts=self.layouts)
+            )
             
-            self.conn.commit()
-            print(f"✅ Importadas {registros_composicoes} composições com {registros_itens} itens!")
+            if delta:
+                # A primeira leitura preenche o cache; a segunda já vem dele
+                leituras = iter([lotes])
+                resumo = self._gravar_composicoes_delta(
+                    lambda: next(leituras, None) or self.cache.ler(chave),
+                    base,
+                    remover_ausentes
+                )
+                print(f"✅ Delta de composições ({base}): {resumo}")
+                return resumo
+            
+            registros_composicoes, registros_itens = self._gravar_composicoes(lotes, base)
+            
+            duracao = max(time.perf_counter() - inicio, 1e-9)
+            print(f"✅ Importadas {registros_composicoes} composições com {registros_itens} itens na base {base}! "
+                  f"({(registros_composicoes + registros_itens) / duracao:.0f} linhas/s)")
             return registros_composicoes
             
+        except PlanilhaInvalida as e:
+            print(f"❌ {str(e)}")
+            return ResumoDelta() if delta else 0
         except Exception as e:
             print(f"❌ Erro ao importar composições: {str(e)}")
             import traceback
             traceback.print_exc()
+            return ResumoDelta() if delta else 0
+    
+    def importar_planilhas(self, tarefas, max_processos=None, progresso=None, ao_aguardar=None,
+                           delta=False, remover_ausentes=False):
+        """
+        Importa várias planilhas processando-as em paralelo
+        
+        Cada planilha é processada em um processo separado, que deixa as tabelas
+        normalizadas no cache; esta conexão é o único escritor e grava cada
+        planilha assim que ela fica pronta. O tempo total tende ao da planilha
+        mais demorada, e não à soma de todas.
+        
+        Args:
+            tarefas: Lista de TarefaImportacao
+            max_processos: Número máximo de processos (padrão: um por planilha, até o nº de CPUs)
+            progresso: Função chamada com mensagens de andamento
+            ao_aguardar: Função chamada periodicamente enquanto espera (ex: atualizar a interface)
+            delta: Grava apenas as linhas novas ou alteradas (ver importar_insumos)
+            remover_ausentes: No modo delta, apaga o que sumiu da planilha
+        
+        Returns:
+            Lista de tuplas (tarefa, registros gravados)
+        """
+        def avisar(mensagem):
+            print(mensagem)
+            if progresso:
+                progresso(mensagem)
+        
+        if not tarefas:
+            return []
+        
+        # As tarefas de um mesmo arquivo são processadas juntas: a planilha é
+        # aberta uma única vez para todas as abas
+        grupos = {}
+        for tarefa in tarefas:
+            grupos.setdefault((tarefa.arquivo, tarefa.membro), []).append(tarefa)
+        
+        max_processos = max_processos or min(len(grupos), os.cpu_count() or 1)
+        resultados = []
+        
+        with ProcessPoolExecutor(max_workers=max_processos) as executor:
+            futuros = {
+                executor.submit(
+                    preparar_planilha, arquivo, membro,
+                    {t.tipo: t.aba for t in grupo}, self.cache.diretorio
+                ): grupo
+                for (arquivo, membro), grupo in grupos.items()
+            }
+            pendentes = set(futuros)
+            
+            while pendentes:
+                prontos, pendentes = wait(pendentes, timeout=0.1, return_when=FIRST_COMPLETED)
+                if ao_aguardar:
+                    ao_aguardar()
+                
+                for futuro in prontos:
+                    try:
+                        chaves = futuro.result()
+                    except Exception as e:
+                        chaves = {t.tipo: e for t in futuros[futuro]}
+                    
+                    for tarefa in futuros[futuro]:
+                        registros = self._gravar_tarefa(tarefa, chaves[tarefa.tipo], avisar, delta, remover_ausentes)
+                        resultados.append((tarefa, registros))
+        
+        self.cache.aplicar_limites()
+        return resultados
+    
+    def _gravar_tarefa(self, tarefa, chave, avisar, delta=False, remover_ausentes=False):
+        """
+        Grava uma planilha já processada pelo pipeline (ver importar_planilhas)
+        
+        Args:
+            chave: Chave do cache com os lotes, ou a exceção do processamento
+        
+        Returns:
+            Quantidade de registros gravados
+        """
+        nome = tarefa.nome
+        try:
+            if isinstance(chave, Exception):
+                raise chave
+            inicio = time.perf_counter()
+            base = self._resolver_base(tarefa.arquivo, tarefa.membro, tarefa.mes_ref, tarefa.uf, tarefa.regime)
+            
+            if delta:
+                gravar = (self._gravar_insumos_delta if tarefa.tipo == 'insumos'
+                          else self._gravar_composicoes_delta)
+                lotes = self.cache.ler(chave) if tarefa.tipo == 'insumos' else (lambda: self.cache.ler(chave))
+                resumo = gravar(lotes, base, remover_ausentes)
+                registros = resumo.gravados
+                avisar(f"✅ {nome} ({tarefa.tipo}, {base}): {resumo}")
+            elif tarefa.tipo == 'insumos':
+                registros = self._gravar_insumos(self.cache.ler(chave), base)
+                avisar(f"✅ {nome}: importados {registros} insumos ({base})")
+            else:
+                registros, itens = self._gravar_composicoes(self.cache.ler(chave), base)
+                avisar(f"✅ {nome}: importadas {registros} composições com {itens} itens ({base})")
+            
+            print(f"Gravação de {nome} ({tarefa.tipo}) em {time.perf_counter() - inicio:.2f}s")
+            return registros
+        except Exception as e:
+            avisar(f"❌ Erro ao importar {tarefa.tipo} de {nome}: {str(e)}")
             return 0
     
+    def _resolver_base(self, arquivo, membro=None, mes_ref=None, uf=None, regime=None):
+        """
+        Define a base em que uma planilha será gravada
+        
+        Os valores informados têm prioridade; o que faltar é deduzido do nome
+        da planilha (ou do ZIP). O mês de referência, se não houver como
+        deduzir, é o mês atual.
+        """
+        deduzida = base_da_planilha(membro, arquivo)
+        return BaseSinapi(
+            uf=(uf or deduzida.uf or '').upper(),
+            regime=regime or deduzida.regime or '',
+            data_referencia=mes_ref or deduzida.data_referencia or datetime.now().strftime("%Y-%m"),
+        )
+    
+    def _gravar_insumos(self, lotes, base):
+        """Grava os lotes de insumos normalizados de uma base em uma única transação"""
+        registros = 0
+        data_atualizacao = datetime.now().strftime("%Y-%m-%d")
+        with self._transacao():
+            existentes = {linha[0] for linha in self.conn.execute(
+                "SELECT codigo FROM insumos WHERE uf = ? AND regime = ? AND data_referencia = ?",
+                (base.uf, base.regime, base.data_referencia))}
+            novos = set()
+            for dados in lotes:
+                dados = dados.assign(
+                    uf=base.uf,
+                    regime=base.regime,
+                    data_referencia=base.data_referencia,
+                    origem='SINAPI',
+                    data_atualizacao=data_atualizacao,
+                    hash_linha=self._hashes_insumos(dados),
+                    descricao_norm=dados['descricao'].map(normalizar_texto)
+                )
+                self.conn.executemany('''
+                INSERT OR REPLACE INTO insumos 
+                (codigo, descricao, unidade, preco_mediano, uf, regime, data_referencia,
+                 origem, data_atualizacao, hash_linha, descricao_norm)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', dados.itertuples(index=False, name=None))
+                self._indexar_busca('insumo', dados[['codigo', 'descricao_norm']].itertuples(index=False, name=None))
+                novos.update(codigo for codigo in dados['codigo'].tolist() if codigo not in existentes)
+                registros += len(dados)
+            
+            # Um código que passa a ser insumo deixa de ser desdobrado como composição
+            self._invalidar_explosoes(novos, base)
+            self._atualizar_vocabulario(base)
+        
+        return registros
+    
+    def _hashes_insumos(self, dados):
+        """Calcula o hash de cada linha de um lote de insumos"""
+        return [
+            _valor_hash(_novo_hash(descricao, unidade, float(preco)))
+            for descricao, unidade, preco in dados[['descricao', 'unidade', 'preco_mediano']].itertuples(index=False, name=None)
+        ]
+    
+    def _gravar_insumos_delta(self, lotes, base, remover_ausentes=False):
+        """
+        Grava apenas os insumos novos ou alterados de uma base
+        
+        Returns:
+            ResumoDelta com as contagens e as maiores variações de preço
+        """
+        data_atualizacao = datetime.now().strftime("%Y-%m-%d")
+        chave_base = (base.uf, base.regime, base.data_referencia)
+        
+        existentes = {
+            codigo: (hash_linha, preco)
+            for codigo, hash_linha, preco in self.conn.execute('''
+            SELECT codigo, hash_linha, preco_mediano FROM insumos
+            WHERE uf = ? AND regime = ? AND data_referencia = ?
+            ''', chave_base)
+        }
+        
+        # Linhas da planilha por código (a última ocorrência prevalece)
+        recebidos = {}
+        for dados in lotes:
+            dados = dados.assign(hash_linha=self._hashes_insumos(dados))
+            for linha in dados.itertuples(index=False, name=None):
+                recebidos[linha[0]] = linha
+        
+        resumo = ResumoDelta()
+        gravar = []
+        variacoes = []
+        for codigo, (_, descricao, unidade, preco, hash_linha) in recebidos.items():
+            atual = existentes.get(codigo)
+            if atual is None:
+                resumo.adicionados += 1
+            elif atual[0] != hash_linha:
+                resumo.alterados += 1
+                if atual[1] != preco:
+                    variacoes.append((codigo, atual[1] or 0.0, preco))
+            else:
+                resumo.inalterados += 1
+                continue
+            gravar.append(
+                (codigo, descricao, unidade, preco) + chave_base
+                + ('SINAPI', data_atualizacao, hash_linha, normalizar_texto(descricao))
+            )
+        
+        ausentes = [(codigo,) + chave_base for codigo in existentes if codigo not in recebidos] if remover_ausentes else []
+        resumo.removidos = len(ausentes)
+        resumo.maiores_variacoes = _maiores_variacoes(variacoes)
+        
+        with self._transacao():
+            # Atualiza no lugar (sem apagar e reinserir a linha)
+            self.conn.executemany('''
+            INSERT INTO insumos 
+            (codigo, descricao, unidade, preco_mediano, uf, regime, data_referencia,
+             origem, data_atualizacao, hash_linha, descricao_norm)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(codigo, uf, regime, data_referencia) DO UPDATE SET
+                descricao = excluded.descricao,
+                descricao_norm = excluded.descricao_norm,
+                unidade = excluded.unidade,
+                preco_mediano = excluded.preco_mediano,
+                origem = excluded.origem,
+                data_atualizacao = excluded.data_atualizacao,
+                hash_linha = excluded.hash_linha
+            ''', gravar)
+            self._indexar_busca('insumo', ((linha[0], linha[-1]) for linha in gravar))
+            self.conn.executemany(
+                "DELETE FROM insumos WHERE codigo = ? AND uf = ? AND regime = ? AND data_referencia = ?",
+                ausentes
+            )
+            
+            # Um código que passa a ser (ou deixa de ser) insumo muda o desdobramento das composições
+            self._invalidar_explosoes(
+                [linha[0] for linha in gravar if linha[0] not in existentes] + [linha[0] for linha in ausentes], base
+            )
+            self._atualizar_vocabulario(base)
+            
+            # Os novos preços chegam às composições; os orçamentos que os usam são só marcados
+            grafo = None
+            if variacoes:
+                grafo, resumo.projetos_afetados = self._propagar_precos(
+                    base, {codigo: (antigo, preco) for codigo, antigo, preco in variacoes}
+                )
+        
+        if grafo is not None:
+            self._grafos[base] = (self.geracao, grafo)
+        return resumo
+    
+    def _gravar_composicoes(self, lotes, base):
+        """
+        Grava os lotes de composições e itens de uma base em uma única transação
+        
+        Lotes sem itens (itens None: planilha sem as colunas dos itens, como a
+        sintética) só atualizam os dados das composições; os itens já
+        gravados, o hash do modo delta e os desdobramentos ficam como estão.
+        """
+        registros_composicoes = 0
+        registros_itens = 0
+        hashes = {}
+        data_atualizacao = datetime.now().strftime("%Y-%m-%d")
+        with self._transacao():
+            for composicoes, itens in lotes:
+                registros_composicoes += len(composicoes)
+                if itens is None:
+                    self._gravar_lote_composicoes(composicoes, None, base, data_atualizacao)
+                    continue
+                # Os itens antigos das composições da planilha são substituídos
+                self._apagar_itens_composicoes((comp[0] for comp in composicoes), base)
+                self._gravar_lote_composicoes(composicoes, itens, base, data_atualizacao)
+                _hashes_composicoes(hashes, composicoes, itens)
+                registros_itens += len(itens)
+            
+            # O hash só fica completo depois de todos os itens da composição
+            self._gravar_hashes_composicoes(hashes, base)
+            self._invalidar_explosoes(hashes, base)
+            self._atualizar_vocabulario(base)
+        
+        return registros_composicoes, registros_itens
+    
+    def _gravar_hashes_composicoes(self, hashes, base):
+        """Guarda o hash de cada composição (dados + itens) para o modo delta"""
+        self.conn.executemany('''
+        UPDATE composicoes SET hash_linha = ?
+        WHERE codigo = ? AND uf = ? AND regime = ? AND data_referencia = ?
+        ''', (
+            (_valor_hash(h), codigo, base.uf, base.regime, base.data_referencia)
+            for codigo, h in hashes.items()
+        ))
+    
+    def _apagar_itens_composicoes(self, codigos, base):
+        """Apaga os itens das composições informadas em uma base"""
+        self.conn.executemany('''
+        DELETE FROM composicao_insumos
+        WHERE codigo_composicao = ? AND uf = ? AND regime = ? AND data_referencia = ?
+        ''', ((codigo, base.uf, base.regime, base.data_referencia) for codigo in codigos))
+    
+    def _invalidar_explosoes(self, codigos, base):
+        """
+        Apaga o desdobramento guardado das composições cujos itens mudaram
+        
+        Também apaga o das composições que as usam, direta ou indiretamente
+        (pelo índice inverso de composicao_insumos). Serve também para
+        códigos de insumos incluídos ou removidos: um código que é insumo e
+        composição é desdobrado como insumo (ver _garantir_explosoes).
+        """
+        chave_base = (base.uf, base.regime, base.data_referencia)
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS explosao_alteradas (codigo TEXT PRIMARY KEY) WITHOUT ROWID")
+        self.conn.execute("DELETE FROM explosao_alteradas")
+        self.conn.executemany("INSERT OR IGNORE INTO explosao_alteradas VALUES (?)", ((codigo,) for codigo in codigos))
+        
+        # UNION (e não UNION ALL) visita cada composição uma vez, mesmo com ciclos
+        self.conn.execute('''
+        WITH RECURSIVE afetadas (codigo) AS (
+            SELECT codigo FROM explosao_alteradas
+            UNION
+            SELECT ci.codigo_composicao
+            FROM afetadas
+            JOIN composicao_insumos ci ON ci.codigo_insumo = afetadas.codigo
+                AND ci.uf = ? AND ci.regime = ? AND ci.data_referencia = ?
+        )
+        DELETE FROM explosao_composicoes
+        WHERE uf = ? AND regime = ? AND data_referencia = ?
+            AND codigo_composicao IN (SELECT codigo FROM afetadas)
+        ''', chave_base + chave_base)
+        self.conn.execute("DELETE FROM explosao_alteradas")
+    
+    def _gravar_composicoes_delta(self, obter_lotes, base, remover_ausentes=False):
+        """
+        Grava apenas as composições novas ou alteradas de uma base
+        
+        Faz duas leituras dos lotes para manter a memória constante: a primeira
+        calcula o hash de cada composição (dados + itens) e a segunda grava só
+        as que mudaram, substituindo seus itens. Se a planilha não traz os
+        itens (ver _gravar_composicoes), as composições são comparadas só
+        pelos dados e os itens gravados são mantidos.
+        
+        Args:
+            obter_lotes: Função que devolve um novo iterador de lotes a cada chamada
+        
+        Returns:
+            ResumoDelta com as contagens e as maiores variações de custo
+        """
+        data_atualizacao = datetime.now().strftime("%Y-%m-%d")
+        
+        # Primeira leitura: hash e dados de cada composição da planilha
+        hashes = {}
+        dados = {}
+        com_itens = True
+        for composicoes, itens in obter_lotes():
+            if itens is None:
+                com_itens = False
+            _hashes_composicoes(hashes, composicoes, itens or ())
+            for codigo, descricao, unidade, custo_total in composicoes:
+                dados.setdefault(codigo, (descricao, unidade, custo_total))
+        
+        existentes = {
+            codigo: (hash_linha, (descricao, unidade, custo))
+            for codigo, hash_linha, descricao, unidade, custo in self.conn.execute('''
+            SELECT codigo, hash_linha, descricao, unidade, custo_total FROM composicoes
+            WHERE uf = ? AND regime = ? AND data_referencia = ?
+            ''', (base.uf, base.regime, base.data_referencia))
+        }
+        
+        resumo = ResumoDelta()
+        gravar = set()
+        variacoes = []
+        for codigo, h in hashes.items():
+            atual = existentes.get(codigo)
+            custo = dados.get(codigo, (None, None, 0.0))[2]
+            if atual is None:
+                resumo.adicionados += 1
+            elif (atual[0] != _valor_hash(h)) if com_itens else (atual[1] != dados.get(codigo)):
+                resumo.alterados += 1
+                if atual[1][2] != custo:
+                    variacoes.append((codigo, atual[1][2] or 0.0, custo))
+            else:
+                resumo.inalterados += 1
+                continue
+            gravar.add(codigo)
+        
+        ausentes = [codigo for codigo in existentes if codigo not in hashes] if remover_ausentes else []
+        resumo.removidos = len(ausentes)
+        resumo.maiores_variacoes = _maiores_variacoes(variacoes)
+        
+        # Os itens das composições removidas (e das alteradas, se a planilha os traz) são substituídos
+        substituidas = gravar.union(ausentes) if com_itens else set(ausentes)
+        
+        with self._transacao():
+            self._apagar_itens_composicoes((codigo for codigo in substituidas if codigo in existentes), base)
+            self.conn.executemany(
+                "DELETE FROM composicoes WHERE codigo = ? AND uf = ? AND regime = ? AND data_referencia = ?",
+                [(codigo, base.uf, base.regime, base.data_referencia) for codigo in ausentes]
+            )
+            
+            # Segunda leitura: grava apenas as composições novas ou alteradas
+            for composicoes, itens in obter_lotes():
+                self._gravar_lote_composicoes(
+                    [comp for comp in composicoes if comp[0] in gravar],
+                    None if itens is None else [item for item in itens if item[0] in gravar],
+                    base,
+                    data_atualizacao
+                )
+            
+            if com_itens:
+                self._gravar_hashes_composicoes({codigo: hashes[codigo] for codigo in gravar}, base)
+            self._invalidar_explosoes(substituidas, base)
+            self._atualizar_vocabulario(base)
+        
+        return resumo
+    
+    def _gravar_lote_composicoes(self, composicoes, itens, base, data_atualizacao):
+        """
+        Grava um lote de composições e de itens de composição em uma base
+        
+        As composições são atualizadas no lugar: um lote sem itens (None)
+        mantém o hash do modo delta das que não mudaram e apaga o das que
+        mudaram, para que a próxima planilha com itens as grave de novo.
+        """
+        chave_base = (base.uf, base.regime, base.data_referencia)
+        if composicoes:
+            self.conn.executemany('''
+            INSERT INTO composicoes 
+            (codigo, descricao, unidade, custo_total, uf, regime, data_referencia, origem, data_atualizacao,
+             descricao_norm)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(codigo, uf, regime, data_referencia) DO UPDATE SET
+                descricao = excluded.descricao,
+                descricao_norm = excluded.descricao_norm,
+                unidade = excluded.unidade,
+                custo_total = excluded.custo_total,
+                origem = excluded.origem,
+                data_atualizacao = excluded.data_atualizacao,
+                hash_linha = CASE
+                    WHEN descricao IS excluded.descricao AND unidade IS excluded.unidade
+                        AND custo_total IS excluded.custo_total THEN hash_linha
+                END
+            ''', [
+                comp + chave_base + ('SINAPI', data_atualizacao, normalizar_texto(comp[1]))
+                for comp in composicoes
+            ])
+            self._indexar_busca('composicao', ((comp[0], normalizar_texto(comp[1])) for comp in composicoes))
+        
+        if itens:
+            self.conn.executemany('''
+            INSERT OR REPLACE INTO composicao_insumos 
+            (codigo_composicao, codigo_insumo, coeficiente, uf, regime, data_referencia)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ''', [item + chave_base for item in itens])
+    
     def _verificar_migracoes(self):
             """Verifica e aplica migrações necessárias ao banco de dados"""
             # Verifica se a tabela projetos existe
@@ -334,49 +770,398 @@ class SinapiManager:
                 self.conn.execute("ALTER TABLE projetos ADD COLUMN salvo INTEGER DEFAULT 1")
                 self.conn.commit()
             
+            # Verifica se os itens do orçamento marcam os preços alterados e guardam a base de origem
+            colunas = self._colunas('orcamento_itens')
+            if colunas and 'preco_alterado' not in colunas:
+                print("Aplicando migração: adicionando coluna 'preco_alterado' à tabela 'orcamento_itens'")
+                self.conn.execute("ALTER TABLE orcamento_itens ADD COLUMN preco_alterado INTEGER DEFAULT 0")
+                self.conn.commit()
+            if colunas and 'uf' not in colunas:
+                print("Aplicando migração: base de origem do preço na tabela 'orcamento_itens'")
+                for coluna in ('uf', 'regime', 'data_referencia'):
+                    self.conn.execute(f"ALTER TABLE orcamento_itens ADD COLUMN {coluna} TEXT")
+                self.conn.execute("DROP INDEX IF EXISTS idx_orcamento_itens_codigo")
+                self.conn.commit()
+            self._criar_tabela_orcamento_itens()
+            
+            # Verifica se insumos e composições têm a coluna 'hash_linha' (usada no delta)
+            for tabela in ('insumos', 'composicoes'):
+                colunas = self._colunas(tabela)
+                if colunas and 'hash_linha' not in colunas:
+                    print(f"Aplicando migração: adicionando coluna 'hash_linha' à tabela '{tabela}'")
+                    self.conn.execute(f"ALTER TABLE {tabela} ADD COLUMN hash_linha INTEGER")
+                    self.conn.commit()
+            
+            # Verifica se os preços já são guardados por base (UF, regime, mês)
+            colunas = self._colunas('insumos')
+            if colunas and 'uf' not in colunas:
+                print("Aplicando migração: histórico de preços por UF, regime e mês de referência")
+                self._migrar_para_bases()
+            
+            # Verifica se insumos e composições têm a chave de pesquisa normalizada
+            reindexar = False
+            for tabela in ('insumos', 'composicoes'):
+                colunas = self._colunas(tabela)
+                if colunas and 'descricao_norm' not in colunas:
+                    print(f"Aplicando migração: chave de pesquisa normalizada na tabela '{tabela}'")
+                    with self._transacao():
+                        self.conn.execute(f"ALTER TABLE {tabela} ADD COLUMN descricao_norm TEXT")
+                        self.conn.execute(f"UPDATE {tabela} SET descricao_norm = normalizar_texto(descricao)")
+                        # Substituído pelo índice que também ordena pela descrição
+                        self.conn.execute(f"DROP INDEX IF EXISTS idx_{tabela}_base")
+                    reindexar = True
+            
+            # Cria as tabelas de preços que ainda não existirem
+            self._criar_tabela_insumos()
+            self._criar_tabela_composicoes()
+            self._criar_tabela_composicao_insumos()
+            self._criar_tabela_explosoes()
+            
+            # Cria o índice de busca textual e o vocabulário da correção e os
+            # preenche com o que já foi importado (o índice é refeito se ainda
+            # indexava as descrições originais)
+            # (o vocabulário anterior às contagens por base somava as reimportações)
+            novo_vocabulario = not self._colunas('vocabulario_bases')
+            self._criar_tabela_vocabulario()
+            if reindexar:
+                self.conn.execute("DROP TABLE IF EXISTS busca_textual")
+            if not self._colunas('busca_textual') and self._criar_tabela_busca():
+                print("Aplicando migração: criando o índice de busca textual")
+                self.reconstruir_indice_busca()
+            elif novo_vocabulario:
+                print("Aplicando migração: criando o vocabulário da correção de erros de digitação")
+                self.reconstruir_indice_busca()
+            
             # Adicione outras verificações de migração aqui conforme necessário
         
+    # Insumos, composições e itens guardam o histórico de todas as bases
+    # importadas: a chave é (código, UF, regime, mês de referência). As tabelas
+    # são WITHOUT ROWID, de modo que a própria chave primária é o índice que
+    # cobre a consulta "preço mais recente do código X na base Y"
+    
+    def _colunas(self, tabela):
+        """Nomes das colunas de uma tabela (vazio se a tabela não existe)"""
+        return {linha[1] for linha in self.conn.execute(f"PRAGMA table_info({tabela})")}
+    
+    def _migrar_para_bases(self):
+        """
+        Recria insumos, composições e itens com a chave por base
+        
+        Os dados existentes são mantidos, com o mês de referência que já
+        tinham e UF e regime vazios (não eram registrados).
+        """
+        copias = {
+            'insumos': '''
+            INSERT OR REPLACE INTO insumos
+            (codigo, data_referencia, descricao, unidade, preco_mediano, origem, data_atualizacao, hash_linha,
+             descricao_norm)
+            SELECT codigo, COALESCE(data_referencia, ''), descricao, unidade, preco_mediano,
+                   origem, data_atualizacao, hash_linha, normalizar_texto(descricao)
+            FROM insumos_sem_base
+            WHERE codigo IS NOT NULL
+            ''',
+            'composicoes': '''
+            INSERT OR REPLACE INTO composicoes
+            (codigo, data_referencia, descricao, unidade, custo_total, origem, data_atualizacao, hash_linha,
+             descricao_norm)
+            SELECT codigo, COALESCE(data_referencia, ''), descricao, unidade, custo_total,
+                   origem, data_atualizacao, hash_linha, normalizar_texto(descricao)
+            FROM composicoes_sem_base
+            WHERE codigo IS NOT NULL
+            ''',
+            # Os itens herdam o mês de referência da composição
+            'composicao_insumos': '''
+            INSERT OR REPLACE INTO composicao_insumos
+            (codigo_composicao, data_referencia, codigo_insumo, coeficiente)
+            SELECT ci.codigo_composicao,
+                   COALESCE((SELECT c.data_referencia FROM composicoes c
+                             WHERE c.codigo = ci.codigo_composicao LIMIT 1), ''),
+                   ci.codigo_insumo, ci.coeficiente
+            FROM composicao_insumos_sem_base ci
+            WHERE ci.codigo_composicao IS NOT NULL AND ci.codigo_insumo IS NOT NULL
+            ORDER BY ci.id
+            ''',
+        }
+        
+        with self._transacao():
+            antigas = [tabela for tabela in copias if self._colunas(tabela)]
+            for tabela in antigas:
+                self.conn.execute(f"ALTER TABLE {tabela} RENAME TO {tabela}_sem_base")
+            
+            self._criar_tabela_insumos()
+            self._criar_tabela_composicoes()
+            self._criar_tabela_composicao_insumos()
+            
+            for tabela in antigas:
+                self.conn.execute(copias[tabela])
+            for tabela in antigas:
+                self.conn.execute(f"DROP TABLE {tabela}_sem_base")
+    
     def _criar_tabela_insumos(self):
         """Cria a tabela de insumos"""
         self.conn.execute('''
         CREATE TABLE IF NOT EXISTS insumos (
-            codigo TEXT PRIMARY KEY,
+            codigo TEXT NOT NULL,
+            uf TEXT NOT NULL DEFAULT '',
+            regime TEXT NOT NULL DEFAULT '',
+            data_referencia TEXT NOT NULL DEFAULT '',
             descricao TEXT,
             unidade TEXT,
             preco_mediano REAL,
             origem TEXT,
-            data_referencia TEXT,
-            data_atualizacao TEXT
-        )
+            data_atualizacao TEXT,
+            hash_linha INTEGER,
+            descricao_norm TEXT,  -- chave de pesquisa e ordenação (ver normalizar_texto)
+            PRIMARY KEY (codigo, uf, regime, data_referencia)
+        ) WITHOUT ROWID
+        ''')
+        
+        # Listagem das bases e consultas de uma base em ordem de descrição
+        self.conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_insumos_descricao ON insumos (uf, regime, data_referencia, descricao_norm)
         ''')
     
     def _criar_tabela_composicoes(self):
         """Cria a tabela de composições"""
         self.conn.execute('''
         CREATE TABLE IF NOT EXISTS composicoes (
-            codigo TEXT PRIMARY KEY,
+            codigo TEXT NOT NULL,
+            uf TEXT NOT NULL DEFAULT '',
+            regime TEXT NOT NULL DEFAULT '',
+            data_referencia TEXT NOT NULL DEFAULT '',
             descricao TEXT,
             unidade TEXT,
             custo_total REAL,
             origem TEXT,
-            data_referencia TEXT,
-            data_atualizacao TEXT
-        )
+            data_atualizacao TEXT,
+            hash_linha INTEGER,
+            descricao_norm TEXT,  -- chave de pesquisa e ordenação (ver normalizar_texto)
+            PRIMARY KEY (codigo, uf, regime, data_referencia)
+        ) WITHOUT ROWID
+        ''')
+        
+        self.conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_composicoes_descricao ON composicoes (uf, regime, data_referencia, descricao_norm)
         ''')
     
     def _criar_tabela_composicao_insumos(self):
         """Cria a tabela de relacionamento entre composições e insumos"""
         self.conn.execute('''
         CREATE TABLE IF NOT EXISTS composicao_insumos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            codigo_composicao TEXT,
-            codigo_insumo TEXT,
+            codigo_composicao TEXT NOT NULL,
+            uf TEXT NOT NULL DEFAULT '',
+            regime TEXT NOT NULL DEFAULT '',
+            data_referencia TEXT NOT NULL DEFAULT '',
+            codigo_insumo TEXT NOT NULL,
             coeficiente REAL,
-            FOREIGN KEY (codigo_composicao) REFERENCES composicoes(codigo),
-            FOREIGN KEY (codigo_insumo) REFERENCES insumos(codigo)
-        )
+            PRIMARY KEY (codigo_composicao, uf, regime, data_referencia, codigo_insumo)
+        ) WITHOUT ROWID
+        ''')
+        
+        # A chave primária atende "itens da composição X"; este índice atende o
+        # sentido inverso, "composições que usam o item X" (numa tabela WITHOUT
+        # ROWID o índice já inclui codigo_composicao, então cobre a consulta)
+        self.conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_composicao_insumos_item ON composicao_insumos (codigo_insumo, uf, regime, data_referencia)
         ''')
     
+    def _criar_tabela_explosoes(self):
+        """
+        Cria a tabela com cada composição desdobrada até os insumos
+        
+        Guarda, por base, o coeficiente total de cada item final (insumo ou
+        composição sem itens) em uma unidade da composição, somado por todos
+        os caminhos pelas sub-composições. É preenchida sob demanda (ver
+        _garantir_explosoes) e as linhas de uma composição são apagadas quando
+        os seus itens, ou os de uma sub-composição, mudam.
+        """
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS explosao_composicoes (
+            codigo_composicao TEXT NOT NULL,
+            uf TEXT NOT NULL DEFAULT '',
+            regime TEXT NOT NULL DEFAULT '',
+            data_referencia TEXT NOT NULL DEFAULT '',
+            codigo_item TEXT NOT NULL,
+            coeficiente REAL,
+            PRIMARY KEY (codigo_composicao, uf, regime, data_referencia, codigo_item)
+        ) WITHOUT ROWID
+        ''')
+    
+    def _criar_tabela_busca(self):
+        """
+        Cria o índice de busca textual (FTS5) de insumos e composições
+        
+        Há uma linha por tipo, código e descrição normalizada (ver
+        normalizar_texto), compartilhada por todas as bases que têm a mesma
+        descrição: "tubulacao" encontra "TUBULAÇÃO" e "diametro" encontra
+        "DIAM.". Os prefixos de 2 e 3 letras são indexados para a pesquisa
+        enquanto se digita.
+        
+        Returns:
+            False se o SQLite não tem FTS5 (a pesquisa passa a usar LIKE)
+        """
+        try:
+            self.conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS busca_textual USING fts5(
+                tipo UNINDEXED,  -- 'insumo' ou 'composicao'
+                codigo,
+                descricao_norm,
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '2 3'
+            )
+            ''')
+        except sqlite3.OperationalError as e:
+            print(f"⚠️ Busca textual indisponível ({str(e)}); usando pesquisa simples")
+            self.busca_textual = False
+        
+        return self.busca_textual
+    
+    def _criar_tabela_vocabulario(self):
+        """
+        Cria o vocabulário da correção de erros de digitação
+        
+        Guarda as palavras das descrições normalizadas, com a quantidade de
+        descrições em que aparecem somada entre as bases, e as deleções de
+        cada uma (ver delecoes): as candidatas a correção de uma palavra
+        digitada são as palavras com alguma deleção em comum com ela. A
+        contagem de cada base fica à parte, para ser refeita (e não somada
+        de novo) quando a base é importada outra vez.
+        """
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS vocabulario_busca (
+            palavra TEXT PRIMARY KEY,
+            frequencia INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        ''')
+        
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS vocabulario_bases (
+            uf TEXT,
+            regime TEXT,
+            data_referencia TEXT,
+            palavra TEXT,
+            frequencia INTEGER NOT NULL,
+            PRIMARY KEY (uf, regime, data_referencia, palavra)
+        ) WITHOUT ROWID
+        ''')
+        
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS vocabulario_delecoes (
+            delecao TEXT,
+            palavra TEXT,
+            PRIMARY KEY (delecao, palavra)
+        ) WITHOUT ROWID
+        ''')
+    
+    def _atualizar_vocabulario(self, base):
+        """
+        Refaz a contribuição de uma base ao vocabulário da correção
+        
+        Conta as palavras das descrições de insumos e composições gravadas na
+        base e aplica ao vocabulário só a diferença para a contagem anterior
+        dela; palavras que deixam de aparecer em todas as bases saem do
+        vocabulário, e as novas ganham suas deleções.
+        """
+        chave_base = (base.uf, base.regime, base.data_referencia)
+        frequencias = contar_palavras(linha[0] for linha in self.conn.execute('''
+        SELECT descricao_norm FROM insumos WHERE uf = ? AND regime = ? AND data_referencia = ?
+        UNION ALL
+        SELECT descricao_norm FROM composicoes WHERE uf = ? AND regime = ? AND data_referencia = ?
+        ''', chave_base + chave_base))
+        anteriores = dict(self.conn.execute('''
+        SELECT palavra, frequencia FROM vocabulario_bases WHERE uf = ? AND regime = ? AND data_referencia = ?
+        ''', chave_base))
+        
+        diferencas = {palavra: frequencias[palavra] - anteriores.get(palavra, 0) for palavra in frequencias}
+        diferencas.update({palavra: -n for palavra, n in anteriores.items() if palavra not in frequencias})
+        diferencas = [(palavra, n) for palavra, n in diferencas.items() if n]
+        if not diferencas:
+            return
+        
+        self.conn.execute(
+            "DELETE FROM vocabulario_bases WHERE uf = ? AND regime = ? AND data_referencia = ?", chave_base
+        )
+        self.conn.executemany('''
+        INSERT INTO vocabulario_bases (uf, regime, data_referencia, palavra, frequencia) VALUES (?, ?, ?, ?, ?)
+        ''', (chave_base + item for item in frequencias.items()))
+        
+        novas = [palavra for palavra, _ in diferencas if palavra in frequencias and palavra not in anteriores]
+        existentes = set()
+        for inicio in range(0, len(novas), 500):
+            lote = novas[inicio:inicio + 500]
+            existentes.update(linha[0] for linha in self.conn.execute(
+                f"SELECT palavra FROM vocabulario_busca WHERE palavra IN ({', '.join('?' * len(lote))})", lote
+            ))
+        
+        self.conn.executemany('''
+        INSERT INTO vocabulario_busca (palavra, frequencia) VALUES (?, ?)
+        ON CONFLICT (palavra) DO UPDATE SET frequencia = frequencia + excluded.frequencia
+        ''', diferencas)
+        
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO vocabulario_delecoes (delecao, palavra) VALUES (?, ?)",
+            ((delecao, palavra) for palavra in novas if palavra not in existentes for delecao in delecoes(palavra))
+        )
+        
+        # Palavras que não estão mais em nenhuma base
+        removidas = [
+            palavra for palavra, n in diferencas if n < 0 and self.conn.execute(
+                "SELECT frequencia <= 0 FROM vocabulario_busca WHERE palavra = ?", (palavra,)).fetchone()[0]
+        ]
+        self.conn.executemany("DELETE FROM vocabulario_busca WHERE palavra = ?", ((palavra,) for palavra in removidas))
+        self.conn.executemany(
+            "DELETE FROM vocabulario_delecoes WHERE delecao = ? AND palavra = ?",
+            ((delecao, palavra) for palavra in removidas for delecao in delecoes(palavra))
+        )
+    
+    def _indexar_busca(self, tipo, pares):
+        """Inclui no índice de busca os pares (codigo, descricao_norm) que ainda não estão nele"""
+        if not self.busca_textual:
+            return
+        
+        linhas = []
+        for codigo, descricao_norm in pares:
+            chave = _chave_busca(tipo, codigo, descricao_norm)
+            linhas.append((chave, tipo, codigo, descricao_norm, chave))
+        
+        self.conn.executemany('''
+        INSERT INTO busca_textual (rowid, tipo, codigo, descricao_norm)
+        SELECT ?, ?, ?, ?
+        WHERE NOT EXISTS (SELECT 1 FROM busca_textual WHERE rowid = ?)
+        ''', linhas)
+    
+    def reconstruir_indice_busca(self):
+        """
+        Refaz o índice de busca a partir das tabelas de insumos e composições
+        
+        O índice só recebe inclusões durante as importações; descrições que
+        mudaram ou foram removidas deixam linhas que a pesquisa já ignora,
+        mas que só são descartadas aqui. O vocabulário da correção é refeito
+        junto, base a base.
+        """
+        with self._transacao():
+            self.conn.execute("DELETE FROM vocabulario_busca")
+            self.conn.execute("DELETE FROM vocabulario_delecoes")
+            self.conn.execute("DELETE FROM vocabulario_bases")
+            if self.busca_textual:
+                self.conn.execute("DELETE FROM busca_textual")
+            for tipo, tabela in (('insumo', 'insumos'), ('composicao', 'composicoes')):
+                self._indexar_busca(
+                    tipo, self.conn.execute(f"SELECT DISTINCT codigo, descricao_norm FROM {tabela}").fetchall()
+                )
+            for linha in self.conn.execute('''
+            SELECT uf, regime, data_referencia FROM insumos
+            UNION
+            SELECT uf, regime, data_referencia FROM composicoes
+            ''').fetchall():
+                self._atualizar_vocabulario(BaseSinapi(*linha))
+            if self.busca_textual:
+                self.conn.execute("INSERT INTO busca_textual (busca_textual) VALUES ('optimize')")
+        
+        if not self.busca_textual:
+            return 0
+        return self.conn.execute("SELECT COUNT(*) FROM busca_textual").fetchone()[0]
+    
     def _criar_tabela_projetos(self):
         """Cria a tabela de projetos"""
         self.conn.execute('''
@@ -403,50 +1188,1162 @@ class SinapiManager:
             unidade TEXT,
             quantidade REAL,
             preco_unitario REAL,
+            preco_alterado INTEGER DEFAULT 0,  -- 1: o preço na base de origem mudou (ver aplicar_precos_alterados)
+            uf TEXT,  -- base de origem do preço (NULL: desconhecida)
+            regime TEXT,
+            data_referencia TEXT,
             FOREIGN KEY (projeto_id) REFERENCES projetos(id)
         )
         ''')
+        
+        # Itens que usam um insumo ou composição cujo preço mudou em uma base
+        self.conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_orcamento_itens_base
+        ON orcamento_itens (codigo, tipo, uf, regime, data_referencia)
+        ''')
+    
+    # Métodos essenciais para o funcionamento básico do app
+    
+    def _filtro_base(self, base, alias=''):
+        """
+        Monta o filtro SQL de uma base
+        
+        Campos None na base não restringem a consulta; o mês de referência
+        seleciona a base vigente naquele mês (o mês mais recente até ele).
+        
+        Returns:
+            Tupla (trecho SQL iniciado por AND, parâmetros)
+        """
+        base = base or BaseSinapi()
+        condicoes = []
+        parametros = []
+        for coluna, valor, operador in (('uf', base.uf, '='), ('regime', base.regime, '='),
+                                        ('data_referencia', base.data_referencia, '<=')):
+            if valor is not None:
+                condicoes.append(f"{alias}{coluna} {operador} ?")
+                parametros.append(valor)
+        
+        return ''.join(f" AND {c}" for c in condicoes), parametros
+    
+    def executar_cancelavel(self, funcao, *args, ao_progredir=None, **kwargs):
+        """
+        Executa uma consulta (ex: pesquisar_pagina) de modo cancelável
+        
+        Uma nova chamada, ou cancelar_consulta, interrompe a consulta em
+        andamento; ao_progredir recebe os segundos decorridos enquanto o
+        SQLite trabalha e pode atualizar a interface (ver ExecutorConsultas).
+        
+        Raises:
+            ConsultaCancelada: se a consulta foi cancelada
+            ConsultaOcupada: se foi pedida durante outra consulta (que foi cancelada)
+        """
+        return self.consultas.executar(funcao, *args, ao_progredir=ao_progredir, **kwargs)
+    
+    def cancelar_consulta(self):
+        """Cancela a consulta em andamento (ver executar_cancelavel)"""
+        self.consultas.cancelar()
+    
+    def listar_bases(self):
+        """Lista as bases importadas (UF, regime, mês), das mais recentes para as mais antigas"""
+        if self._bases is None:
+            cursor = self.conn.execute('''
+            SELECT uf, regime, data_referencia FROM insumos
+            UNION
+            SELECT uf, regime, data_referencia FROM composicoes
+            ORDER BY data_referencia DESC, uf, regime
+            ''')
+            self._bases = [BaseSinapi(*linha) for linha in cursor.fetchall()]
+        
+        return list(self._bases)
+    
+    def base_pesquisa(self, base=None):
+        """
+        Escolhe a base importada em que uma pesquisa é feita
+        
+        Campos None não restringem a escolha e o mês de referência seleciona
+        a base vigente naquele mês, como em _filtro_base; entre as bases que
+        atendem, fica a mais recente.
+        
+        Returns:
+            BaseSinapi completa ou None se nenhuma base atender
+        """
+        base = base or BaseSinapi()
+        for candidata in self.listar_bases():
+            if ((base.uf is None or candidata.uf == base.uf)
+                    and (base.regime is None or candidata.regime == base.regime)
+                    and (base.data_referencia is None or candidata.data_referencia <= base.data_referencia)):
+                return candidata
+        return None
+    
+    def pesquisar_insumos(self, termo, base=None, limite=LIMITE_PESQUISA):
+        """
+        Pesquisa insumos por palavras (ou início de palavras) da descrição ou do código
+        
+        Usa o índice de busca textual: maiúsculas e acentos são ignorados e os
+        resultados vêm ordenados por relevância (bm25), com o código pesando
+        mais que a descrição.
+        
+        Args:
+            termo: Texto digitado (ex: "tubo pvc 25")
+            base: BaseSinapi para restringir UF, regime e mês (None: a mais recente)
+            limite: Quantidade máxima de resultados
+        
+        Returns:
+            Lista de (codigo, descricao, unidade, preco_mediano, data_referencia)
+        """
+        return self._pesquisar('insumo', 'insumos', 'preco_mediano', termo, base, limite)
+    
+    def pesquisar_composicoes(self, termo, base=None, limite=LIMITE_PESQUISA):
+        """
+        Pesquisa composições (ver pesquisar_insumos)
+        
+        Returns:
+            Lista de (codigo, descricao, unidade, custo_total, data_referencia)
+        """
+        return self._pesquisar('composicao', 'composicoes', 'custo_total', termo, base, limite)
+    
+    def _pesquisar(self, tipo, tabela, coluna_preco, termo, base, limite):
+        """
+        Pesquisa em uma tabela de preços, passando pelo cache de resultados
+        
+        Uma pesquisa repetida, ou que apenas continua uma já feita ('conc' ->
+        'concr'), é respondida pelo cache enquanto não houver importação.
+        """
+        base = self.base_pesquisa(base)
+        if base is None or not consulta_fts(termo):
+            return []
+        
+        linhas = self.cache_pesquisa.obter(self.geracao, tipo, base, termo, limite)
+        if linhas is None:
+            linhas = self._consultar_pesquisa(tipo, tabela, coluna_preco, termo, base,
+                                              max(limite, RESULTADOS_GUARDADOS) + 1)
+            # Só com o FTS5 o refinamento filtra as linhas exatamente como o banco faria
+            completo = self.busca_textual and len(linhas) <= max(limite, RESULTADOS_GUARDADOS)
+            self.cache_pesquisa.guardar(self.geracao, tipo, base, termo, linhas, completo)
+        
+        return [linha[:-1] for linha in linhas[:limite]]
+    
+    def _consultar_pesquisa(self, tipo, tabela, coluna_preco, termo, base, limite):
+        """
+        Pesquisa no banco pelo índice de busca (ou por LIKE, sem FTS5)
+        
+        O termo é comparado com as chaves normalizadas gravadas na importação;
+        um código digitado por inteiro vem sempre em primeiro lugar.
+        
+        Returns:
+            Lista de (codigo, descricao, unidade, preco, data_referencia, descricao_norm)
+        """
+        consulta = consulta_fts(termo)
+        chave_base = (base.uf, base.regime, base.data_referencia)
+        
+        # Busca exata pela chave primária
+        exato = self.conn.execute(f'''
+        SELECT codigo, descricao, unidade, {coluna_preco}, data_referencia, descricao_norm
+        FROM {tabela}
+        WHERE codigo = ? AND uf = ? AND regime = ? AND data_referencia = ?
+        ''', (termo.strip(),) + chave_base).fetchall()
+        
+        if not self.busca_textual:
+            # O índice (base, descricao_norm) entrega as linhas já em ordem
+            cursor = self.conn.execute(f'''
+            SELECT codigo, descricao, unidade, {coluna_preco}, data_referencia, descricao_norm
+            FROM {tabela}
+            WHERE uf = ? AND regime = ? AND data_referencia = ?
+                AND (descricao_norm LIKE ? OR codigo LIKE ?) AND codigo <> ?
+            ORDER BY descricao_norm
+            LIMIT ?
+            ''', chave_base + (f'%{normalizar_texto(termo)}%', f'{termo.strip()}%', termo.strip(), limite - len(exato)))
+            return exato + cursor.fetchall()
+        
+        # Cada linha do índice leva à linha da base pela chave primária; a
+        # descrição confere que a linha do índice ainda vale para essa base
+        cursor = self.conn.execute(f'''
+        SELECT t.codigo, t.descricao, t.unidade, t.{coluna_preco}, t.data_referencia, t.descricao_norm
+        FROM busca_textual b
+        JOIN {tabela} t ON t.codigo = b.codigo
+            AND t.uf = ? AND t.regime = ? AND t.data_referencia = ?
+            AND t.descricao_norm = b.descricao_norm
+        WHERE busca_textual MATCH ? AND b.tipo = ? AND b.codigo <> ?
+        ORDER BY bm25(busca_textual, {', '.join(map(str, PESOS_BM25))}), t.descricao_norm
+        LIMIT ?
+        ''', chave_base + (consulta, tipo, termo.strip(), limite - len(exato)))
+        
+        return exato + cursor.fetchall()
+    
+    def _ordenar_pesquisa(self, termo, linhas):
+        """
+        Ordena linhas da pesquisa por relevância para o termo, como a consulta ao banco
+        
+        Usado pelo cache ao refinar uma pesquisa: a pontuação bm25 é refeita
+        com as estatísticas do índice (guardadas por geração), de modo que
+        só a contagem de linhas de cada prefixo novo vai ao banco.
+        """
+        if not self.busca_textual:
+            return sorted(linhas, key=lambda linha: linha[-1])
+        
+        if self._estatisticas_busca is None or self._estatisticas_busca[0] != self.geracao:
+            self.conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS temp.busca_vocabulario
+            USING fts5vocab('main', 'busca_textual', 'row')
+            ''')
+            linhas_indice, = self.conn.execute("SELECT COUNT(*) FROM busca_textual").fetchone()
+            palavras, = self.conn.execute("SELECT TOTAL(cnt) FROM temp.busca_vocabulario").fetchone()
+            self._estatisticas_busca = (self.geracao, linhas_indice, palavras / max(linhas_indice, 1), {})
+        _, linhas_indice, media_palavras, acertos = self._estatisticas_busca
+        
+        frases = frases_fts(termo)
+        for frase in frases:
+            if frase not in acertos:
+                acertos[frase], = self.conn.execute(
+                    "SELECT COUNT(*) FROM busca_textual WHERE busca_textual MATCH ?", (f'"{frase}"*',)
+                ).fetchone()
+        
+        return sorted(linhas, key=lambda linha: (
+            bm25(frases, linha[0], linha[-1], linhas_indice, media_palavras, acertos), linha[-1]
+        ))
+    
+    def corrigir_termo(self, termo):
+        """
+        Corrige erros de digitação de um termo pelo vocabulário das descrições
+        
+        Cada palavra que não é o início de nenhuma palavra do vocabulário é
+        trocada pela mais próxima dele (ver melhor_correcao); as candidatas
+        saem das deleções em comum, sem percorrer o vocabulário. Serve para
+        refazer uma pesquisa que não encontrou nada ("argamasa" -> "argamassa").
+        
+        Returns:
+            Termo corrigido ou None se não há o que corrigir
+        """
+        palavras = normalizar_texto(termo).split()
+        corrigidas = []
+        for palavra in palavras:
+            corrigida = palavra
+            if palavra_corrigivel(palavra) and self.conn.execute(
+                    "SELECT 1 FROM vocabulario_busca WHERE palavra >= ? AND palavra < ? LIMIT 1",
+                    (palavra, palavra + '\uffff')).fetchone() is None:
+                chaves = list(delecoes(palavra))
+                candidatas = self.conn.execute(f'''
+                SELECT DISTINCT v.palavra, v.frequencia
+                FROM vocabulario_delecoes d
+                JOIN vocabulario_busca v ON v.palavra = d.palavra
+                WHERE d.delecao IN ({', '.join('?' * len(chaves))})
+                ''', chaves).fetchall()
+                corrigida = melhor_correcao(palavra, candidatas) or palavra
+            corrigidas.append(corrigida)
+        
+        return ' '.join(corrigidas) if corrigidas != palavras else None
+    
+    def pesquisar_pagina(self, tipo, termo, base=None, apos=None, tamanho=TAMANHO_PAGINA):
+        """
+        Pesquisa paginada, para percorrer todos os resultados de um termo
+        
+        As páginas seguem a ordem da chave normalizada da descrição e do
+        código e cada uma começa logo depois da última linha da anterior
+        (paginação por chave, sem OFFSET): o índice (base, descricao_norm)
+        é percorrido a partir dali, e tempo e memória por página não crescem
+        com o número de páginas. Na primeira página, um código digitado por
+        inteiro vem em primeiro lugar.
+        
+        Args:
+            tipo: 'insumo' ou 'composicao'
+            termo: Texto digitado
+            base: BaseSinapi para restringir UF, regime e mês (None: a mais recente)
+            apos: PaginaPesquisa.proxima da página anterior (None: primeira página)
+            tamanho: Quantidade de linhas da página
+        
+        Returns:
+            PaginaPesquisa
+        """
+        tabela, coluna_preco = TABELAS_PESQUISA[tipo]
+        base = self.base_pesquisa(base)
+        if base is None or not consulta_fts(termo):
+            return PaginaPesquisa()
+        
+        chave_base = (base.uf, base.regime, base.data_referencia)
+        codigo = termo.strip()
+        exato = []
+        if apos is None:
+            exato = self.conn.execute(f'''
+            SELECT codigo, descricao, unidade, {coluna_preco}, data_referencia
+            FROM {tabela}
+            WHERE codigo = ? AND uf = ? AND regime = ? AND data_referencia = ?
+            ''', (codigo,) + chave_base).fetchall()
+        
+        if self.busca_textual:
+            filtro = '''(codigo, descricao_norm) IN (
+                    SELECT codigo, descricao_norm FROM busca_textual
+                    WHERE busca_textual MATCH ? AND tipo = ?
+                )'''
+            parametros = (consulta_fts(termo), tipo)
+        else:
+            filtro = '(descricao_norm LIKE ? OR codigo LIKE ?)'
+            parametros = (f'%{normalizar_texto(termo)}%', f'{codigo}%')
+        
+        # As chaves da página saem só do índice (base, descricao_norm); as
+        # demais colunas são lidas apenas para as linhas da página. Uma linha
+        # a mais indica se há outra página.
+        restantes = max(tamanho - len(exato), 0)
+        linhas = self.conn.execute(f'''
+        SELECT t.codigo, t.descricao, t.unidade, t.{coluna_preco}, t.data_referencia, t.descricao_norm
+        FROM (
+            SELECT codigo, uf, regime, data_referencia
+            FROM {tabela}
+            WHERE uf = ? AND regime = ? AND data_referencia = ?
+                AND (descricao_norm, codigo) > (?, ?) AND codigo <> ?
+                AND {filtro}
+            ORDER BY descricao_norm, codigo
+            LIMIT ?
+        ) p
+        JOIN {tabela} t USING (codigo, uf, regime, data_referencia)
+        ORDER BY t.descricao_norm, t.codigo
+        ''', chave_base + tuple(apos or ('', '')) + (codigo,) + parametros + (restantes + 1,)).fetchall()
+        
+        pagina = PaginaPesquisa(exato + [linha[:-1] for linha in linhas[:restantes]])
+        if len(linhas) > restantes:
+            pagina.proxima = (linhas[restantes - 1][-1], linhas[restantes - 1][0]) if restantes else apos or ('', '')
+        
+        if apos is None:
+            if pagina.proxima is None:
+                pagina.estimativa = len(pagina.linhas)
+            elif self.busca_textual:
+                # O índice de busca é comum a todas as bases: a contagem é um
+                # limite superior, mas sai direto das listas do FTS5
+                pagina.estimativa = self.conn.execute(
+                    "SELECT count(*) FROM busca_textual WHERE busca_textual MATCH ? AND tipo = ?",
+                    (consulta_fts(termo), tipo)
+                ).fetchone()[0]
+        
+        return pagina
+    
+    def carregar_indices_pesquisa(self, base):
+        """
+        Monta os índices em memória da pesquisa enquanto se digita (ver IndiceTrigramas)
+        
+        Usa uma conexão própria, de modo que pode rodar em uma thread separada
+        sem segurar a interface; a base deve ser uma base já resolvida (ver
+        base_pesquisa).
+        
+        Returns:
+            Dicionário 'insumo'/'composicao' -> IndiceTrigramas
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            indices = {}
+            for tipo, (tabela, coluna_preco) in TABELAS_PESQUISA.items():
+                # Em ordem de descrição, pelo índice da base
+                cursor = conn.execute(f'''
+                SELECT codigo, descricao, unidade, {coluna_preco}, data_referencia
+                FROM {tabela}
+                WHERE uf = ? AND regime = ? AND data_referencia = ?
+                ORDER BY descricao_norm
+                ''', (base.uf, base.regime, base.data_referencia))
+                indices[tipo] = IndiceTrigramas(cursor)
+            return indices
+        finally:
+            conn.close()
+    
+    def corresponder_planilha(self, arquivo, base=None, top=TOP_CANDIDATOS, max_processos=None, ao_aguardar=None):
+        """
+        Encontra os itens SINAPI que correspondem às linhas de uma planilha de quantitativos
+        
+        Insumos e composições da base são comparados com a descrição livre de
+        cada linha (ver database.correspondencia), em vários processos.
+        
+        Args:
+            arquivo: Planilha do cliente (XLSX ou CSV) com uma coluna de descrição
+            base: BaseSinapi para restringir UF, regime e mês (None: a mais recente)
+            top: Quantidade de candidatos por linha
+            max_processos: Número máximo de processos (padrão: até o nº de CPUs)
+            ao_aguardar: Função chamada periodicamente enquanto espera (ex: atualizar a interface)
+        
+        Returns:
+            Lista de Correspondencia (vazia se não há base importada)
+        """
+        linhas = ler_planilha_cliente(arquivo)
+        base = self.base_pesquisa(base)
+        if base is None or not linhas:
+            return []
+        
+        entradas = []
+        for tipo, (tabela, coluna_preco) in TABELAS_PESQUISA.items():
+            entradas += self.conn.execute(f'''
+            SELECT ?, codigo, descricao, unidade, {coluna_preco}, descricao_norm
+            FROM {tabela}
+            WHERE uf = ? AND regime = ? AND data_referencia = ?
+            ''', (tipo, base.uf, base.regime, base.data_referencia)).fetchall()
+        
+        inicio = time.perf_counter()
+        correspondencias = corresponder(entradas, linhas, top, max_processos, ao_aguardar)
+        print(f"✅ {len(linhas)} linhas comparadas com {len(entradas)} itens da base {base} "
+              f"({time.perf_counter() - inicio:.1f}s)")
+        return correspondencias
+    
+    def obter_insumo(self, codigo, base=None):
+        """
+        Obtém um insumo pelo código
+        
+        Args:
+            codigo: Código SINAPI do insumo
+            base: BaseSinapi para restringir UF, regime e mês (None: a mais recente)
+        
+        Returns:
+            (codigo, descricao, unidade, preco_mediano, uf, regime, data_referencia) ou None
+        """
+        filtro, parametros = self._filtro_base(base)
+        cursor = self.conn.execute(f'''
+        SELECT codigo, descricao, unidade, preco_mediano, uf, regime, data_referencia
+        FROM insumos
+        WHERE codigo = ?{filtro}
+        ORDER BY data_referencia DESC
+        LIMIT 1
+        ''', [str(codigo).strip()] + parametros)
+        
+        return cursor.fetchone()
+    
+    def obter_composicao(self, codigo, base=None):
+        """
+        Obtém uma composição pelo código (ver obter_insumo)
+        
+        Returns:
+            (codigo, descricao, unidade, custo_total, uf, regime, data_referencia) ou None
+        """
+        filtro, parametros = self._filtro_base(base)
+        cursor = self.conn.execute(f'''
+        SELECT codigo, descricao, unidade, custo_total, uf, regime, data_referencia
+        FROM composicoes
+        WHERE codigo = ?{filtro}
+        ORDER BY data_referencia DESC
+        LIMIT 1
+        ''', [str(codigo).strip()] + parametros)
+        
+        return cursor.fetchone()
+    
+    def obter_itens_composicao(self, codigo_composicao, base=None):
+        """
+        Obtém todos os itens de uma composição
+        
+        Os itens e seus preços vêm da mesma base da composição encontrada.
+        
+        Returns:
+            Lista de (codigo, descricao, unidade, coeficiente, preco)
+        """
+        composicao = self.obter_composicao(codigo_composicao, base)
+        if composicao is None:
+            return []
+        
+        cursor = self.conn.execute('''
+        SELECT 
+            ci.codigo_insumo, 
+            COALESCE(i.descricao, c.descricao) as descricao, 
+            COALESCE(i.unidade, c.unidade) as unidade, 
+            ci.coeficiente,
+            COALESCE(i.preco_mediano, c.custo_total) as preco 
+        FROM composicao_insumos ci
+        LEFT JOIN insumos i ON i.codigo = ci.codigo_insumo
+            AND i.uf = ci.uf AND i.regime = ci.regime AND i.data_referencia = ci.data_referencia
+        LEFT JOIN composicoes c ON c.codigo = ci.codigo_insumo
+            AND c.uf = ci.uf AND c.regime = ci.regime AND c.data_referencia = ci.data_referencia
+        WHERE ci.codigo_composicao = ? AND ci.uf = ? AND ci.regime = ? AND ci.data_referencia = ?
+        ''', (codigo_composicao,) + tuple(composicao[4:]))
+        
+        return cursor.fetchall()
+    
+    def composicoes_que_usam(self, codigo, base=None, transitivo=True):
+        """
+        Obtém as composições que usam um insumo (ou uma composição auxiliar)
+        
+        Com transitivo, inclui as composições que usam o item por meio de
+        sub-composições, em qualquer nível. Sem base, usa a mais recente em
+        que o item aparece em alguma composição.
+        
+        Args:
+            codigo: Código SINAPI do insumo ou da composição
+            base: BaseSinapi para restringir UF, regime e mês (None: a mais recente)
+            transitivo: Se False, só as composições que usam o item diretamente
+        
+        Returns:
+            Lista de (codigo, descricao, unidade, custo_total, nivel, coeficiente,
+            custo_item), ordenada por nível e código; nivel é 1 para uso direto,
+            coeficiente é a quantidade do item em uma unidade da composição,
+            somada por todos os caminhos, e custo_item é a parte do custo da
+            composição que vem do item (coeficiente x preço do item)
+        """
+        # A base mais recente em que o item é usado (o índice inverso atende)
+        codigo = str(codigo).strip()
+        filtro, parametros = self._filtro_base(base)
+        chave_base = self.conn.execute(f'''
+        SELECT uf, regime, data_referencia
+        FROM composicao_insumos
+        WHERE codigo_insumo = ?{filtro}
+        ORDER BY data_referencia DESC
+        LIMIT 1
+        ''', [codigo] + parametros).fetchone()
+        if chave_base is None:
+            return []
+        
+        chave_base = tuple(chave_base)
+        niveis = NIVEIS_COMPOSICAO if transitivo else 1
+        cursor = self.conn.execute('''
+        WITH RECURSIVE uso (codigo, coeficiente, nivel) AS (
+            SELECT codigo_composicao, COALESCE(coeficiente, 0), 1
+            FROM composicao_insumos
+            WHERE codigo_insumo = ? AND uf = ? AND regime = ? AND data_referencia = ?
+            UNION ALL
+            SELECT ci.codigo_composicao, uso.coeficiente * COALESCE(ci.coeficiente, 0), uso.nivel + 1
+            FROM uso
+            JOIN composicao_insumos ci ON ci.codigo_insumo = uso.codigo
+                AND ci.uf = ? AND ci.regime = ? AND ci.data_referencia = ?
+            WHERE uso.nivel < ?
+        )
+        SELECT uso.codigo, c.descricao, c.unidade, c.custo_total, MIN(uso.nivel), SUM(uso.coeficiente),
+            SUM(uso.coeficiente) * (
+                SELECT COALESCE(
+                    (SELECT preco_mediano FROM insumos WHERE codigo = ? AND uf = ? AND regime = ? AND data_referencia = ?),
+                    (SELECT custo_total FROM composicoes WHERE codigo = ? AND uf = ? AND regime = ? AND data_referencia = ?)
+                )
+            )
+        FROM uso
+        LEFT JOIN composicoes c ON c.codigo = uso.codigo
+            AND c.uf = ? AND c.regime = ? AND c.data_referencia = ?
+        GROUP BY uso.codigo
+        ORDER BY 5, 1
+        ''', ((codigo,) + chave_base + chave_base + (niveis,)
+              + (codigo,) + chave_base + (codigo,) + chave_base + chave_base))
+        
+        return cursor.fetchall()
+    
+    def grafo_composicoes(self, base=None):
+        """
+        Obtém o grafo de dependência das composições de uma base
+        
+        O grafo é montado na primeira chamada e guardado até a próxima
+        gravação de preços.
+        
+        Args:
+            base: BaseSinapi (None: a mais recente; ver base_pesquisa)
+        
+        Returns:
+            Tupla (BaseSinapi, GrafoComposicoes) ou (None, None) se nenhuma base atender
+        
+        Raises:
+            CicloComposicoes: se alguma composição da base depende de si mesma
+        """
+        base = self.base_pesquisa(base)
+        if base is None:
+            return None, None
+        
+        guardado = self._grafos.get(base)
+        if guardado is not None and guardado[0] == self.geracao:
+            return base, guardado[1]
+        
+        chave_base = (base.uf, base.regime, base.data_referencia)
+        filtro = "WHERE uf = ? AND regime = ? AND data_referencia = ?"
+        grafo = GrafoComposicoes(
+            self.conn.execute(f"SELECT codigo, custo_total FROM composicoes {filtro}", chave_base),
+            self.conn.execute(f"SELECT codigo, preco_mediano FROM insumos {filtro}", chave_base),
+            self.conn.execute(f'''
+            SELECT codigo_composicao, codigo_insumo, coeficiente FROM composicao_insumos {filtro}
+            ''', chave_base)
+        )
+        self._grafos[base] = (self.geracao, grafo)
+        return base, grafo
     
-    # --- Métodos para importação de dados ---
+    def recalcular_custos(self, base=None, gravar=False):
+        """
+        Recalcula o custo de todas as composições a partir dos preços dos insumos
+        
+        Args:
+            base: BaseSinapi (None: a mais recente; ver base_pesquisa)
+            gravar: Se True, grava os custos recalculados em composicoes
+        
+        Returns:
+            Lista de (codigo, custo da planilha, custo recalculado) das
+            composições cujo custo muda
+        
+        Raises:
+            CicloComposicoes: se alguma composição da base depende de si mesma
+        """
+        base, grafo = self.grafo_composicoes(base)
+        if grafo is None:
+            return []
+        
+        custos = grafo.calcular()
+        mudaram = np.flatnonzero(np.abs(custos - grafo.custos) > TOLERANCIA_CUSTO)
+        alteracoes = list(zip(grafo.codigos_composicoes[mudaram].tolist(),
+                              grafo.custos[mudaram].tolist(),
+                              custos[mudaram].tolist()))
+        
+        if gravar and alteracoes:
+            with self._transacao():
+                self.conn.executemany('''
+                UPDATE composicoes SET custo_total = ?
+                WHERE codigo = ? AND uf = ? AND regime = ? AND data_referencia = ?
+                ''', [(custo, codigo, base.uf, base.regime, base.data_referencia)
+                      for codigo, _, custo in alteracoes])
+            
+            # O grafo continua valendo, agora com os custos gravados
+            grafo.custos[mudaram] = custos[mudaram]
+            self._grafos[base] = (self.geracao, grafo)
+            print(f"✅ Custo de {len(alteracoes)} composições recalculado na base {base}")
+        
+        return alteracoes
     
-    def importar_insumos(self, arquivo_excel, aba='insumos', mes_ref=None):
-        """Importa insumos do Excel SINAPI"""
-        if not mes_ref:
-            mes_ref = datetime.now().strftime("%Y-%m")
+    def atualizar_precos_insumos(self, precos, base=None):
+        """
+        Altera o preço de insumos e propaga a mudança
+        
+        Só as composições que dependem dos insumos (direta ou indiretamente)
+        são recalculadas. Os itens de orçamento da mesma base que usam os
+        insumos ou essas composições só são marcados como alterados; o novo
+        preço entra no orçamento com aplicar_precos_alterados.
+        
+        Args:
+            precos: Dicionário código do insumo -> novo preço
+            base: BaseSinapi (None: a mais recente; ver base_pesquisa)
+        
+        Returns:
+            Lista de ImpactoProjeto dos projetos afetados, do maior para o menor impacto
+        """
+        base = self.base_pesquisa(base)
+        if base is None or not precos:
+            return []
+        
+        data_atualizacao = datetime.now().strftime("%Y-%m-%d")
+        chave_base = (base.uf, base.regime, base.data_referencia)
+        
+        with self._transacao():
+            alterados = {}
+            for codigo, preco in precos.items():
+                codigo = str(codigo).strip()
+                atual = self.conn.execute('''
+                SELECT preco_mediano FROM insumos
+                WHERE codigo = ? AND uf = ? AND regime = ? AND data_referencia = ?
+                ''', (codigo,) + chave_base).fetchone()
+                if atual is None:
+                    continue
+                self.conn.execute('''
+                UPDATE insumos SET preco_mediano = ?, data_atualizacao = ?
+                WHERE codigo = ? AND uf = ? AND regime = ? AND data_referencia = ?
+                ''', (preco, data_atualizacao, codigo) + chave_base)
+                alterados[codigo] = (atual[0] or 0.0, preco)
             
-        print(f"Importando insumos de {arquivo_excel}...")
+            grafo, impactos = self._propagar_precos(base, alterados)
         
-        # O resto do código segue igual...
-        # (Omitindo por brevidade, mas seria o mesmo método da classe original)
+        if grafo is not None:
+            self._grafos[base] = (self.geracao, grafo)
+        print(f"✅ Preço de {len(alterados)} insumos atualizado na base {base}; "
+              f"{len(impactos)} projetos afetados")
+        return impactos
     
-    # Métodos essenciais para o funcionamento básico do app
+    def _propagar_precos(self, base, precos):
+        """
+        Propaga novos preços de insumos às composições e aos itens de orçamento
+        
+        O custo gravado de cada composição afetada recebe só a variação
+        causada pelos novos preços (ver GrafoComposicoes.propagar): o custo
+        publicado pelo SINAPI é mantido e continua batendo com os preços dos
+        insumos da base. Os itens de orçamento são apenas marcados (ver
+        _marcar_itens_orcamento).
+        
+        Deve ser chamado dentro da transação que gravou os preços; o grafo da
+        base sai do cache, porque só vale depois do commit.
+        
+        Args:
+            base: BaseSinapi completa em que os preços mudaram
+            precos: Dicionário código do insumo -> (preço anterior, novo preço)
+        
+        Returns:
+            Tupla (GrafoComposicoes atualizado ou None, lista de ImpactoProjeto)
+        """
+        novos_precos = [('insumo', codigo, novo) for codigo, (_, novo) in precos.items()]
+        
+        try:
+            base, grafo = self.grafo_composicoes(base)
+        except CicloComposicoes as e:
+            print(f"⚠️ Custo das composições não propagado: {str(e)}")
+            base, grafo = None, None
+        
+        if grafo is not None:
+            self._grafos.pop(base, None)
+            posicoes = [(grafo.posicao_insumo(codigo), antigo or 0.0, novo or 0.0)
+                        for codigo, (antigo, novo) in precos.items()]
+            posicoes = [linha for linha in posicoes if linha[0] is not None]
+            insumos = np.array([linha[0] for linha in posicoes], dtype=np.int64)
+            
+            # Montado dentro da transação, o grafo já leu os preços novos; a
+            # propagação parte dos anteriores
+            grafo.precos_insumos[insumos] = [linha[1] for linha in posicoes]
+            afetadas, anteriores = grafo.propagar(insumos, np.array([linha[2] for linha in posicoes], dtype=np.float64))
+            
+            mudaram = np.abs(grafo.custos[afetadas] - anteriores) > TOLERANCIA_CUSTO
+            composicoes = list(zip(grafo.codigos_composicoes[afetadas[mudaram]].tolist(),
+                                   grafo.custos[afetadas[mudaram]].tolist()))
+            self.conn.executemany('''
+            UPDATE composicoes SET custo_total = ?
+            WHERE codigo = ? AND uf = ? AND regime = ? AND data_referencia = ?
+            ''', [(custo, codigo, base.uf, base.regime, base.data_referencia) for codigo, custo in composicoes])
+            novos_precos += [('composicao', codigo, custo) for codigo, custo in composicoes]
+            print(f"♻️ {len(composicoes)} composições recalculadas na base {base}")
+        
+        return grafo, self._marcar_itens_orcamento(novos_precos, base)
     
-    def _criar_arquivo_temporario(self, arquivo_original):
-        """Cria uma cópia temporária do arquivo"""
-        # Cria um arquivo temporário com o mesmo nome, mas em um diretório temporário
-        temp_dir = tempfile.gettempdir()
-        nome_arquivo = os.path.basename(arquivo_original)
-        temp_path = os.path.join(temp_dir, f"temp_{datetime.now().strftime('%Y%m%d%H%M%S')}_{nome_arquivo}")
+    def _marcar_itens_orcamento(self, novos_precos, base):
+        """
+        Marca os itens de orçamento da base cujo preço ficou diferente do novo
         
-        # Copia o arquivo
-        shutil.copy2(arquivo_original, temp_path)
+        O preço dos itens não muda: só itens cuja base de origem é a base
+        alterada são marcados (preco_alterado = 1), e os que voltaram ao preço
+        da base são desmarcados. Itens sem base de origem não são marcados.
         
-        # Adiciona à lista de arquivos temporários para limpeza posterior
-        self.temp_files.append(temp_path)
+        Args:
+            novos_precos: Lista de (tipo, codigo, preco)
+            base: BaseSinapi completa em que os preços mudaram
+        
+        Returns:
+            Lista de ImpactoProjeto (total atual e total com os novos preços),
+            do maior para o menor impacto
+        """
+        chave_base = (base.uf, base.regime, base.data_referencia)
+        self.conn.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS novos_precos (
+            tipo TEXT, codigo TEXT, preco REAL,
+            PRIMARY KEY (codigo, tipo)
+        ) WITHOUT ROWID
+        ''')
+        self.conn.execute("DELETE FROM novos_precos")
+        self.conn.executemany("INSERT OR REPLACE INTO novos_precos VALUES (?, ?, ?)", novos_precos)
+        
+        # CROSS: percorre os preços novos, não os itens
+        itens = self.conn.execute('''
+        SELECT oi.id, oi.projeto_id, COALESCE(oi.quantidade, 0), COALESCE(oi.preco_unitario, 0), n.preco,
+            abs(COALESCE(oi.preco_unitario, 0) - n.preco) > ?
+        FROM novos_precos n
+        CROSS JOIN orcamento_itens oi ON oi.codigo = n.codigo AND oi.tipo = n.tipo
+            AND oi.uf = ? AND oi.regime = ? AND oi.data_referencia = ?
+        ''', (TOLERANCIA_CUSTO,) + chave_base).fetchall()
+        self.conn.execute("DELETE FROM novos_precos")
+        
+        self.conn.executemany(
+            "UPDATE orcamento_itens SET preco_alterado = ? WHERE id = ?",
+            [(int(alterado), item[0]) for *item, alterado in itens]
+        )
+        itens = [item[:5] for item in itens if item[5]]
+        if not itens:
+            return []
         
-        return temp_path
+        # Totais atuais dos projetos afetados; os novos somam a diferença dos itens
+        projetos = sorted({item[1] for item in itens})
+        impactos = {
+            projeto_id: ImpactoProjeto(projeto_id, nome, total or 0.0, total or 0.0)
+            for projeto_id, nome, total in self.conn.execute(f'''
+            SELECT p.id, p.nome, SUM(oi.quantidade * oi.preco_unitario)
+            FROM projetos p
+            LEFT JOIN orcamento_itens oi ON oi.projeto_id = p.id
+            WHERE p.id IN ({", ".join("?" * len(projetos))})
+            GROUP BY p.id
+            ''', projetos)
+        }
+        for _, projeto_id, quantidade, anterior, novo in itens:
+            impacto = impactos.get(projeto_id)
+            if impacto is not None:
+                impacto.total_novo += quantidade * (novo - anterior)
+                impacto.itens_alterados += 1
+        
+        return sorted(impactos.values(), key=lambda impacto: abs(impacto.variacao), reverse=True)
     
-    def limpar_arquivos_temporarios(self):
-        """Limpa os arquivos temporários criados"""
-        for file in self.temp_files:
-            try:
-                if os.path.exists(file):
-                    os.remove(file)
-                    print(f"Arquivo temporário removido: {file}")
-            except Exception as e:
-                print(f"Erro ao remover arquivo temporário {file}: {str(e)}")
+    def aplicar_precos_alterados(self, projeto_id):
+        """
+        Grava nos itens marcados de um projeto o preço atual da sua base de origem
+        
+        Args:
+            projeto_id: ID do projeto
+        
+        Returns:
+            Quantidade de itens atualizados
+        """
+        with self._transacao():
+            cursor = self.conn.execute('''
+            UPDATE orcamento_itens
+            SET preco_unitario = COALESCE(
+                    CASE tipo
+                        WHEN 'insumo' THEN (
+                            SELECT i.preco_mediano FROM insumos i
+                            WHERE i.codigo = orcamento_itens.codigo AND i.uf = orcamento_itens.uf
+                                AND i.regime = orcamento_itens.regime
+                                AND i.data_referencia = orcamento_itens.data_referencia)
+                        ELSE (
+                            SELECT c.custo_total FROM composicoes c
+                            WHERE c.codigo = orcamento_itens.codigo AND c.uf = orcamento_itens.uf
+                                AND c.regime = orcamento_itens.regime
+                                AND c.data_referencia = orcamento_itens.data_referencia)
+                    END,
+                    preco_unitario),
+                preco_alterado = 0
+            WHERE projeto_id = ? AND preco_alterado = 1
+            ''', (projeto_id,))
+        return cursor.rowcount
+    
+    def simular_cenarios(self, cenarios, projetos=None, base=None):
+        """
+        Calcula o total de projetos em vários cenários de preços de uma vez
+        
+        Os itens dos projetos são desdobrados em insumos pelo grafo das
+        composições e cada cenário é uma coluna da matriz de multiplicadores
+        dos preços (ver GrafoComposicoes.avaliar). Itens que não estão na base
+        entram com o preço do orçamento em todos os cenários.
+        
+        Args:
+            cenarios: Lista de Cenario (ver também combinacoes)
+            projetos: IDs dos projetos (None: todos)
+            base: BaseSinapi dos preços (None: a mais recente; ver base_pesquisa)
+        
+        Returns:
+            ResultadoCenarios, com o cenário base (preços da base) em primeiro
+        
+        Raises:
+            CicloComposicoes: se alguma composição da base depende de si mesma
+        """
+        base, grafo = self.grafo_composicoes(base)
+        if grafo is None:
+            return ResultadoCenarios()
+        
+        resultado = ResultadoCenarios(cenarios=["Base"] + [cenario.nome for cenario in cenarios])
+        
+        # Um multiplicador por insumo e cenário (1 onde o cenário não mexe)
+        multiplicadores = np.ones((grafo.n_insumos, len(cenarios) + 1))
+        for coluna, cenario in enumerate(cenarios, start=1):
+            for chave, fator in cenario.fatores.items():
+                insumos = self._insumos_do_fator(grafo, base, chave)
+                if not len(insumos) and chave not in resultado.sem_correspondencia:
+                    resultado.sem_correspondencia.append(chave)
+                multiplicadores[insumos, coluna] *= fator
+        
+        filtro = f"WHERE id IN ({', '.join('?' * len(projetos))})" if projetos is not None else ""
+        resultado.projetos = self.conn.execute(
+            f"SELECT id, nome FROM projetos {filtro} ORDER BY id", list(projetos or [])
+        ).fetchall()
+        if not resultado.projetos:
+            return resultado
+        
+        demanda, fora_da_base = self._demanda_projetos(grafo, [projeto_id for projeto_id, _ in resultado.projetos])
+        fixos = np.zeros(len(resultado.projetos))
+        for coluna, _, _, _, _, quantidade, preco in fora_da_base:
+            fixos[coluna] += quantidade * preco
+        
+        resultado.totais = (grafo.avaliar(demanda, multiplicadores) + fixos[:, None]).tolist()
+        if resultado.sem_correspondencia:
+            print(f"⚠️ Fatores sem insumo correspondente: {', '.join(resultado.sem_correspondencia)}")
+        return resultado
+    
+    def _demanda_projetos(self, grafo, projetos):
+        """
+        Quantidade de cada vértice do grafo nos itens de orçamento de projetos
+        
+        Args:
+            grafo: GrafoComposicoes da base
+            projetos: IDs dos projetos (um por coluna da demanda)
+        
+        Returns:
+            Tupla (array vértices x projetos, lista dos itens fora da base como
+            (coluna, tipo, codigo, descricao, unidade, quantidade, preco))
+        """
+        colunas = {projeto_id: coluna for coluna, projeto_id in enumerate(projetos)}
+        demanda = np.zeros((grafo.n_insumos + grafo.n_composicoes, len(colunas)))
+        if not colunas:
+            return demanda, []
+        
+        itens = self.conn.execute(f'''
+        SELECT projeto_id, tipo, codigo, descricao, unidade, COALESCE(quantidade, 0), COALESCE(preco_unitario, 0)
+        FROM orcamento_itens
+        WHERE projeto_id IN ({', '.join('?' * len(colunas))})
+        ''', list(colunas)).fetchall()
+        if not itens:
+            return demanda, []
+        
+        vertices = grafo.vertices([item[1] for item in itens], [item[2] for item in itens])
+        coluna = np.array([colunas[item[0]] for item in itens])
+        quantidades = np.array([item[5] for item in itens], dtype=np.float64)
+        na_base = vertices >= 0
+        np.add.at(demanda, (vertices[na_base], coluna[na_base]), quantidades[na_base])
+        
+        fora_da_base = [(colunas[item[0]],) + tuple(item[1:]) for item, dentro in zip(itens, na_base.tolist()) if not dentro]
+        return demanda, fora_da_base
+    
+    def _garantir_explosoes(self, codigos, base):
+        """
+        Preenche o desdobramento das composições que ainda não estão em explosao_composicoes
+        
+        As composições são preenchidas de baixo para cima, um nível do grafo
+        da base por vez (ver GrafoComposicoes.niveis): o desdobramento de uma
+        composição soma os itens dela, com cada sub-composição trocada pelo
+        seu desdobramento já guardado. Sub-composições que ainda não estavam
+        na tabela são preenchidas junto. Como no grafo, um código que é insumo
+        e composição é tratado como insumo; composições sem itens guardam a si
+        mesmas com coeficiente 1, de modo que toda composição da base
+        desdobrada tenha linhas na tabela.
+        
+        Args:
+            codigos: Códigos das composições
+            base: BaseSinapi completa
+        
+        Raises:
+            CicloComposicoes: se alguma composição da base depende de si mesma
+        """
+        codigos = {str(codigo) for codigo in codigos}
+        if not codigos:
+            return
+        
+        _, grafo = self.grafo_composicoes(base)
+        posicoes = [grafo.posicao_composicao(codigo) for codigo in codigos]
+        posicoes = grafo.descendentes([posicao for posicao in posicoes if posicao is not None])
+        
+        # Das composições envolvidas, as que ainda não estão guardadas (só leitura)
+        chave_base = (base.uf, base.regime, base.data_referencia)
+        envolvidas = grafo.codigos_composicoes[posicoes].tolist()
+        guardadas = set()
+        for inicio in range(0, len(envolvidas), 500):
+            lote = envolvidas[inicio:inicio + 500]
+            guardadas.update(linha[0] for linha in self.conn.execute(f'''
+            SELECT DISTINCT codigo_composicao FROM explosao_composicoes
+            WHERE codigo_composicao IN ({', '.join('?' * len(lote))}) AND uf = ? AND regime = ? AND data_referencia = ?
+            ''', lote + list(chave_base)))
+        
+        pendentes = [posicao for posicao in posicoes.tolist()
+                     if str(grafo.codigos_composicoes[posicao]) not in guardadas]
+        if not pendentes:
+            return
+        
+        pendentes = np.array(pendentes, dtype=np.int64)
+        pendentes = pendentes[np.argsort(grafo.niveis[pendentes], kind='stable')]
+        niveis = grafo.niveis[pendentes]
+        limites = np.flatnonzero(np.diff(niveis, prepend=-1, append=-1) != 0)
+        
+        # É só um cache dos itens: não muda preços, então mantém a geração
+        # (e com ela o grafo e as pesquisas guardadas)
+        with self._transacao(invalidar=False):
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS explosao_pendentes (codigo TEXT PRIMARY KEY) WITHOUT ROWID")
+            for a, b in zip(limites[:-1], limites[1:]):
+                self.conn.executemany("INSERT INTO explosao_pendentes VALUES (?)",
+                                      ((codigo,) for codigo in grafo.codigos_composicoes[pendentes[a:b]].tolist()))
+                
+                # Os níveis abaixo já estão guardados
+                self.conn.execute('''
+                INSERT INTO explosao_composicoes
+                    (codigo_composicao, uf, regime, data_referencia, codigo_item, coeficiente)
+                SELECT p.codigo, ?, ?, ?, COALESCE(e.codigo_item, ci.codigo_insumo) AS item,
+                    SUM(COALESCE(ci.coeficiente, 0) * COALESCE(e.coeficiente, 1))
+                FROM explosao_pendentes p
+                JOIN composicao_insumos ci ON ci.codigo_composicao = p.codigo
+                    AND ci.uf = ? AND ci.regime = ? AND ci.data_referencia = ?
+                LEFT JOIN explosao_composicoes e ON e.codigo_composicao = ci.codigo_insumo
+                    AND e.uf = ? AND e.regime = ? AND e.data_referencia = ?
+                    AND NOT EXISTS (SELECT 1 FROM insumos i WHERE i.codigo = ci.codigo_insumo
+                                    AND i.uf = ? AND i.regime = ? AND i.data_referencia = ?)
+                GROUP BY p.codigo, item
+                ''', chave_base * 4)
+                
+                self.conn.execute('''
+                INSERT INTO explosao_composicoes
+                    (codigo_composicao, uf, regime, data_referencia, codigo_item, coeficiente)
+                SELECT p.codigo, ?, ?, ?, p.codigo, 1.0
+                FROM explosao_pendentes p
+                WHERE NOT EXISTS (SELECT 1 FROM composicao_insumos ci WHERE ci.codigo_composicao = p.codigo
+                                  AND ci.uf = ? AND ci.regime = ? AND ci.data_referencia = ?)
+                ''', chave_base * 2)
+                self.conn.execute("DELETE FROM explosao_pendentes")
+    
+    def _consultar_explosao(self, demanda, base):
+        """
+        Soma a quantidade de cada insumo na demanda desdobrada
+        
+        Args:
+            demanda: Sequência de (tipo, codigo, quantidade) de itens da base
+            base: BaseSinapi completa
+        
+        Returns:
+            Lista de (tipo, codigo, descricao, unidade, quantidade, preco, total);
+            itens desdobrados cujo código não existe na base não entram
+        
+        Raises:
+            CicloComposicoes: se alguma composição da base depende de si mesma
+        """
+        demanda = [(tipo, str(codigo), quantidade) for tipo, codigo, quantidade in demanda]
+        chave_base = (base.uf, base.regime, base.data_referencia)
+        try:
+            self._garantir_explosoes((codigo for tipo, codigo, _ in demanda if tipo == 'composicao'), base)
+        except ConsultaOcupada:
+            # Durante uma consulta cancelável não se grava: desdobra pelo grafo, sem o cache
+            totais = '''
+        totais (codigo, quantidade) AS (
+            SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]') FROM json_each(?)
+        )'''
+            parametros = (json.dumps(self._explodir_pelo_grafo(demanda, base)),)
+        else:
+            # A demanda vai como JSON; CROSS JOIN: parte dela (poucas linhas) e usa a chave primária do cache
+            totais = '''
+        demanda (tipo, codigo, quantidade) AS (
+            SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]'), json_extract(value, '$[2]')
+            FROM json_each(?)
+        ),
+        quantidades (codigo, quantidade) AS (
+            SELECT codigo, quantidade FROM demanda WHERE tipo = 'insumo'
+            UNION ALL
+            SELECT e.codigo_item, d.quantidade * e.coeficiente
+            FROM demanda d
+            CROSS JOIN explosao_composicoes e ON e.codigo_composicao = d.codigo
+                AND e.uf = ? AND e.regime = ? AND e.data_referencia = ?
+            WHERE d.tipo = 'composicao'
+        ),
+        totais (codigo, quantidade) AS (
+            SELECT codigo, SUM(quantidade) FROM quantidades GROUP BY codigo
+        )'''
+            parametros = (json.dumps(demanda),) + chave_base
+        
+        linhas = self.conn.execute(f'''
+        WITH {totais}
+        SELECT
+            CASE WHEN i.codigo IS NOT NULL THEN 'insumo' ELSE 'composicao' END,
+            t.codigo,
+            COALESCE(i.descricao, c.descricao, ''),
+            COALESCE(i.unidade, c.unidade, ''),
+            t.quantidade,
+            COALESCE(CASE WHEN i.codigo IS NOT NULL THEN i.preco_mediano ELSE c.custo_total END, 0)
+        FROM totais t
+        LEFT JOIN insumos i ON i.codigo = t.codigo AND i.uf = ? AND i.regime = ? AND i.data_referencia = ?
+        LEFT JOIN composicoes c ON c.codigo = t.codigo AND c.uf = ? AND c.regime = ? AND c.data_referencia = ?
+        WHERE (i.codigo IS NOT NULL OR c.codigo IS NOT NULL) AND t.quantidade != 0
+        ''', parametros + chave_base * 2).fetchall()
+        
+        return [linha + (linha[4] * linha[5],) for linha in linhas]
+    
+    def _explodir_pelo_grafo(self, demanda, base):
+        """
+        Desdobra uma demanda pelo grafo da base, sem ler nem gravar explosao_composicoes
+        
+        Returns:
+            Lista de (codigo, quantidade) dos insumos e das composições sem itens
+        """
+        _, grafo = self.grafo_composicoes(base)
+        vertices = grafo.vertices([item[0] for item in demanda], [item[1] for item in demanda])
+        quantidades = np.array([item[2] or 0.0 for item in demanda], dtype=np.float64)
+        vetor = np.zeros(grafo.n_insumos + grafo.n_composicoes)
+        np.add.at(vetor, vertices[vertices >= 0], quantidades[vertices >= 0])
+        
+        explodida = grafo.explodir(vetor)
+        codigos = np.concatenate([grafo.codigos_insumos, grafo.codigos_composicoes])
+        return [(str(codigos[v]), float(explodida[v])) for v in np.flatnonzero(explodida).tolist()]
+    
+    def explodir_orcamento(self, projeto_id, base=None):
+        """
+        Desdobra o orçamento de um projeto nos insumos (relatório de insumos)
+        
+        Cada composição é lida já desdobrada de explosao_composicoes
+        (preenchida na primeira vez) e as quantidades de cada insumo somadas
+        em todo o orçamento. Composições sem itens e itens que não estão na
+        base aparecem como estão.
+        
+        Args:
+            projeto_id: ID do projeto
+            base: BaseSinapi dos preços (None: a mais recente; ver base_pesquisa)
+        
+        Returns:
+            Lista de (tipo, codigo, descricao, unidade, quantidade, preco, total),
+            do maior para o menor total
+        
+        Raises:
+            CicloComposicoes: se alguma composição da base depende de si mesma
+        """
+        base = self.base_pesquisa(base)
+        if base is None:
+            return []
+        chave_base = (base.uf, base.regime, base.data_referencia)
+        
+        itens = self.conn.execute('''
+        SELECT oi.tipo, oi.codigo, oi.descricao, oi.unidade,
+            COALESCE(oi.quantidade, 0), COALESCE(oi.preco_unitario, 0),
+            CASE oi.tipo
+                WHEN 'insumo' THEN EXISTS (SELECT 1 FROM insumos i WHERE i.codigo = oi.codigo
+                                           AND i.uf = ? AND i.regime = ? AND i.data_referencia = ?)
+                ELSE EXISTS (SELECT 1 FROM composicoes c WHERE c.codigo = oi.codigo
+                             AND c.uf = ? AND c.regime = ? AND c.data_referencia = ?)
+            END
+        FROM orcamento_itens oi
+        WHERE oi.projeto_id = ?
+        ''', chave_base * 2 + (projeto_id,)).fetchall()
+        
+        linhas = self._consultar_explosao(
+            ((item[0], item[1], item[4]) for item in itens if item[6]), base)
+        for tipo, codigo, descricao, unidade, quantidade, preco, na_base in itens:
+            if not na_base:
+                linhas.append((tipo, codigo, descricao, unidade, quantidade, preco, quantidade * preco))
+        
+        linhas.sort(key=lambda linha: linha[6], reverse=True)
+        return linhas
+    
+    def obter_explosao_composicao(self, codigo, base=None):
+        """
+        Desdobra uma composição nos insumos ("ver composição")
+        
+        Args:
+            codigo: Código da composição
+            base: BaseSinapi (None: a mais recente; ver base_pesquisa)
+        
+        Returns:
+            Lista de (tipo, codigo, descricao, unidade, coeficiente, preco, total)
+            por unidade da composição, do maior para o menor total (vazia se a
+            composição não estiver na base)
+        
+        Raises:
+            CicloComposicoes: se alguma composição da base depende de si mesma
+        """
+        base = self.base_pesquisa(base)
+        if base is None:
+            return []
+        
+        linhas = self._consultar_explosao([('composicao', codigo, 1.0)], base)
+        linhas.sort(key=lambda linha: linha[6], reverse=True)
+        return linhas
+    
+    def curva_abc_orcamento(self, projeto_id, insumos=False, limites=LIMITES_ABC, base=None):
+        """
+        Curva ABC de um projeto
+        
+        Args:
+            projeto_id: ID do projeto
+            insumos: False para os itens do orçamento (serviços), True para os
+                insumos do orçamento desdobrado (ver explodir_orcamento)
+            limites: (limite A, limite B) em percentual acumulado
+            base: BaseSinapi do desdobramento (None: a mais recente)
+        
+        Returns:
+            CurvaABC (totais sem BDI)
+        
+        Raises:
+            ValueError: se os limites forem inválidos
+        """
+        validar_limites(limites)
+        if insumos:
+            linhas = self.explodir_orcamento(projeto_id, base)
+        else:
+            linhas = self.conn.execute('''
+            SELECT tipo, codigo, descricao, unidade, quantidade, preco_unitario
+            FROM orcamento_itens
+            WHERE projeto_id = ?
+            ORDER BY id
+            ''', (projeto_id,)).fetchall()
+        return curva_abc(linhas, limites)
+    
+    def _insumos_do_fator(self, grafo, base, chave):
+        """Posições dos insumos de uma chave de Cenario.fatores (código ou termo de pesquisa)"""
+        posicao = grafo.posicao_insumo(chave)
+        if posicao is not None:
+            return np.array([posicao], dtype=np.int64)
         
-        self.temp_files = []
+        if not consulta_fts(chave):
+            return np.zeros(0, dtype=np.int64)
+        linhas = self._consultar_pesquisa('insumo', 'insumos', 'preco_mediano', chave, base, grafo.n_insumos)
+        posicoes = (grafo.posicao_insumo(linha[0]) for linha in linhas)
+        return np.array([posicao for posicao in posicoes if posicao is not None], dtype=np.int64)
     
     def listar_projetos(self):
             """Lista todos os projetos cadastrados de forma robusta"""
@@ -497,8 +2394,7 @@ class SinapiManager:
         return cursor.lastrowid
         
     def fechar(self):
-        """Fecha a conexão com o banco de dados e limpa arquivos temporários"""
-        self.limpar_arquivos_temporarios()
+        """Fecha a conexão com o banco de dados"""
         if self.conn:
             self.conn.close()
             print("Conexão com o banco fechada.")
\ No newline at end of file
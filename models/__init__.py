@@ -2,4 +2,4 @@
 """
 Modelos de dados do OrçaFácil
 """
-from models.projeto import Projeto, Insumo, Composicao, ItemComposicao, ItemOrcamento
\ No newline at end of file
+from models.projeto import Projeto, Insumo, Composicao, ItemComposicao, ItemOrcamento, ResumoDelta, ImpactoProjeto, BaseSinapi, PaginaPesquisa, Cenario, ResultadoCenarios, CurvaABC
\ No newline at end of file
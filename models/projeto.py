@@ -5,9 +5,21 @@
 Modelos de dados para o OrçaFácil
 """
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Tuple, Union
+
+
+@dataclass(frozen=True)
+class BaseSinapi:
+    """Identifica uma base de preços do SINAPI (UF, regime de desoneração e mês)"""
+    uf: Optional[str] = None
+    regime: Optional[str] = None  # 'desonerado' ou 'nao_desonerado'
+    data_referencia: Optional[str] = None  # 'YYYY-MM'
+    
+    def __str__(self) -> str:
+        partes = [self.uf, self.data_referencia, (self.regime or "").replace("_", " ")]
+        return " ".join(p for p in partes if p) or "base não informada"
 
 
 @dataclass
@@ -20,6 +32,8 @@ class Insumo:
     origem: str = "SINAPI"
     data_referencia: str = ""
     data_atualizacao: str = ""
+    uf: str = ""
+    regime: str = ""
 
 
 @dataclass
@@ -33,6 +47,8 @@ class Composicao:
     origem: str = "SINAPI"
     data_referencia: str = ""
     data_atualizacao: str = ""
+    uf: str = ""
+    regime: str = ""
 
 
 @dataclass
@@ -105,4 +121,117 @@ class Projeto:
             bdi=row[5],
             salvo=bool(row[6]),
             itens=[]
-        )
\ No newline at end of file
+        )
+
+
+@dataclass
+class ImpactoProjeto:
+    """Efeito de uma mudança de preços no total (sem BDI) de um projeto, se aplicada aos itens"""
+    projeto_id: int
+    nome: str
+    total_anterior: float
+    total_novo: float
+    itens_alterados: int = 0
+    
+    @property
+    def variacao(self) -> float:
+        """Diferença entre o total novo e o anterior"""
+        return self.total_novo - self.total_anterior
+    
+    def __str__(self) -> str:
+        percentual = f" ({self.variacao / self.total_anterior * 100:+.1f}%)" if self.total_anterior else ""
+        return (f"{self.nome}: R$ {self.total_anterior:.2f} → R$ {self.total_novo:.2f}{percentual}, "
+                f"{self.itens_alterados} itens alterados")
+
+
+@dataclass
+class ResumoDelta:
+    """Resumo de uma importação incremental (delta)"""
+    adicionados: int = 0
+    alterados: int = 0
+    removidos: int = 0
+    inalterados: int = 0
+    # (codigo, preco_antigo, preco_novo), das maiores para as menores variações
+    maiores_variacoes: List[Tuple[str, float, float]] = field(default_factory=list)
+    # Projetos com itens marcados por terem o preço diferente do novo preço da base
+    projetos_afetados: List[ImpactoProjeto] = field(default_factory=list)
+    
+    @property
+    def gravados(self) -> int:
+        """Quantidade de linhas efetivamente escritas no banco"""
+        return self.adicionados + self.alterados + self.removidos
+    
+    def __str__(self) -> str:
+        texto = (f"{self.adicionados} novos, {self.alterados} alterados, "
+                 f"{self.removidos} removidos, {self.inalterados} inalterados")
+        for codigo, antigo, novo in self.maiores_variacoes[:5]:
+            variacao = f" ({(novo - antigo) / antigo * 100:+.1f}%)" if antigo else ""
+            texto += f"\n  {codigo}: R$ {antigo:.2f} → R$ {novo:.2f}{variacao}"
+        for impacto in self.projetos_afetados:
+            texto += f"\n  Projeto {impacto}"
+        return texto
+
+
+@dataclass
+class PaginaPesquisa:
+    """Uma página de resultados da pesquisa paginada"""
+    # (codigo, descricao, unidade, preco, data_referencia), em ordem de descrição
+    linhas: List[Tuple[str, str, str, float, str]] = field(default_factory=list)
+    # Posição (descricao_norm, codigo) a partir da qual vem a próxima página; None na última
+    proxima: Optional[Tuple[str, str]] = None
+    # Total aproximado de resultados (só na primeira página; None se desconhecido)
+    estimativa: Optional[int] = None
+
+
+@dataclass
+class Cenario:
+    """Cenário de preços: multiplicadores aplicados aos preços dos insumos"""
+    nome: str
+    # Código do insumo, ou termo de pesquisa que seleciona todos os insumos
+    # encontrados (ex: "vergalhao", "servente"), -> multiplicador do preço
+    fatores: Dict[str, float] = field(default_factory=dict)
+    
+    def __add__(self, outro: "Cenario") -> "Cenario":
+        """Combina dois cenários (os fatores de uma mesma chave se multiplicam)"""
+        fatores = dict(self.fatores)
+        for chave, fator in outro.fatores.items():
+            fatores[chave] = fatores.get(chave, 1.0) * fator
+        return Cenario(f"{self.nome} + {outro.nome}", fatores)
+
+
+@dataclass
+class ResultadoCenarios:
+    """Totais (sem BDI) de projetos em vários cenários de preços"""
+    # Nomes dos cenários; o primeiro é o cenário base, com os preços da base
+    cenarios: List[str] = field(default_factory=list)
+    # (id, nome) de cada projeto
+    projetos: List[Tuple[int, str]] = field(default_factory=list)
+    # totais[i][j]: total do projeto i no cenário j
+    totais: List[List[float]] = field(default_factory=list)
+    # Chaves dos fatores que não correspondem a nenhum insumo da base
+    sem_correspondencia: List[str] = field(default_factory=list)
+    
+    def variacoes(self, projeto: int) -> List[float]:
+        """Variação percentual do total do i-ésimo projeto em cada cenário, em relação ao base"""
+        totais = self.totais[projeto]
+        return [(total / totais[0] - 1) * 100 if totais[0] else 0.0 for total in totais]
+
+
+@dataclass
+class CurvaABC:
+    """Curva ABC: itens do maior para o menor total, com o percentual acumulado e a classe"""
+    # Percentuais acumulados que fecham as classes A e B (o restante é C)
+    limites: Tuple[float, float] = (80.0, 95.0)
+    # (tipo, codigo, descricao, unidade, quantidade, preco, total, participacao %,
+    # acumulado %, classe), do maior para o menor total
+    linhas: List[Tuple[str, str, str, str, float, float, float, float, float, str]] = field(default_factory=list)
+    total: float = 0.0
+    
+    def resumo(self) -> Dict[str, Tuple[int, float, float]]:
+        """(quantidade de itens, total, participação %) de cada classe"""
+        resumo = {}
+        for classe in "ABC":
+            totais = [linha[6] for linha in self.linhas if linha[9] == classe]
+            soma = sum(totais)
+            resumo[classe] = (len(totais), soma, soma / self.total * 100 if self.total else 0.0)
+        return resumo
@@ -0,0 +1,26 @@
+"""Fixtures dos testes do OrçaFácil"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.sinapi import SinapiManager
+from models import BaseSinapi
+from tests.sintetica import gravar_base
+
+
+@pytest.fixture
+def base():
+    return BaseSinapi('SP', 'desonerado', '2024-05')
+
+
+@pytest.fixture
+def db(tmp_path, base):
+    """Banco novo com a base sintética gravada"""
+    gerenciador = SinapiManager(str(tmp_path / 'teste.db'), diretorio_cache=str(tmp_path / 'cache'))
+    gravar_base(gerenciador, base)
+    yield gerenciador
+    gerenciador.fechar()
@@ -0,0 +1,115 @@
+"""
+Base sintética dos testes do OrçaFácil
+
+A base sintética tem poucas composições, com custos que batem com os
+itens, de modo que os resultados podem ser conferidos à mão:
+
+    C1 = 2 I1 + 1 I2                  = 25
+    C2 = 0,5 C1 + 3 I3                = 18,5
+    C3 = 2 C2 + 1 C1 + 0,1 I4         = 72   (C1 chega por dois caminhos)
+    C4 sem itens                      = 100
+    C5 = 2 C4 + 1 I1                  = 210
+"""
+
+import numpy as np
+from openpyxl import Workbook
+
+from database.custos import GrafoComposicoes
+
+INSUMOS = {'I1': 10.0, 'I2': 5.0, 'I3': 2.0, 'I4': 100.0}
+
+ITENS = [
+    ('C1', 'I1', 2.0), ('C1', 'I2', 1.0),
+    ('C2', 'C1', 0.5), ('C2', 'I3', 3.0),
+    ('C3', 'C2', 2.0), ('C3', 'C1', 1.0), ('C3', 'I4', 0.1),
+    ('C5', 'C4', 2.0), ('C5', 'I1', 1.0),
+]
+
+CUSTOS = {'C1': 25.0, 'C2': 18.5, 'C3': 72.0, 'C4': 100.0, 'C5': 210.0}
+
+# Cabeçalhos das planilhas oficiais de composições (ver database/layouts.py)
+SINTETICO = [
+    'DESCRICAO DA CLASSE', 'SIGLA DA CLASSE', 'DESCRICAO DO TIPO 1', 'SIGLA DO TIPO 1',
+    'CODIGO DO AGRUPADOR', 'DESCRICAO DO AGRUPADOR', 'CODIGO  DA COMPOSICAO', 'DESCRICAO DA COMPOSICAO',
+    'UNIDADE', 'ORIGEM DE PREÇO', 'CUSTO TOTAL', 'VINCULO',
+]
+ANALITICO = [
+    'DESCRICAO DA CLASSE', 'SIGLA DA CLASSE', 'DESCRICAO DO TIPO 1', 'SIGLA DO TIPO 1',
+    'CODIGO DO AGRUPADOR', 'DESCRICAO DO AGRUPADOR', 'CODIGO  DA COMPOSICAO', 'DESCRICAO DA COMPOSICAO',
+    'UNIDADE', 'ORIGEM DE PREÇO', 'CUSTO TOTAL', 'TIPO ITEM', 'CODIGO ITEM', 'DESCRIÇÃO ITEM',
+    'UNIDADE ITEM', 'ORIGEM DE PREÇO ITEM', 'COEFICIENTE', 'PRECO UNITARIO', 'CUSTO TOTAL ITEM',
+    'CUSTO MAO DE OBRA', '%MAO DE OBRA', 'CUSTO MATERIAL', '%MATERIAL', 'CUSTO EQUIPAMENTO',
+    '%EQUIPAMENTO', 'CUSTO SERVICOS TERCEIROS', '%SERVICOS TERCEIROS', 'CUSTOS OUTROS', '%OUTROS', 'VINCULO',
+]
+
+
+def gravar_base(db, base, insumos=INSUMOS, custos=CUSTOS, itens=ITENS):
+    """Grava insumos, composições e itens em uma base"""
+    chave_base = (base.uf, base.regime, base.data_referencia)
+    with db._transacao():
+        db.conn.executemany('''
+        INSERT INTO insumos (codigo, descricao, unidade, preco_mediano, uf, regime, data_referencia)
+        VALUES (?, ?, 'UN', ?, ?, ?, ?)
+        ''', [(codigo, f"INSUMO {codigo}", preco) + chave_base for codigo, preco in insumos.items()])
+    db._gravar_composicoes(
+        [([(codigo, f"COMPOSICAO {codigo}", 'UN', custo) for codigo, custo in custos.items()], list(itens))],
+        base
+    )
+
+
+def criar_projeto(db, itens, base):
+    """Cria um projeto com itens (tipo, codigo, quantidade, preco) cuja base de origem é base"""
+    projeto_id = db.criar_projeto("Obra de teste")
+    db.conn.executemany('''
+    INSERT INTO orcamento_itens (projeto_id, tipo, codigo, quantidade, preco_unitario, uf, regime, data_referencia)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(projeto_id,) + tuple(item) + (base.uf, base.regime, base.data_referencia) for item in itens])
+    db.conn.commit()
+    return projeto_id
+
+
+def grafo_aleatorio(semente, n_insumos=40, n_composicoes=60, itens_por_composicao=4):
+    """
+    Grafo acíclico aleatório: a composição k só usa insumos e composições
+    anteriores a ela; os custos gravados batem com os itens
+    """
+    rng = np.random.default_rng(semente)
+    insumos = [(f"I{i}", float(rng.uniform(1, 100))) for i in range(n_insumos)]
+    itens = []
+    for k in range(n_composicoes):
+        candidatos = [f"I{i}" for i in range(n_insumos)] + [f"C{j}" for j in range(k)]
+        for codigo in rng.choice(candidatos, size=min(itens_por_composicao, len(candidatos)), replace=False):
+            itens.append((f"C{k}", str(codigo), float(rng.uniform(0.1, 3))))
+    grafo = GrafoComposicoes([(f"C{k}", 0.0) for k in range(n_composicoes)], insumos, itens)
+    grafo.custos[:] = grafo.calcular()
+    return grafo, rng
+
+
+def planilha_composicoes(caminho, custos=CUSTOS, itens=ITENS, descricoes=None):
+    """
+    Grava a base sintética em uma planilha de composições no layout oficial
+
+    Com itens, a planilha é a analítica (uma linha da composição seguida de
+    uma linha por item); sem itens (None), a sintética.
+    """
+    descricoes = descricoes or {}
+    cabecalho = SINTETICO if itens is None else ANALITICO
+    wb = Workbook()
+    ws = wb.active
+    ws.title = 'Composicoes'
+    ws.append(["PCI.818.01 - Custo de Composições"])
+    ws.append([])
+    ws.append([])
+    ws.append(cabecalho)
+    for codigo, custo in custos.items():
+        linha = dict.fromkeys(cabecalho)
+        linha.update({
+            'CODIGO  DA COMPOSICAO': codigo, 'DESCRICAO DA COMPOSICAO': descricoes.get(codigo, f"COMPOSICAO {codigo}"),
+            'UNIDADE': 'UN', 'CUSTO TOTAL': custo,
+        })
+        ws.append(list(linha.values()))
+        for composicao, item, coeficiente in itens or ():
+            if composicao == codigo:
+                ws.append(list(dict(linha, **{'CODIGO ITEM': item, 'COEFICIENTE': coeficiente}).values()))
+    wb.save(caminho)
+    return str(caminho)
@@ -0,0 +1,87 @@
+"""Testes da pesquisa no banco e do cache de resultados (database/busca.py)"""
+
+import pandas as pd
+import pytest
+
+from models import BaseSinapi
+
+DESCRICOES = {
+    'P1': 'CONCRETO MAGRO COM CONEXAO, CONEXAO E CONE',
+    'P2': 'CONCRETO CONCRETO USINADO',
+    'P3': 'CONCRETO BOMBEADO FCK 30 MPA, COM LANCAMENTO, ADENSAMENTO E ACABAMENTO',
+    'P4': 'CONEXAO PVC',
+}
+
+
+@pytest.fixture
+def pesquisa(db, base):
+    descricoes = dict(DESCRICOES, **{f"T{i}": f"TIJOLO CERAMICO {i} FUROS" for i in range(20)})
+    db._gravar_insumos([pd.DataFrame({
+        'codigo': list(descricoes), 'descricao': list(descricoes.values()),
+        'unidade': 'UN', 'preco_mediano': 1.0,
+    })], base)
+    if not db.busca_textual:
+        pytest.skip("SQLite sem FTS5")
+    return db
+
+
+def _codigos(linhas):
+    return [linha[0] for linha in linhas]
+
+
+def test_refinamento_reordena_pela_relevancia_do_novo_termo(pesquisa, base, monkeypatch):
+    anterior = _codigos(pesquisa.pesquisar_insumos('con', base))
+    esperado = _codigos(pesquisa._consultar_pesquisa('insumo', 'insumos', 'preco_mediano', 'concr', base, 100))
+    assert [codigo for codigo in anterior if codigo in esperado] != esperado
+
+    def sem_banco(*args):
+        raise AssertionError("o refinamento deveria vir do cache")
+    monkeypatch.setattr(pesquisa, '_consultar_pesquisa', sem_banco)
+
+    assert _codigos(pesquisa.pesquisar_insumos('concr', base)) == esperado
+
+
+def test_pesquisa_repetida_vem_do_cache(pesquisa, base, monkeypatch):
+    primeira = pesquisa.pesquisar_insumos('tijolo', base)
+    monkeypatch.setattr(pesquisa, '_consultar_pesquisa', lambda *args: [])
+    assert pesquisa.pesquisar_insumos('TIJOLO ', base) == primeira
+
+
+def _vocabulario(db):
+    return dict(db.conn.execute("SELECT palavra, frequencia FROM vocabulario_busca"))
+
+
+def _lote(descricoes):
+    return pd.DataFrame({
+        'codigo': list(descricoes), 'descricao': list(descricoes.values()),
+        'unidade': 'UN', 'preco_mediano': 1.0,
+    })
+
+
+def test_reimportacao_nao_soma_o_vocabulario_de_novo(pesquisa, base):
+    vocabulario = _vocabulario(pesquisa)
+    assert vocabulario['concreto'] == 3
+
+    pesquisa._gravar_insumos([_lote(DESCRICOES)], base)
+    pesquisa._gravar_insumos_delta([_lote(DESCRICOES)], base)
+
+    assert _vocabulario(pesquisa) == vocabulario
+    assert pesquisa.reconstruir_indice_busca() and _vocabulario(pesquisa) == vocabulario
+
+
+def test_vocabulario_soma_as_bases_e_esquece_palavras_removidas(pesquisa, base):
+    outra = BaseSinapi('RJ', base.regime, base.data_referencia)
+    pesquisa._gravar_insumos([_lote({'P2': DESCRICOES['P2']})], outra)
+    assert _vocabulario(pesquisa)['concreto'] == 4
+    assert _vocabulario(pesquisa)['usinado'] == 2
+
+    pesquisa._gravar_insumos_delta([_lote({'P4': DESCRICOES['P4']})], outra, remover_ausentes=True)
+
+    vocabulario = _vocabulario(pesquisa)
+    assert vocabulario['concreto'] == 3 and vocabulario['usinado'] == 1 and vocabulario['conexao'] == 3
+    assert pesquisa.corrigir_termo('usinadu') == 'usinado'
+
+    pesquisa._gravar_insumos_delta([_lote({'P4': 'TUBO PVC'})], base, remover_ausentes=True)
+    assert 'usinado' not in _vocabulario(pesquisa)
+    assert pesquisa.conn.execute(
+        "SELECT COUNT(*) FROM vocabulario_delecoes WHERE palavra = 'usinado'").fetchone()[0] == 0
@@ -0,0 +1,66 @@
+"""Testes da simulação de cenários de preços"""
+
+import numpy as np
+import pytest
+
+from database.custos import combinacoes
+from models import Cenario
+from tests.sintetica import CUSTOS, INSUMOS, ITENS, criar_projeto, grafo_aleatorio
+
+
+def custo(codigo, precos):
+    """Custo de um código recalculado recursivamente com os preços dados"""
+    if codigo in precos:
+        return precos[codigo]
+    itens = [(item, coeficiente) for pai, item, coeficiente in ITENS if pai == codigo]
+    if not itens:
+        return CUSTOS[codigo]
+    return sum(coeficiente * custo(item, precos) for item, coeficiente in itens)
+
+
+def total(itens, cenario):
+    """Total de itens (tipo, codigo, quantidade, preco) com os preços do cenário"""
+    precos = {codigo: preco * cenario.fatores.get(codigo, 1.0) for codigo, preco in INSUMOS.items()}
+    return sum(quantidade * custo(codigo, precos) for _, codigo, quantidade, _ in itens)
+
+
+def test_avaliar_igual_ao_calculo_por_cenario():
+    grafo, rng = grafo_aleatorio(3)
+    demanda = np.zeros((grafo.n_insumos + grafo.n_composicoes, 2))
+    demanda[grafo.n_insumos + rng.choice(grafo.n_composicoes, 10, replace=False), 0] = rng.uniform(1, 10, 10)
+    demanda[rng.choice(grafo.n_insumos, 5, replace=False), 1] = rng.uniform(1, 10, 5)
+    multiplicadores = rng.uniform(0.5, 1.5, size=(grafo.n_insumos, 4))
+
+    custos = grafo.avaliar(demanda, multiplicadores)
+
+    for j in range(multiplicadores.shape[1]):
+        valores = np.concatenate([grafo.precos_insumos * multiplicadores[:, j],
+                                  grafo.calcular(grafo.precos_insumos * multiplicadores[:, j])])
+        np.testing.assert_allclose(custos[:, j], demanda.T @ valores, rtol=1e-12)
+
+
+def test_simular_cenarios_igual_ao_recalculo_por_cenario(db, base):
+    itens = [('composicao', 'C3', 10.0, 72.0), ('composicao', 'C5', 2.0, 210.0), ('insumo', 'I2', 4.0, 5.0)]
+    projeto_id = criar_projeto(db, itens, base)
+    cenarios = [Cenario("Aço", {'I1': 1.25}), Cenario("Mão de obra", {'I3': 0.8, 'I4': 1.1})]
+    cenarios += combinacoes(cenarios)
+
+    resultado = db.simular_cenarios(cenarios, [projeto_id], base)
+
+    esperados = [total(itens, cenario) for cenario in [Cenario("Base")] + cenarios]
+    assert resultado.cenarios == ["Base", "Aço", "Mão de obra", "Aço + Mão de obra"]
+    assert resultado.totais[0] == pytest.approx(esperados)
+    assert resultado.variacoes(0)[1] == pytest.approx((esperados[1] / esperados[0] - 1) * 100)
+
+
+def test_item_fora_da_base_fica_com_o_preco_do_orcamento(db, base):
+    projeto_id = criar_projeto(db, [('composicao', 'PROPRIA', 1.0, 500.0), ('insumo', 'I1', 1.0, 10.0)], base)
+    resultado = db.simular_cenarios([Cenario("Aço", {'I1': 2.0})], [projeto_id], base)
+    assert resultado.totais[0] == pytest.approx([510.0, 520.0])
+
+
+def test_fator_sem_insumo_correspondente(db, base):
+    projeto_id = criar_projeto(db, [('insumo', 'I1', 1.0, 10.0)], base)
+    resultado = db.simular_cenarios([Cenario("Inexistente", {'NAO-EXISTE': 2.0})], [projeto_id], base)
+    assert resultado.sem_correspondencia == ['NAO-EXISTE']
+    assert resultado.totais[0] == pytest.approx([10.0, 10.0])
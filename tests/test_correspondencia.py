@@ -0,0 +1,138 @@
+"""Testes da correspondência em lote com o SINAPI (database/correspondencia.py)"""
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from database import correspondencia
+from database.busca import normalizar_texto
+from database.correspondencia import (
+    Correspondencia,
+    IndiceCorrespondencia,
+    LinhaCliente,
+    corresponder,
+    exportar_correspondencias,
+    ler_planilha_cliente,
+)
+from database.planilhas import PlanilhaInvalida
+
+DESCRICOES = [
+    ('composicao', 'C1', 'ALVENARIA DE VEDACAO DE BLOCOS CERAMICOS FURADOS', 'M2', 80.0),
+    ('composicao', 'C2', 'ALVENARIA DE VEDACAO DE BLOCOS DE CONCRETO', 'M2', 90.0),
+    ('composicao', 'C3', 'CONCRETO FCK 25 MPA, PREPARO MECANICO', 'M3', 500.0),
+    ('insumo', 'I1', 'BLOCO CERAMICO FURADO 9 X 19 X 19 CM', 'UN', 1.5),
+    ('insumo', 'I2', 'CIMENTO PORTLAND CP II-32', 'KG', 0.8),
+    ('insumo', 'I3', 'PORTA DE MADEIRA', 'UN', 300.0),
+    ('composicao', 'C4', 'PORTA DE MADEIRA', 'CJ', 450.0),
+] + [('insumo', f"X{i}", f"TUBO PVC SOLDAVEL {i} MM", 'M', 10.0 + i) for i in range(60)]
+
+
+@pytest.fixture
+def entradas():
+    return [entrada + (normalizar_texto(entrada[2]),) for entrada in DESCRICOES]
+
+
+def _codigos(candidatos):
+    return [candidato.codigo for candidato in candidatos]
+
+
+def test_candidatos_em_ordem_de_similaridade(entradas):
+    indice = IndiceCorrespondencia(entradas)
+    # Todas as palavras estão em C1 e C2; C2 tem menos palavras que não estão na linha
+    candidatos = indice.candidatos(LinhaCliente(1, "Alvenaria de vedação de blocos"))
+
+    assert _codigos(candidatos) == ['C2', 'C1']
+    assert [c.pontuacao for c in candidatos] == sorted((c.pontuacao for c in candidatos), reverse=True)
+    assert all(0 < c.pontuacao <= 1 for c in candidatos)
+
+
+def test_palavras_raras_restringem_os_candidatos(entradas):
+    indice = IndiceCorrespondencia(entradas)
+    assert _codigos(indice.candidatos(LinhaCliente(1, "alvenaria de blocos ceramicos furados"))) == ['C1']
+
+
+def test_unidade_desempata_os_candidatos(entradas):
+    indice = IndiceCorrespondencia(entradas)
+    assert _codigos(indice.candidatos(LinhaCliente(1, "Porta de madeira"))) == ['I3', 'C4']
+    assert _codigos(indice.candidatos(LinhaCliente(1, "Porta de madeira", unidade="cj"))) == ['C4', 'I3']
+    assert _codigos(indice.candidatos(LinhaCliente(1, "Porta de madeira", unidade="Un."))) == ['I3', 'C4']
+
+
+def test_linha_sem_palavras_conhecidas(entradas):
+    assert IndiceCorrespondencia(entradas).candidatos(LinhaCliente(1, "xyz de abc")) == []
+
+
+def test_csv_com_ponto_decimal(tmp_path):
+    arquivo = tmp_path / 'quantitativos.csv'
+    arquivo.write_text("Item;Descrição;Und;Qtde\n1;Alvenaria;m2;2.5\n2;;m2;3\n3;Concreto;m3;1.25\n", encoding='utf-8')
+
+    linhas = ler_planilha_cliente(str(arquivo))
+
+    assert [(l.numero, l.descricao, l.unidade, l.quantidade) for l in linhas] == [
+        (2, 'Alvenaria', 'm2', 2.5), (4, 'Concreto', 'm3', 1.25)]
+
+
+def test_csv_com_virgula_decimal(tmp_path):
+    arquivo = tmp_path / 'quantitativos.csv'
+    arquivo.write_text("Descrição;Qtde\nAlvenaria;1.234,5\nConcreto;2,5\nAço;1.500\n", encoding='latin-1')
+
+    assert [l.quantidade for l in ler_planilha_cliente(str(arquivo))] == [1234.5, 2.5, 1500.0]
+
+
+def test_xlsx(tmp_path):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["Orçamento da obra"])
+    ws.append(["Item", "Discriminação", "Unidade", "Quantidade"])
+    ws.append([1, "Alvenaria", "m2", 12.5])
+    ws.append([2, "Concreto", "m3", "2.5"])
+    arquivo = str(tmp_path / 'quantitativos.xlsx')
+    wb.save(arquivo)
+
+    linhas = ler_planilha_cliente(arquivo)
+
+    assert [(l.numero, l.descricao, l.quantidade) for l in linhas] == [(3, 'Alvenaria', 12.5), (4, 'Concreto', 2.5)]
+
+
+def test_planilha_sem_descricao(tmp_path):
+    arquivo = tmp_path / 'quantitativos.csv'
+    arquivo.write_text("Item;Qtde\n1;2\n", encoding='utf-8')
+    with pytest.raises(PlanilhaInvalida):
+        ler_planilha_cliente(str(arquivo))
+
+
+def test_corresponder_em_processos_igual_ao_local(entradas, monkeypatch):
+    linhas = [LinhaCliente(n, descricao) for n, descricao in enumerate(
+        ["alvenaria blocos ceramicos", "concreto fck 25", "tubo pvc 12 mm", "cimento", "nada parecido"] * 3, start=2)]
+    locais = corresponder(entradas, linhas, max_processos=1)
+
+    monkeypatch.setattr(correspondencia, 'LINHAS_POR_TAREFA', 4)
+    em_processos = corresponder(entradas, linhas, max_processos=2)
+
+    assert [c.linha for c in em_processos] == linhas
+    assert [c.candidatos for c in em_processos] == [c.candidatos for c in locais]
+    assert locais[0].escolha.codigo == 'C1' and locais[4].escolha is None
+
+
+@pytest.mark.parametrize('extensao', ['csv', 'xlsx'])
+def test_exportar(entradas, tmp_path, extensao):
+    linhas = [LinhaCliente(2, "alvenaria de vedacao", "m2", 2.5), LinhaCliente(3, "nada parecido")]
+    correspondencias = corresponder(entradas, linhas, top=3, max_processos=1)
+    correspondencias[0].escolhido = 1
+    arquivo = str(tmp_path / f"correspondencias.{extensao}")
+
+    # Uma linha por candidato: a linha sem candidatos não entra
+    assert exportar_correspondencias(correspondencias, arquivo) == 2
+
+    if extensao == 'csv':
+        df = pd.read_csv(arquivo, sep=';', decimal=',', dtype={'codigo': str})
+    else:
+        df = pd.read_excel(arquivo, dtype={'codigo': str})
+    assert df['posicao'].tolist() == [1, 2]
+    assert df['quantidade'].tolist() == [2.5] * 2
+    assert df['escolhido'].fillna('').tolist() == ['', 'X']
+    assert df['codigo'].tolist() == _codigos(correspondencias[0].candidatos)
+
+
+def test_escolha_fora_dos_candidatos():
+    assert Correspondencia(LinhaCliente(1, "x"), [], escolhido=0).escolha is None
@@ -0,0 +1,74 @@
+"""Testes da curva ABC (database/curva_abc.py)"""
+
+import pytest
+
+from database.curva_abc import classificar, curva_abc
+from tests.sintetica import criar_projeto
+
+
+def classes(totais, limites=(80.0, 95.0)):
+    return classificar([1.0] * len(totais), totais, limites)[4].tolist()
+
+
+def test_item_que_cruza_o_limite_fica_na_classe_de_cima():
+    # Acumulados: 70, 90, 97, 100
+    assert classes([70, 20, 7, 3]) == ['A', 'A', 'B', 'C']
+
+
+def test_item_que_comeca_exatamente_no_limite_e_da_classe_seguinte():
+    # Acumulados: 50, 80, 95, 100; o terceiro começa em 80 e o quarto em 95
+    assert classes([50, 30, 15, 5]) == ['A', 'A', 'B', 'C']
+    assert classes([80, 15, 5]) == ['A', 'B', 'C']
+
+
+def test_limites_configuraveis():
+    totais = [40, 30, 20, 10]
+    assert classes(totais, (50.0, 90.0)) == ['A', 'A', 'B', 'C']
+    assert classes(totais, (40.0, 70.0)) == ['A', 'B', 'C', 'C']
+    assert classes(totais, (99.0, 100.0)) == ['A', 'A', 'A', 'A']
+
+
+def test_ordem_participacoes_e_acumulados():
+    ordem, totais, participacoes, acumulados, _ = classificar([2, 1, 1, 4], [5, 50, 10, 5])
+    assert ordem.tolist() == [1, 3, 0, 2]
+    assert totais.tolist() == [50, 20, 10, 10]
+    assert participacoes.tolist() == pytest.approx([55.5556, 22.2222, 11.1111, 11.1111], rel=1e-4)
+    assert acumulados[-1] == pytest.approx(100.0)
+
+
+def test_totais_iguais_mantem_a_ordem_original():
+    assert classificar([1, 1, 1], [10, 10, 10])[0].tolist() == [0, 1, 2]
+
+
+def test_sem_itens():
+    assert classes([]) == []
+
+
+@pytest.mark.parametrize('limites', [(0, 95), (95, 80), (80, 80), (80, 101)])
+def test_limites_invalidos(limites):
+    with pytest.raises(ValueError):
+        classificar([1], [1], limites)
+
+
+def test_curva_abc_e_resumo():
+    linhas = [('insumo', 'I1', 'A', 'UN', 1.0, 5.0), ('composicao', 'C1', 'B', 'M2', 2.0, 45.0),
+              ('insumo', 'I2', 'C', 'KG', 10.0, 0.5)]
+    curva = curva_abc(linhas)
+    assert [linha[1] for linha in curva.linhas] == ['C1', 'I1', 'I2']
+    assert [linha[9] for linha in curva.linhas] == ['A', 'B', 'C']
+    assert curva.total == pytest.approx(100.0)
+    assert curva.resumo() == {'A': (1, 90.0, 90.0), 'B': (1, 5.0, 5.0), 'C': (1, 5.0, 5.0)}
+
+
+def test_curva_do_orcamento_e_dos_insumos(db, base):
+    projeto_id = criar_projeto(db, [('composicao', 'C3', 10.0, 72.0), ('insumo', 'I2', 4.0, 5.0)], base)
+
+    servicos = db.curva_abc_orcamento(projeto_id, base=base)
+    assert [(linha[1], linha[9]) for linha in servicos.linhas] == [('C3', 'A'), ('I2', 'C')]
+
+    # C3 desdobrada: 40 I1, 20 I2 (+ 4 do orçamento), 60 I3, 1 I4
+    insumos = db.curva_abc_orcamento(projeto_id, insumos=True, base=base)
+    assert insumos.total == pytest.approx(servicos.total)
+    assert {linha[1]: linha[6] for linha in insumos.linhas} == pytest.approx(
+        {'I1': 400.0, 'I2': 120.0, 'I3': 120.0, 'I4': 100.0})
+    assert insumos.linhas[0][1] == 'I1' and insumos.linhas[-1][1] == 'I4'
@@ -0,0 +1,78 @@
+"""Testes do grafo de dependência das composições (database/custos.py)"""
+
+import numpy as np
+import pytest
+
+from database.custos import CicloComposicoes, GrafoComposicoes
+from tests.sintetica import grafo_aleatorio
+
+
+def usuarios(grafo, insumos):
+    """Composições que usam os insumos, por busca ingênua nas arestas"""
+    atingidos = set(int(i) for i in insumos)
+    encontradas = set()
+    mudou = True
+    while mudou:
+        mudou = False
+        for pai, filho in zip(grafo.pais.tolist(), grafo.filhos.tolist()):
+            if filho in atingidos and pai not in encontradas:
+                encontradas.add(pai)
+                atingidos.add(grafo.n_insumos + pai)
+                mudou = True
+    return encontradas
+
+
+def test_calcular_soma_os_itens():
+    grafo = GrafoComposicoes(
+        [('C1', 0.0), ('C2', 0.0), ('C3', 7.0)],
+        [('I1', 10.0), ('I2', 5.0)],
+        [('C1', 'I1', 2.0), ('C1', 'I2', 1.0), ('C2', 'C1', 0.5), ('C2', 'I2', 3.0)]
+    )
+    # C3 não tem itens: mantém o custo gravado
+    assert grafo.calcular().tolist() == pytest.approx([25.0, 27.5, 7.0])
+
+
+@pytest.mark.parametrize('semente', range(5))
+def test_propagar_igual_ao_recalculo_completo(semente):
+    grafo, rng = grafo_aleatorio(semente)
+    insumos = rng.choice(grafo.n_insumos, size=5, replace=False)
+    precos = rng.uniform(1, 100, size=5)
+
+    afetadas, anteriores = grafo.propagar(insumos, precos)
+
+    np.testing.assert_allclose(grafo.custos, grafo.calcular(), rtol=1e-12)
+    assert set(afetadas.tolist()) == usuarios(grafo, insumos)
+    assert len(anteriores) == len(afetadas)
+
+
+def test_propagar_mantem_o_custo_publicado():
+    grafo, rng = grafo_aleatorio(7)
+    # Custos da planilha com arredondamentos e itens fora da base
+    grafo.custos[:] += rng.uniform(-1, 1, size=grafo.n_composicoes)
+    publicados = grafo.custos.copy()
+    recalculados = grafo.calcular()
+
+    insumos = np.array([0, 3])
+    grafo.propagar(insumos, grafo.precos_insumos[insumos] * 1.5)
+
+    np.testing.assert_allclose(grafo.custos - publicados, grafo.calcular() - recalculados, atol=1e-9)
+    nao_afetadas = np.setdiff1d(np.arange(grafo.n_composicoes), list(usuarios(grafo, insumos)))
+    assert (grafo.custos[nao_afetadas] == publicados[nao_afetadas]).all()
+
+
+def test_propagar_insumo_sem_uso_nao_afeta_nada():
+    grafo = GrafoComposicoes([('C1', 20.0)], [('I1', 10.0), ('I2', 5.0)], [('C1', 'I1', 2.0)])
+    afetadas, _ = grafo.propagar(np.array([1]), np.array([50.0]))
+    assert len(afetadas) == 0
+    assert grafo.custos.tolist() == [20.0]
+
+
+def test_ciclo():
+    with pytest.raises(CicloComposicoes) as erro:
+        GrafoComposicoes(
+            [('C1', 0.0), ('C2', 0.0), ('C3', 0.0)],
+            [('I1', 1.0)],
+            [('C1', 'C2', 1.0), ('C2', 'C1', 1.0), ('C3', 'C1', 1.0), ('C3', 'I1', 1.0)]
+        )
+    # C3 só depende do ciclo, não faz parte dele
+    assert sorted(erro.value.codigos) == ['C1', 'C2']
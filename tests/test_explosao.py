@@ -0,0 +1,130 @@
+"""Testes do desdobramento das composições guardado em explosao_composicoes"""
+
+import pandas as pd
+import pytest
+
+from database.custos import CicloComposicoes
+from tests.sintetica import INSUMOS, gravar_base
+
+
+def _coeficientes(linhas):
+    return {codigo: pytest.approx(quantidade) for _, codigo, _, _, quantidade, _, _ in linhas}
+
+
+def _guardadas(db, base):
+    return {linha[0] for linha in db.conn.execute('''
+    SELECT DISTINCT codigo_composicao FROM explosao_composicoes
+    WHERE uf = ? AND regime = ? AND data_referencia = ?
+    ''', (base.uf, base.regime, base.data_referencia))}
+
+
+def test_desdobramento_soma_todos_os_caminhos(db, base):
+    # C3 = 2 C2 + C1 + 0,1 I4, com C2 = 0,5 C1 + 3 I3: C1 entra com 2 x 0,5 + 1 = 2
+    linhas = db.obter_explosao_composicao('C3', base)
+    assert _coeficientes(linhas) == {'I1': 4.0, 'I2': 2.0, 'I3': 6.0, 'I4': 0.1}
+    assert sum(linha[6] for linha in linhas) == pytest.approx(72.0)
+
+
+def test_composicao_sem_itens_fica_como_esta(db, base):
+    assert _coeficientes(db.obter_explosao_composicao('C5', base)) == {'C4': 2.0, 'I1': 1.0}
+    assert _coeficientes(db.obter_explosao_composicao('C4', base)) == {'C4': 1.0}
+
+
+def test_subcomposicoes_sao_guardadas_junto(db, base):
+    db.obter_explosao_composicao('C3', base)
+    assert _guardadas(db, base) == {'C1', 'C2', 'C3'}
+
+
+def test_preencher_o_cache_nao_muda_a_geracao(db, base):
+    geracao = db.geracao
+    db.obter_explosao_composicao('C3', base)
+    assert db.geracao == geracao
+
+
+def test_mudanca_de_itens_invalida_a_composicao_e_quem_a_usa(db, base):
+    for codigo in ('C1', 'C2', 'C3', 'C5'):
+        db.obter_explosao_composicao(codigo, base)
+
+    # C1 passa a usar 3 I1; C2 e C3 a usam, C5 (e C4, guardada com ela) não
+    itens = [('C1', 'I1', 3.0), ('C1', 'I2', 1.0)]
+    db._gravar_composicoes_delta(lambda: iter([([('C1', 'COMPOSICAO C1', 'UN', 35.0)], itens)]), base)
+    assert _guardadas(db, base) == {'C4', 'C5'}
+
+    assert _coeficientes(db.obter_explosao_composicao('C3', base)) == {'I1': 6.0, 'I2': 2.0, 'I3': 6.0, 'I4': 0.1}
+
+
+def test_leitura_nao_deixa_transacao_aberta(db, base):
+    db.obter_explosao_composicao('C3', base)
+    assert not db.conn.in_transaction
+
+
+def test_com_consulta_em_andamento_desdobra_sem_gravar(db, base):
+    esperado = _coeficientes(db.obter_explosao_composicao('C3', base))
+    db._invalidar_explosoes(['C1'], base)
+    db.conn.commit()
+
+    db.consultas.ocupada = True
+    try:
+        linhas = db.obter_explosao_composicao('C3', base)
+    finally:
+        db.consultas.ocupada = False
+    assert _coeficientes(linhas) == esperado
+    assert _guardadas(db, base) == set()
+
+
+def _lote_insumos(precos):
+    return pd.DataFrame({
+        'codigo': list(precos),
+        'descricao': [f"INSUMO {codigo}" for codigo in precos],
+        'unidade': 'UN',
+        'preco_mediano': list(precos.values()),
+    })
+
+
+def test_codigo_que_vira_insumo_invalida_quem_o_usa(db, base):
+    for codigo in ('C3', 'C5'):
+        db.obter_explosao_composicao(codigo, base)
+
+    # C1 passa a ser também insumo: deixa de ser desdobrado em C2 e C3
+    db._gravar_insumos_delta([_lote_insumos({**INSUMOS, 'C1': 25.0})], base)
+    assert _guardadas(db, base) == {'C4', 'C5'}
+    assert _coeficientes(db.obter_explosao_composicao('C3', base)) == {'C1': 2.0, 'I3': 6.0, 'I4': 0.1}
+
+    # Removido dos insumos, volta a ser desdobrado
+    db._gravar_insumos_delta([_lote_insumos(INSUMOS)], base, remover_ausentes=True)
+    assert _guardadas(db, base) == {'C4', 'C5'}
+    assert _coeficientes(db.obter_explosao_composicao('C3', base)) == {'I1': 4.0, 'I2': 2.0, 'I3': 6.0, 'I4': 0.1}
+
+
+def test_importacao_completa_de_insumos_invalida_quem_usa_o_codigo(db, base):
+    db.obter_explosao_composicao('C3', base)
+    db._gravar_insumos([_lote_insumos({'C2': 18.5})], base)
+    assert _guardadas(db, base) == {'C1'}
+    assert _coeficientes(db.obter_explosao_composicao('C3', base)) == {'C2': 2.0, 'I1': 2.0, 'I2': 1.0, 'I4': 0.1}
+
+
+def test_explodir_orcamento(db, base):
+    projeto_id = db.criar_projeto("Obra")
+    db.conn.executemany('''
+    INSERT INTO orcamento_itens (projeto_id, tipo, codigo, descricao, unidade, quantidade, preco_unitario)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [
+        (projeto_id, 'composicao', 'C3', '', '', 10.0, 72.0),
+        (projeto_id, 'insumo', 'I1', '', '', 5.0, 10.0),
+        (projeto_id, 'composicao', 'PROPRIA', 'Serviço próprio', 'vb', 1.0, 500.0),
+    ])
+    db.conn.commit()
+
+    linhas = db.explodir_orcamento(projeto_id, base)
+    assert _coeficientes(linhas) == {'I1': 45.0, 'I2': 20.0, 'I3': 60.0, 'I4': 1.0, 'PROPRIA': 1.0}
+    assert [linha[6] for linha in linhas] == sorted((linha[6] for linha in linhas), reverse=True)
+    assert not db.conn.in_transaction
+
+
+def test_ciclo_e_detectado(db, base):
+    ciclo = [('X1', 'X2', 1.0), ('X2', 'X1', 1.0), ('X2', 'I1', 1.0)]
+    gravar_base(db, base, insumos={}, custos={'X1': 1.0, 'X2': 1.0}, itens=ciclo)
+
+    with pytest.raises(CicloComposicoes) as erro:
+        db.obter_explosao_composicao('X1', base)
+    assert set(erro.value.codigos) == {'X1', 'X2'}
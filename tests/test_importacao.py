@@ -0,0 +1,64 @@
+"""Testes da importação das planilhas de composições"""
+
+import pytest
+
+from models import BaseSinapi
+from tests.sintetica import CUSTOS, ITENS, planilha_composicoes
+
+
+@pytest.fixture
+def outra():
+    return BaseSinapi('RJ', 'desonerado', '2024-05')
+
+
+def _itens(db, base):
+    return sorted(db.conn.execute('''
+    SELECT codigo_composicao, codigo_insumo, coeficiente FROM composicao_insumos
+    WHERE uf = ? AND regime = ? AND data_referencia = ?
+    ''', (base.uf, base.regime, base.data_referencia)))
+
+
+def _composicoes(db, base):
+    return {codigo: (descricao, custo) for codigo, descricao, custo in db.conn.execute('''
+    SELECT codigo, descricao, custo_total FROM composicoes WHERE uf = ? AND regime = ? AND data_referencia = ?
+    ''', (base.uf, base.regime, base.data_referencia))}
+
+
+def _importar(db, caminho, base, **kwargs):
+    return db.importar_composicoes(caminho, mes_ref=base.data_referencia, uf=base.uf, regime=base.regime, **kwargs)
+
+
+def test_analitico_grava_composicoes_e_itens(db, outra, tmp_path):
+    assert _importar(db, planilha_composicoes(tmp_path / 'analitico.xlsx'), outra) == len(CUSTOS)
+    assert _itens(db, outra) == sorted(ITENS)
+
+
+def test_sintetico_depois_do_analitico_mantem_os_itens(db, outra, tmp_path):
+    _importar(db, planilha_composicoes(tmp_path / 'analitico.xlsx'), outra)
+    db.obter_explosao_composicao('C3', outra)
+    explosoes, = db.conn.execute("SELECT COUNT(*) FROM explosao_composicoes").fetchone()
+    assert explosoes
+
+    custos = dict(CUSTOS, C1=26.0)
+    assert _importar(db, planilha_composicoes(tmp_path / 'sintetico.xlsx', custos, itens=None), outra) == len(CUSTOS)
+
+    assert _itens(db, outra) == sorted(ITENS)
+    assert _composicoes(db, outra)['C1'] == ('COMPOSICAO C1', 26.0)
+    assert db.conn.execute("SELECT COUNT(*) FROM explosao_composicoes").fetchone()[0] == explosoes
+
+
+def test_sintetico_em_delta_mantem_os_itens(db, outra, tmp_path):
+    _importar(db, planilha_composicoes(tmp_path / 'analitico.xlsx'), outra)
+
+    sintetico = planilha_composicoes(tmp_path / 'sintetico.xlsx', itens=None, descricoes={'C2': 'COMPOSICAO NOVA'})
+    resumo = _importar(db, sintetico, outra, delta=True)
+
+    assert (resumo.adicionados, resumo.alterados, resumo.inalterados) == (0, 1, len(CUSTOS) - 1)
+    assert _itens(db, outra) == sorted(ITENS)
+    assert _composicoes(db, outra)['C2'] == ('COMPOSICAO NOVA', 18.5)
+
+    # A planilha com itens grava de novo só a composição que o sintético mudou
+    resumo = _importar(db, planilha_composicoes(tmp_path / 'analitico.xlsx'), outra, delta=True)
+    assert (resumo.alterados, resumo.inalterados) == (1, len(CUSTOS) - 1)
+    assert _itens(db, outra) == sorted(ITENS)
+    assert _composicoes(db, outra)['C2'] == ('COMPOSICAO C2', 18.5)
@@ -0,0 +1,43 @@
+"""Testes do registro de layouts das planilhas SINAPI (database/layouts.py)"""
+
+import os
+
+from database.layouts import ARQUIVO_LAYOUTS, RegistroLayouts
+from tests.sintetica import ANALITICO
+
+
+def test_analitico_e_conhecido(tmp_path):
+    layout, conhecido = RegistroLayouts(str(tmp_path)).identificar('composicoes', ANALITICO)
+
+    assert conhecido
+    assert {interno: ANALITICO[indice] for interno, indice in layout.colunas.items()} == {
+        'codigo_composicao': 'CODIGO  DA COMPOSICAO',
+        'descricao_composicao': 'DESCRICAO DA COMPOSICAO',
+        'unidade_composicao': 'UNIDADE',
+        'custo_total': 'CUSTO TOTAL',
+        'codigo_item': 'CODIGO ITEM',
+        'coeficiente': 'COEFICIENTE',
+    }
+
+
+def test_layout_com_titulos_exatos_e_registrado(tmp_path):
+    cabecalho = ['CODIGO', 'DESCRICAO', 'UNIDADE', 'PRECO', 'OBSERVACAO']
+    layout, conhecido = RegistroLayouts(str(tmp_path)).identificar('insumos', cabecalho)
+    assert not conhecido and layout.exato
+
+    RegistroLayouts(str(tmp_path)).confirmar(layout)
+
+    assert RegistroLayouts(str(tmp_path)).identificar('insumos', cabecalho)[1]
+
+
+def test_layout_aproximado_nao_e_registrado(tmp_path):
+    cabecalho = ['COD. SINAPI', 'DESCRICAO', 'UN. MEDIDA', 'PRECO R$']
+    registro = RegistroLayouts(str(tmp_path))
+    layout, _ = registro.identificar('insumos', cabecalho)
+    assert layout.colunas == {'codigo': 0, 'descricao': 1, 'unidade': 2, 'preco': 3}
+    assert not layout.exato
+
+    registro.confirmar(layout)
+
+    assert not os.path.exists(tmp_path / ARQUIVO_LAYOUTS)
+    assert not registro.identificar('insumos', cabecalho)[1]
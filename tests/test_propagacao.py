@@ -0,0 +1,83 @@
+"""Testes da propagação de preços de insumos às composições e aos orçamentos"""
+
+import pandas as pd
+import pytest
+
+from models import BaseSinapi
+from tests.sintetica import CUSTOS, criar_projeto, gravar_base
+
+
+def _custos(db, base):
+    return dict(db.conn.execute('''
+    SELECT codigo, custo_total FROM composicoes WHERE uf = ? AND regime = ? AND data_referencia = ?
+    ''', (base.uf, base.regime, base.data_referencia)))
+
+
+def _itens(db, projeto_id):
+    return {codigo: (preco, alterado) for codigo, preco, alterado in db.conn.execute(
+        "SELECT codigo, preco_unitario, preco_alterado FROM orcamento_itens WHERE projeto_id = ?", (projeto_id,))}
+
+
+def test_composicoes_recalculadas_como_no_recalculo_completo(db, base):
+    db.atualizar_precos_insumos({'I1': 12.0}, base)
+
+    # I1 sobe 2: C1 +4, C2 +2, C3 +8 (2 x 2 + 4), C5 +2; C4 não usa I1
+    assert _custos(db, base) == pytest.approx({'C1': 29.0, 'C2': 20.5, 'C3': 80.0, 'C4': 100.0, 'C5': 212.0})
+    assert db.recalcular_custos(base) == []
+
+
+def test_itens_da_base_sao_so_marcados(db, base):
+    projeto_id = criar_projeto(db, [('composicao', 'C3', 10.0, 72.0), ('composicao', 'C4', 1.0, 100.0),
+                                    ('insumo', 'I1', 5.0, 10.0)], base)
+
+    impactos = db.atualizar_precos_insumos({'I1': 12.0}, base)
+
+    assert _itens(db, projeto_id) == {'C3': (72.0, 1), 'C4': (100.0, 0), 'I1': (10.0, 1)}
+    assert len(impactos) == 1
+    impacto = impactos[0]
+    assert impacto.total_anterior == pytest.approx(10 * 72 + 100 + 5 * 10)
+    assert impacto.total_novo == pytest.approx(10 * 80 + 100 + 5 * 12)
+    assert impacto.itens_alterados == 2
+
+
+def test_itens_de_outra_base_nao_sao_afetados(db, base):
+    outra = BaseSinapi('RJ', base.regime, base.data_referencia)
+    gravar_base(db, outra)
+    projeto_id = criar_projeto(db, [('composicao', 'C3', 10.0, CUSTOS['C3'])], outra)
+
+    assert db.atualizar_precos_insumos({'I1': 12.0}, base) == []
+    assert _itens(db, projeto_id) == {'C3': (72.0, 0)}
+    assert _custos(db, outra) == pytest.approx(CUSTOS)
+
+
+def test_aplicar_precos_alterados(db, base):
+    projeto_id = criar_projeto(db, [('composicao', 'C3', 10.0, 72.0), ('insumo', 'I2', 2.0, 5.0)], base)
+    impacto, = db.atualizar_precos_insumos({'I1': 12.0}, base)
+
+    assert db.aplicar_precos_alterados(projeto_id) == 1
+    assert _itens(db, projeto_id) == {'C3': (pytest.approx(80.0), 0), 'I2': (5.0, 0)}
+    total, = db.conn.execute("SELECT SUM(quantidade * preco_unitario) FROM orcamento_itens WHERE projeto_id = ?",
+                             (projeto_id,)).fetchone()
+    assert total == pytest.approx(impacto.total_novo)
+
+
+def test_preco_que_volta_desmarca_o_item(db, base):
+    projeto_id = criar_projeto(db, [('insumo', 'I1', 1.0, 10.0)], base)
+    db.atualizar_precos_insumos({'I1': 12.0}, base)
+    db.atualizar_precos_insumos({'I1': 10.0}, base)
+    assert _itens(db, projeto_id) == {'I1': (10.0, 0)}
+
+
+def test_importacao_delta_propaga_e_so_marca(db, base):
+    projeto_id = criar_projeto(db, [('composicao', 'C1', 2.0, 25.0)], base)
+    lote = pd.DataFrame({
+        'codigo': ['I1', 'I2'], 'descricao': ['INSUMO I1', 'INSUMO I2'],
+        'unidade': ['UN', 'UN'], 'preco_mediano': [12.0, 5.0],
+    })
+
+    resumo = db._gravar_insumos_delta([lote], base)
+
+    assert resumo.alterados == 2  # a base sintética foi gravada sem hash; só I1 muda de preço
+    assert _custos(db, base)['C1'] == pytest.approx(29.0)
+    assert _itens(db, projeto_id) == {'C1': (25.0, 1)}
+    assert [impacto.total_novo for impacto in resumo.projetos_afetados] == [pytest.approx(58.0)]
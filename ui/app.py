@@ -8,26 +8,42 @@ Contém a classe principal da aplicação
 
 import os
 import sys
+import time
+import threading
 import tkinter as tk
 import customtkinter as ctk
 from tkinter import filedialog, messagebox
 from datetime import datetime
 
 # Importações internas
-from database.sinapi import SinapiManager
+from database.consultas import ConsultaCancelada, ConsultaOcupada
+from database.sinapi import SinapiManager, LIMITE_PESQUISA
 from ui.components import ScrollableTreeView
 from ui.dialogs import (
     NovoProjeto, 
     AbrirProjeto, 
     ImportarSinapi, 
     CalculadoraBDI,
-    ConfiguracoesSistema
+    ConfiguracoesSistema,
+    CorrespondenciaLote,
+    RelatorioCurvaABC,
+    RelatorioInsumos,
+    UsoItem
 )
 
 
 class OrcamentoApp:
     """Classe principal da interface gráfica do OrçaFácil"""
     
+    # Pesquisa enquanto se digita: espera entre a última tecla e a pesquisa (ms),
+    # tempo máximo de cada pesquisa (s) e tamanho mínimo do termo
+    ATRASO_PESQUISA = 250
+    PRAZO_PESQUISA = 0.012
+    MINIMO_PESQUISA = 2
+    
+    # Espera (ms) para refazer uma pesquisa pedida durante outra, que foi cancelada
+    ATRASO_NOVA_TENTATIVA = 20
+    
     def __init__(self, root):
         """Inicializa a aplicação"""
         self.root = root
@@ -42,6 +58,10 @@ class OrcamentoApp:
         self.termo_pesquisa = tk.StringVar()
         self.tipo_pesquisa = tk.StringVar(value="insumo")
         self.quantidade = tk.DoubleVar(value=1.0)
+        self.indices_pesquisa = None  # Índices em memória, carregados depois da abertura
+        self._carga_indices = None
+        self._pesquisa_agendada = None
+        self._pesquisa_paginada = None  # (tipo, termo, próxima página, estimativa)
         
         # Configura o fechamento adequado
         self.root.protocol("WM_DELETE_WINDOW", self.fechar_aplicacao)
@@ -52,6 +72,9 @@ class OrcamentoApp:
         
         # Atualiza a lista de projetos
         self.atualizar_lista_projetos()
+        
+        # Os índices da pesquisa enquanto se digita são montados depois que a janela abre
+        self.root.after(500, self.carregar_indices_pesquisa)
     
     def create_menu(self):
         """Cria a barra de menu da aplicação"""
@@ -74,6 +97,9 @@ class OrcamentoApp:
         # Menu Ferramentas
         toolsmenu = tk.Menu(menubar, tearoff=0)
         toolsmenu.add_command(label="Calcular BDI", command=self.calcular_bdi)
+        toolsmenu.add_command(label="Corresponder Planilha de Quantitativos", command=self.corresponder_planilha)
+        toolsmenu.add_command(label="Relatório de Insumos", command=self.relatorio_insumos)
+        toolsmenu.add_command(label="Curva ABC", command=self.curva_abc)
         toolsmenu.add_command(label="Configurações", command=self.configuracoes)
         menubar.add_cascade(label="Ferramentas", menu=toolsmenu)
         
@@ -157,15 +183,20 @@ class OrcamentoApp:
         entry_search = ctk.CTkEntry(search_frame, textvariable=self.termo_pesquisa, width=250)
         entry_search.pack(side="left", padx=5)
         entry_search.bind("<Return>", lambda event: self.pesquisar())
+        entry_search.bind("<KeyRelease>", self._ao_digitar)
+        entry_search.bind("<Escape>", lambda event: self.cancelar_pesquisa())
         
         # Botões de rádio para tipo de pesquisa
         radio_frame = ctk.CTkFrame(search_frame)
         radio_frame.pack(side="left", padx=5)
         
-        ctk.CTkRadioButton(radio_frame, text="Insumo", variable=self.tipo_pesquisa, value="insumo").pack(side="left")
-        ctk.CTkRadioButton(radio_frame, text="Composição", variable=self.tipo_pesquisa, value="composicao").pack(side="left", padx=10)
+        ctk.CTkRadioButton(radio_frame, text="Insumo", variable=self.tipo_pesquisa, value="insumo",
+                           command=self.pesquisar_incremental).pack(side="left")
+        ctk.CTkRadioButton(radio_frame, text="Composição", variable=self.tipo_pesquisa, value="composicao",
+                           command=self.pesquisar_incremental).pack(side="left", padx=10)
         
         ctk.CTkButton(search_frame, text="Pesquisar", command=self.pesquisar).pack(side="left", padx=5)
+        ctk.CTkButton(search_frame, text="Cancelar", width=80, command=self.cancelar_pesquisa).pack(side="left")
         
         # Lista de resultados com nossa árvore customizada que suporta wrapping
         result_frame = ctk.CTkFrame(left_frame)
@@ -191,6 +222,7 @@ class OrcamentoApp:
         entry_qtd.bind("<FocusOut>", self.formatar_quantidade)
         
         ctk.CTkButton(add_frame, text="Adicionar ao Orçamento", command=self.adicionar_ao_orcamento).pack(side="left", padx=5)
+        ctk.CTkButton(add_frame, text="Onde é Usado", command=self.onde_e_usado).pack(side="left", padx=5)
         
         # Painel direito - Orçamento atual
         right_frame = ctk.CTkFrame(mid_frame)
@@ -327,15 +359,221 @@ class OrcamentoApp:
             self.quantidade.set(1.0)
     
     def pesquisar(self):
-        """Pesquisa insumos ou composições"""
-        # Implementação mínima
-        pass
+        """
+        Pesquisa insumos ou composições
+        
+        É a pesquisa completa: traz a primeira página de resultados e as
+        seguintes são carregadas conforme a lista é rolada. Se nada é
+        encontrado, refaz a pesquisa com os erros de digitação corrigidos.
+        """
+        termo = self.termo_pesquisa.get().strip()
+        tipo = self.tipo_pesquisa.get()
+        
+        if not termo:
+            messagebox.showinfo("Aviso", "Digite um termo para pesquisar")
+            return
+        
+        def consultar(termo):
+            pagina = self.db.pesquisar_pagina(tipo, termo)
+            if not pagina.linhas:
+                corrigido = self.db.corrigir_termo(termo)
+                if corrigido:
+                    termo = corrigido
+                    pagina = self.db.pesquisar_pagina(tipo, termo)
+            return termo, pagina
+        
+        try:
+            termo, pagina = self.db.executar_cancelavel(consultar, termo, ao_progredir=self._ao_progredir)
+            self._mostrar_resultados(pagina.linhas, termo)
+            self._continuar_paginacao(tipo, termo, pagina, pagina.estimativa)
+        
+        except ConsultaOcupada:
+            self.root.after(self.ATRASO_NOVA_TENTATIVA, self.pesquisar)
+        except ConsultaCancelada:
+            self.lbl_status.configure(text="Pesquisa cancelada")
+        except Exception as e:
+            messagebox.showerror("Erro", f"Erro ao pesquisar: {str(e)}")
+    
+    def cancelar_pesquisa(self):
+        """Interrompe a pesquisa em andamento (botão Cancelar ou Esc)"""
+        self.db.cancelar_consulta()
+    
+    def _ao_progredir(self, decorrido):
+        """Mostra o andamento de uma pesquisa demorada e mantém a janela respondendo"""
+        self.lbl_status.configure(text=f"Pesquisando... ({decorrido:.1f} s) - Esc ou Cancelar interrompe")
+        self.root.update()
+    
+    def _mostrar_resultados(self, resultados, termo):
+        """Substitui a lista de resultados da pesquisa (sem carga de mais páginas)"""
+        self._pesquisa_paginada = None
+        self.tree_resultados.ativar_paginacao(None)
+        self.tree_resultados.delete(*self.tree_resultados.get_children())
+        self._inserir_resultados(resultados)
+        
+        self.lbl_status.configure(text=f"Encontrados {len(resultados)} resultados{self._aviso_correcao(termo)}")
+    
+    def _aviso_correcao(self, termo):
+        """Complemento do status quando a pesquisa foi feita com o termo corrigido"""
+        return "" if termo == self.termo_pesquisa.get().strip() else f' para "{termo}"'
+    
+    def _inserir_resultados(self, resultados):
+        """Acrescenta linhas ao fim da lista de resultados"""
+        for codigo, descricao, unidade, preco, data_ref in resultados:
+            self.tree_resultados.insert("", tk.END, values=(
+                codigo, descricao, unidade, f"R$ {preco or 0:.2f}"
+            ))
+    
+    def _continuar_paginacao(self, tipo, termo, pagina, estimativa):
+        """Prepara a carga da página seguinte à rolagem e atualiza o status"""
+        carregados = len(self.tree_resultados.get_children())
+        if pagina.proxima is None:
+            self._pesquisa_paginada = None
+            self.tree_resultados.ativar_paginacao(None)
+            self.lbl_status.configure(text=f"Encontrados {carregados} resultados{self._aviso_correcao(termo)}")
+            return
+        
+        self._pesquisa_paginada = (tipo, termo, pagina.proxima, estimativa)
+        total = f"cerca de {estimativa}" if estimativa else "mais"
+        self.lbl_status.configure(
+            text=f"Exibindo {carregados} de {total} resultados{self._aviso_correcao(termo)} (role para ver mais)"
+        )
+        self.tree_resultados.ativar_paginacao(self._carregar_pagina)
+    
+    def _carregar_pagina(self):
+        """Traz a página seguinte da pesquisa completa, quando a lista chega perto do fim"""
+        if self._pesquisa_paginada is None:
+            return
+        
+        # A rolagem não interrompe uma pesquisa em andamento; a página é
+        # pedida de novo na próxima rolagem
+        if self.db.consultas.ocupada:
+            return
+        
+        tipo, termo, proxima, estimativa = self._pesquisa_paginada
+        try:
+            pagina = self.db.executar_cancelavel(
+                self.db.pesquisar_pagina, tipo, termo, apos=proxima, ao_progredir=self._ao_progredir
+            )
+        except (ConsultaCancelada, ConsultaOcupada):
+            self.lbl_status.configure(text="Carga de resultados cancelada")
+            return
+        except Exception as e:
+            self._pesquisa_paginada = None
+            self.tree_resultados.ativar_paginacao(None)
+            self.lbl_status.configure(text=f"Erro ao pesquisar: {str(e)}")
+            return
+        
+        self._inserir_resultados(pagina.linhas)
+        self._continuar_paginacao(tipo, termo, pagina, estimativa)
+    
+    def _ao_digitar(self, event=None):
+        """Agenda a pesquisa enquanto se digita, reiniciando a espera a cada tecla"""
+        if event is not None and event.keysym in ("Return", "KP_Enter", "Escape"):
+            return
+        
+        if self._pesquisa_agendada is not None:
+            self.root.after_cancel(self._pesquisa_agendada)
+        self._pesquisa_agendada = self.root.after(self.ATRASO_PESQUISA, self.pesquisar_incremental)
+    
+    def pesquisar_incremental(self):
+        """
+        Pesquisa enquanto se digita
+        
+        Usa os índices em memória, com prazo de um quadro, para não travar a
+        interface; enquanto eles não terminam de carregar, usa a pesquisa do
+        banco. Enter (ou o botão Pesquisar) faz a pesquisa completa. Como na
+        pesquisa completa, um termo sem resultados é corrigido e refeito.
+        """
+        self._pesquisa_agendada = None
+        termo = self.termo_pesquisa.get().strip()
+        if len(termo) < self.MINIMO_PESQUISA:
+            return
+        
+        tipo = self.tipo_pesquisa.get()
+        
+        def buscar(termo):
+            if self.indices_pesquisa is not None:
+                prazo = time.perf_counter() + self.PRAZO_PESQUISA
+                return self.indices_pesquisa[tipo].pesquisar(termo, LIMITE_PESQUISA, prazo)
+            elif tipo == "insumo":
+                return self.db.pesquisar_insumos(termo)
+            else:
+                return self.db.pesquisar_composicoes(termo)
+        
+        def consultar(termo):
+            resultados = buscar(termo)
+            if not resultados:
+                # Nada encontrado: tenta de novo com os erros de digitação corrigidos
+                corrigido = self.db.corrigir_termo(termo)
+                if corrigido:
+                    termo = corrigido
+                    resultados = buscar(termo)
+            return termo, resultados
+        
+        try:
+            # Uma tecla nova cancela a pesquisa anterior que ainda estiver no banco
+            termo, resultados = self.db.executar_cancelavel(consultar, termo, ao_progredir=self._ao_progredir)
+            self._mostrar_resultados(resultados, termo)
+        
+        except ConsultaOcupada:
+            self._pesquisa_agendada = self.root.after(self.ATRASO_NOVA_TENTATIVA, self.pesquisar_incremental)
+        except ConsultaCancelada:
+            pass  # substituída por uma pesquisa mais nova ou cancelada pelo usuário
+        except Exception as e:
+            self.lbl_status.configure(text=f"Erro ao pesquisar: {str(e)}")
+    
+    def carregar_indices_pesquisa(self):
+        """Monta em segundo plano os índices da pesquisa enquanto se digita (base mais recente)"""
+        base = self.db.base_pesquisa()
+        if base is None:
+            self.indices_pesquisa = None
+            return
+        
+        resultado = {}
+        
+        def carregar():
+            try:
+                resultado['indices'] = self.db.carregar_indices_pesquisa(base)
+            except Exception as e:
+                resultado['erro'] = e
+        
+        # A thread só monta os índices; a interface é atualizada pelo próprio Tk
+        self._carga_indices = threading.Thread(target=carregar, daemon=True)
+        self._carga_indices.start()
+        self._aguardar_indices(self._carga_indices, resultado)
+    
+    def _aguardar_indices(self, carga, resultado):
+        """Acompanha a carga dos índices sem bloquear a interface"""
+        if carga is not self._carga_indices:
+            return  # substituída por uma carga mais nova
+        if carga.is_alive():
+            self.root.after(100, self._aguardar_indices, carga, resultado)
+            return
+        
+        if 'erro' in resultado:
+            print(f"⚠️ Pesquisa enquanto se digita indisponível: {str(resultado['erro'])}")
+            return
+        
+        self.indices_pesquisa = resultado['indices']
+        print(f"✅ Índices de pesquisa carregados ({sum(len(i) for i in self.indices_pesquisa.values())} itens)")
     
     def adicionar_ao_orcamento(self):
         """Adiciona o item selecionado ao orçamento"""
         # Implementação mínima
         pass
     
+    def onde_e_usado(self):
+        """Mostra as composições que usam o item selecionado nos resultados"""
+        selecao = self.tree_resultados.selection()
+        if not selecao:
+            messagebox.showerror("Erro", "Selecione um item nos resultados da pesquisa")
+            return
+        
+        # Lido como texto para não perder os zeros à esquerda do código
+        codigo = self.tree_resultados.tree.set(selecao[0], "codigo")
+        descricao = self.tree_resultados.tree.set(selecao[0], "descricao")
+        UsoItem(self.root, self.db, codigo, descricao)
+    
     def remover_item(self):
         """Remove o item selecionado do orçamento"""
         # Implementação mínima
@@ -347,9 +585,23 @@ class OrcamentoApp:
         pass
     
     def ver_composicao(self):
-        """Mostra os detalhes de uma composição"""
-        # Implementação mínima
-        pass
+        """Mostra a composição selecionada (no orçamento ou nos resultados) desdobrada nos insumos"""
+        codigo = descricao = None
+        selecao = self.tree_orcamento.selection()
+        if selecao and self.tree_orcamento.tree.set(selecao[0], "tipo") in ("composicao", "Composição"):
+            codigo = self.tree_orcamento.tree.set(selecao[0], "codigo")
+            descricao = self.tree_orcamento.tree.set(selecao[0], "descricao")
+        else:
+            selecao = self.tree_resultados.selection()
+            if selecao and self.tipo_pesquisa.get() == "composicao":
+                codigo = self.tree_resultados.tree.set(selecao[0], "codigo")
+                descricao = self.tree_resultados.tree.set(selecao[0], "descricao")
+        
+        if codigo is None:
+            messagebox.showerror("Erro", "Selecione uma composição no orçamento ou nos resultados da pesquisa")
+            return
+        
+        RelatorioInsumos(self.root, self.db, nome_projeto=f"{codigo} - {descricao}", codigo_composicao=codigo)
     
     def exportar_excel(self):
         """Exporta o orçamento para Excel"""
@@ -361,6 +613,28 @@ class OrcamentoApp:
         # Implementação mínima
         pass
     
+    def corresponder_planilha(self):
+        """Abre a correspondência em lote de uma planilha de quantitativos com o SINAPI"""
+        CorrespondenciaLote(self.root, self.db)
+    
+    def relatorio_insumos(self):
+        """Abre o relatório de insumos (orçamento desdobrado) do projeto atual"""
+        if self.projeto_atual is None:
+            messagebox.showinfo("Aviso", "Selecione ou crie um projeto primeiro")
+            return
+        
+        nome = next((p[1] for p in self.projetos if p[0] == self.projeto_atual), "")
+        RelatorioInsumos(self.root, self.db, self.projeto_atual, nome)
+    
+    def curva_abc(self):
+        """Abre a curva ABC (serviços ou insumos) do projeto atual"""
+        if self.projeto_atual is None:
+            messagebox.showinfo("Aviso", "Selecione ou crie um projeto primeiro")
+            return
+        
+        nome = next((p[1] for p in self.projetos if p[0] == self.projeto_atual), "")
+        RelatorioCurvaABC(self.root, self.db, self.projeto_atual, nome)
+    
     def configuracoes(self):
         """Abre a janela de configurações do aplicativo"""
         # Implementação mínima
@@ -382,7 +656,9 @@ class OrcamentoApp:
     def importar_sinapi(self):
         """Importa dados do SINAPI"""
         dialog = ImportarSinapi(self.root, self.db)
-        # O diálogo lida com a importação, aqui só atualizamos se necessário
+        # O diálogo lida com a importação; depois dele, os índices de pesquisa são refeitos
+        self.root.wait_window(dialog)
+        self.carregar_indices_pesquisa()
 
     def fechar_aplicacao(self):
         """Manipula o fechamento da aplicação"""
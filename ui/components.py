@@ -16,6 +16,9 @@ class ScrollableTreeView(ctk.CTkFrame):
     Uma solução para o problema do wrap não ser suportado no ttk.Treeview
     """
     
+    # Fração da lista já rolada a partir da qual mais itens são carregados
+    LIMITE_CARGA = 0.9
+    
     def __init__(self, master, columns, headings, column_widths, **kwargs):
         """
         Inicializa o TreeView com suporte a wrapping
@@ -55,7 +58,7 @@ class ScrollableTreeView(ctk.CTkFrame):
         # Adiciona as scrollbars
         self.vsb = ctk.CTkScrollbar(self.tree_frame, orientation="vertical", command=self.tree.yview)
         self.hsb = ctk.CTkScrollbar(self.tree_frame, orientation="horizontal", command=self.tree.xview)
-        self.tree.configure(yscrollcommand=self.vsb.set, xscrollcommand=self.hsb.set)
+        self.tree.configure(yscrollcommand=self._ao_rolar, xscrollcommand=self.hsb.set)
         
         # Posiciona os widgets
         self.tree.grid(row=0, column=0, sticky="nsew")
@@ -71,6 +74,38 @@ class ScrollableTreeView(ctk.CTkFrame):
         
         # Contador para rastreamento de itens
         self.count = 0
+        
+        # Carga sob demanda: função chamada quando a rolagem chega perto do fim
+        self._carregar_mais = None
+        self._carga_agendada = False
+    
+    def ativar_paginacao(self, carregar_mais):
+        """
+        Liga ou desliga a carga de mais itens ao rolar a lista
+        
+        Args:
+            carregar_mais: Função sem argumentos, chamada uma vez a cada vez que
+                           a rolagem chega perto do fim (None desliga)
+        """
+        self._carregar_mais = carregar_mais
+        if carregar_mais is not None:
+            # A lista pode ainda não encher a área visível
+            self._ao_rolar(*self.tree.yview())
+    
+    def _ao_rolar(self, first, last):
+        """Atualiza a scrollbar e, perto do fim da lista, pede mais itens"""
+        self.vsb.set(first, last)
+        if (self._carregar_mais is not None and not self._carga_agendada
+                and float(last) >= self.LIMITE_CARGA):
+            # Fora do callback da scrollbar, para poder inserir itens
+            self._carga_agendada = True
+            self.after_idle(self._carregar)
+    
+    def _carregar(self):
+        """Chama a função de carga sob demanda"""
+        self._carga_agendada = False
+        if self._carregar_mais is not None:
+            self._carregar_mais()
     
     def _on_configure(self, event=None):
         """Recalcula as larguras das colunas quando redimensionado"""
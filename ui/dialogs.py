@@ -13,6 +13,11 @@ from datetime import datetime
 import pandas as pd
 
 # Importações internas
+from database.correspondencia import exportar_correspondencias
+from database.fontes import REGIMES
+from database.importacao import tarefas_do_arquivo
+from database.curva_abc import LIMITES_ABC
+from database.relatorios import NOMES_TIPOS, exportar_curva_abc, exportar_relatorio_insumos
 from ui.components import ScrollableTreeView
 
 
@@ -154,16 +159,21 @@ class AbrirProjeto(DialogBase):
 class ImportarSinapi(DialogBase):
     """Diálogo para importar dados do SINAPI"""
     
+    DETECTAR = "Detectar pelo nome do arquivo"
+    
     def __init__(self, parent, db):
-        super().__init__(parent, "Importar SINAPI", (600, 500))
+        super().__init__(parent, "Importar SINAPI", (600, 650))
         self.db = db
         
         # Variáveis
         self.arquivo_var = tk.StringVar()
-        self.mes_ref_var = tk.StringVar(value=datetime.now().strftime("%Y-%m"))
+        # Vazios: deduzidos pelo nome de cada arquivo (ex: ..._AM_202412_Desonerado.xlsx)
+        self.mes_ref_var = tk.StringVar()
+        self.uf_var = tk.StringVar()
+        self.regime_var = tk.StringVar(value=self.DETECTAR)
         
         # Widgets
-        ctk.CTkLabel(self.main_frame, text="Arquivo Excel SINAPI:", 
+        ctk.CTkLabel(self.main_frame, text="Arquivos SINAPI - Excel ou ZIP (separados por ';'):", 
                    font=("Segoe UI", 12, "bold")).pack(anchor="w", pady=(0, 5))
         
         file_frame = ctk.CTkFrame(self.main_frame)
@@ -173,10 +183,20 @@ class ImportarSinapi(DialogBase):
         ctk.CTkButton(file_frame, text="Procurar...", 
                     command=self._selecionar_arquivo).pack(side="right", padx=(5, 0))
         
-        ctk.CTkLabel(self.main_frame, text="Mês de Referência (YYYY-MM):", 
+        ctk.CTkLabel(self.main_frame, text="Base (em branco: detectar pelo nome do arquivo):", 
                    font=("Segoe UI", 12, "bold")).pack(anchor="w", pady=(0, 5))
         
-        ctk.CTkEntry(self.main_frame, textvariable=self.mes_ref_var, width=100).pack(anchor="w", pady=(0, 15))
+        base_frame = ctk.CTkFrame(self.main_frame)
+        base_frame.pack(fill="x", pady=(0, 15))
+        
+        ctk.CTkLabel(base_frame, text="Mês (YYYY-MM):").pack(side="left")
+        ctk.CTkEntry(base_frame, textvariable=self.mes_ref_var, width=80).pack(side="left", padx=(5, 15))
+        ctk.CTkLabel(base_frame, text="UF:").pack(side="left")
+        ctk.CTkEntry(base_frame, textvariable=self.uf_var, width=40).pack(side="left", padx=(5, 15))
+        
+        # Também escolhe as planilhas dentro dos pacotes ZIP
+        ctk.CTkOptionMenu(base_frame, variable=self.regime_var,
+                         values=[self.DETECTAR] + list(REGIMES.values())).pack(side="left")
         
         ctk.CTkLabel(self.main_frame, text="Dados a importar:", 
                    font=("Segoe UI", 12, "bold")).pack(anchor="w", pady=(0, 5))
@@ -187,6 +207,15 @@ class ImportarSinapi(DialogBase):
         ctk.CTkCheckBox(self.main_frame, text="Insumos", variable=self.importar_insumos_var).pack(anchor="w")
         ctk.CTkCheckBox(self.main_frame, text="Composições", variable=self.importar_comp_var).pack(anchor="w", pady=(0, 15))
         
+        # Modo delta: grava só o que mudou desde a última importação
+        self.delta_var = tk.BooleanVar(value=False)
+        self.remover_ausentes_var = tk.BooleanVar(value=False)
+        
+        ctk.CTkCheckBox(self.main_frame, text="Importar apenas alterações (delta)",
+                       variable=self.delta_var).pack(anchor="w")
+        ctk.CTkCheckBox(self.main_frame, text="Remover itens ausentes na nova planilha",
+                       variable=self.remover_ausentes_var).pack(anchor="w", pady=(0, 15))
+        
         # Lista de status da importação
         ctk.CTkLabel(self.main_frame, text="Log de importação:", 
                    font=("Segoe UI", 12, "bold")).pack(anchor="w", pady=(0, 5))
@@ -202,78 +231,81 @@ class ImportarSinapi(DialogBase):
         btn_frame.pack(fill="x")
         
         ctk.CTkButton(btn_frame, text="Fechar", command=self.destroy).pack(side="right", padx=5)
-        ctk.CTkButton(btn_frame, text="Importar", command=self._importar).pack(side="right", padx=5)
+        self.btn_importar = ctk.CTkButton(btn_frame, text="Importar", command=self._importar)
+        self.btn_importar.pack(side="right", padx=5)
     
     def _selecionar_arquivo(self):
-        """Abre o diálogo para selecionar o arquivo Excel"""
-        arquivo = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx;*.xls")])
-        if arquivo:
-            self.arquivo_var.set(arquivo)
+        """Abre o diálogo para selecionar um ou mais arquivos Excel"""
+        arquivos = filedialog.askopenfilenames(filetypes=[
+            ("Planilhas e pacotes SINAPI", "*.xlsx;*.xls;*.zip"),
+            ("Excel files", "*.xlsx;*.xls"),
+            ("Pacotes ZIP", "*.zip")
+        ])
+        if arquivos:
+            self.arquivo_var.set(";".join(arquivos))
+    
+    def _registrar(self, mensagem):
+        """Acrescenta uma mensagem ao log de importação"""
+        self.status_text.insert(ctk.END, f"{mensagem}\n")
+        self.status_text.see(ctk.END)
+        self.update()
     
     def _importar(self):
-        """Executa a importação dos dados SINAPI"""
-        arquivo = self.arquivo_var.get().strip()
-        if not arquivo or not os.path.exists(arquivo):
+        """Executa a importação dos dados SINAPI (várias planilhas em paralelo)"""
+        arquivos = [a.strip() for a in self.arquivo_var.get().split(";") if a.strip()]
+        if not arquivos or not all(os.path.exists(a) for a in arquivos):
             messagebox.showerror("Erro", "Arquivo não encontrado")
             return
         
         mes_ref = self.mes_ref_var.get().strip()
         
+        # Monta uma tarefa para cada tipo de dado selecionado em cada arquivo
+        selecionados = []
+        if self.importar_insumos_var.get():
+            selecionados.append('insumos')
+        if self.importar_comp_var.get():
+            selecionados.append('composicoes')
+        
+        regime = next((chave for chave, nome in REGIMES.items() if nome == self.regime_var.get()), None)
+        uf = self.uf_var.get().strip().upper() or None
+        
+        tarefas = [
+            tarefa
+            for arquivo in arquivos
+            for tarefa in tarefas_do_arquivo(arquivo, selecionados, mes_ref or None, regime, uf)
+        ]
+        
         # Atualiza o status
         self.status_text.delete("1.0", ctk.END)
-        self.status_text.insert(ctk.END, f"Iniciando importação...\n")
-        self.update()
+        self._registrar(f"Iniciando importação de {len(tarefas)} planilha(s)...")
+        self.btn_importar.configure(state="disabled")
         
         try:
-            # Importa insumos
-            if self.importar_insumos_var.get():
-                self.status_text.insert(ctk.END, "Importando insumos...\n")
-                self.update()
-                
-                # Tenta importar da aba padrão e alternativas
-                try:
-                    total = self.db.importar_insumos(arquivo, aba='insumos', mes_ref=mes_ref)
-                except Exception as e:
-                    self.status_text.insert(ctk.END, f"Erro na aba 'insumos': {str(e)}\nTentando 'Insumos'...\n")
-                    self.update()
-                    try:
-                        total = self.db.importar_insumos(arquivo, aba='Insumos', mes_ref=mes_ref)
-                    except Exception as e:
-                        self.status_text.insert(ctk.END, f"Erro na aba 'Insumos': {str(e)}\n")
-                        self.update()
-                        total = 0
-                
-                self.status_text.insert(ctk.END, f"Importados {total} insumos\n")
-                self.update()
+            # As planilhas são processadas em paralelo; a janela continua respondendo
+            resultados = self.db.importar_planilhas(
+                tarefas,
+                progresso=self._registrar,
+                ao_aguardar=self.update,
+                delta=self.delta_var.get(),
+                remover_ausentes=self.remover_ausentes_var.get()
+            )
             
-            # Importa composições
-            if self.importar_comp_var.get():
-                self.status_text.insert(ctk.END, "Importando composições...\n")
-                self.update()
-                
-                # Tenta importar da aba padrão e alternativas
-                try:
-                    total = self.db.importar_composicoes(arquivo, aba='Composicoes', mes_ref=mes_ref)
-                except Exception as e:
-                    self.status_text.insert(ctk.END, f"Erro na aba 'Composicoes': {str(e)}\nTentando 'composicoes'...\n")
-                    self.update()
-                    try:
-                        total = self.db.importar_composicoes(arquivo, aba='composicoes', mes_ref=mes_ref)
-                    except Exception as e:
-                        self.status_text.insert(ctk.END, f"Erro na aba 'composicoes': {str(e)}\n")
-                        self.update()
-                        total = 0
-                
-                self.status_text.insert(ctk.END, f"Importadas {total} composições\n")
-                self.update()
+            total_insumos = sum(total for tarefa, total in resultados if tarefa.tipo == 'insumos')
+            total_comp = sum(total for tarefa, total in resultados if tarefa.tipo == 'composicoes')
             
-            self.status_text.insert(ctk.END, "Importação concluída!")
+            verbo = "Gravados" if self.delta_var.get() else "Importados"
+            if 'insumos' in selecionados:
+                self._registrar(f"{verbo} {total_insumos} insumos")
+            if 'composicoes' in selecionados:
+                self._registrar(f"{verbo} {total_comp} composições")
             
-            # Limpa os arquivos temporários
-            self.db.limpar_arquivos_temporarios()
+            self.status_text.insert(ctk.END, "Importação concluída!")
             
         except Exception as e:
             self.status_text.insert(ctk.END, f"Erro: {str(e)}")
+        finally:
+            if self.winfo_exists():
+                self.btn_importar.configure(state="normal")
 
 
 class CalculadoraBDI(DialogBase):
@@ -443,6 +475,9 @@ class ConfiguracoesSistema(DialogBase):
         ctk.CTkButton(db_frame, text="Limpar Arquivos Temporários", 
                     command=self.db.limpar_arquivos_temporarios).pack(anchor="w", pady=5, padx=10)
         
+        ctk.CTkButton(db_frame, text="Limpar Cache de Planilhas", 
+                    command=self._limpar_cache).pack(anchor="w", pady=5, padx=10)
+        
         ctk.CTkButton(db_frame, text="Fazer Backup do Banco de Dados", 
                     command=self._backup_banco).pack(anchor="w", pady=5, padx=10)
         
@@ -472,6 +507,19 @@ class ConfiguracoesSistema(DialogBase):
         
         ctk.CTkButton(btn_frame, text="OK", command=self.destroy).pack(side="right", padx=5)
     
+    def _limpar_cache(self):
+        """Remove as planilhas já processadas guardadas no cache"""
+        try:
+            tamanho = self.db.cache.tamanho_total()
+            removidas = self.db.cache.limpar()
+            messagebox.showinfo(
+                "Sucesso",
+                f"Cache limpo: {removidas} planilha(s) removida(s), "
+                f"{tamanho / (1024 * 1024):.1f} MB liberados".replace('.', ',')
+            )
+        except Exception as e:
+            messagebox.showerror("Erro", f"Erro ao limpar o cache: {str(e)}")
+    
     def _backup_banco(self):
         """Faz um backup do banco de dados"""
         # Solicita o caminho para salvar o arquivo
@@ -490,4 +538,503 @@ class ConfiguracoesSistema(DialogBase):
             shutil.copy2(self.db.db_path, caminho)
             messagebox.showinfo("Sucesso", f"Backup do banco de dados salvo em {caminho}")
         except Exception as e:
-            messagebox.showerror("Erro", f"Erro ao fazer backup: {str(e)}")
\ No newline at end of file
+            messagebox.showerror("Erro", f"Erro ao fazer backup: {str(e)}")
+
+
+class CorrespondenciaLote(DialogBase):
+    """Diálogo para corresponder uma planilha de quantitativos com o SINAPI e revisar o resultado"""
+    
+    # Linhas acrescentadas à lista de cada vez, conforme ela é rolada
+    LINHAS_POR_CARGA = 200
+    
+    def __init__(self, parent, db):
+        super().__init__(parent, "Corresponder Planilha de Quantitativos", (1100, 750))
+        self.db = db
+        self.correspondencias = []
+        self._itens = {}  # item da lista de linhas -> índice em correspondencias
+        self._carregadas = 0
+        
+        # Variáveis
+        self.arquivo_var = tk.StringVar()
+        
+        # Widgets
+        ctk.CTkLabel(self.main_frame, text="Planilha do cliente - Excel ou CSV (com uma coluna de descrição):", 
+                   font=("Segoe UI", 12, "bold")).pack(anchor="w", pady=(0, 5))
+        
+        file_frame = ctk.CTkFrame(self.main_frame)
+        file_frame.pack(fill="x", pady=(0, 15))
+        
+        ctk.CTkEntry(file_frame, textvariable=self.arquivo_var, width=400).pack(side="left", fill="x", expand=True)
+        self.btn_processar = ctk.CTkButton(file_frame, text="Processar", command=self._processar)
+        self.btn_processar.pack(side="right", padx=(5, 0))
+        ctk.CTkButton(file_frame, text="Procurar...", 
+                    command=self._selecionar_arquivo).pack(side="right", padx=(5, 0))
+        
+        # Linhas do cliente com o candidato escolhido
+        ctk.CTkLabel(self.main_frame, text="Linhas da planilha:", 
+                   font=("Segoe UI", 12, "bold")).pack(anchor="w", pady=(0, 5))
+        
+        linhas_frame = ctk.CTkFrame(self.main_frame)
+        linhas_frame.pack(fill="both", expand=True, pady=(0, 10))
+        
+        self.tree_linhas = ScrollableTreeView(
+            linhas_frame,
+            columns=("linha", "descricao", "codigo", "sinapi", "pontuacao"),
+            headings=["Linha", "Descrição do Cliente", "Código", "Descrição SINAPI", "Pontuação"],
+            column_widths=[50, 350, 80, 350, 80]
+        )
+        self.tree_linhas.pack(fill="both", expand=True)
+        self.tree_linhas.tree.bind("<<TreeviewSelect>>", self._mostrar_candidatos)
+        
+        # Candidatos da linha selecionada
+        ctk.CTkLabel(self.main_frame, text="Candidatos da linha selecionada (duplo clique para escolher):", 
+                   font=("Segoe UI", 12, "bold")).pack(anchor="w", pady=(0, 5))
+        
+        candidatos_frame = ctk.CTkFrame(self.main_frame)
+        candidatos_frame.pack(fill="both", expand=True, pady=(0, 10))
+        
+        self.tree_candidatos = ScrollableTreeView(
+            candidatos_frame,
+            columns=("posicao", "tipo", "codigo", "descricao", "unidade", "preco", "pontuacao"),
+            headings=["#", "Tipo", "Código", "Descrição", "Un", "Preço", "Pontuação"],
+            column_widths=[30, 90, 80, 450, 50, 90, 80]
+        )
+        self.tree_candidatos.pack(fill="both", expand=True)
+        self.tree_candidatos.tree.bind("<Double-1>", lambda event: self._escolher())
+        
+        self.lbl_status = ctk.CTkLabel(self.main_frame, text="")
+        self.lbl_status.pack(anchor="w", pady=(0, 5))
+        
+        # Botões
+        btn_frame = ctk.CTkFrame(self.main_frame)
+        btn_frame.pack(fill="x")
+        
+        ctk.CTkButton(btn_frame, text="Fechar", command=self.destroy).pack(side="right", padx=5)
+        ctk.CTkButton(btn_frame, text="Exportar...", command=self._exportar).pack(side="right", padx=5)
+        ctk.CTkButton(btn_frame, text="Nenhum Serve", command=self._descartar).pack(side="left", padx=5)
+        ctk.CTkButton(btn_frame, text="Usar Candidato", command=self._escolher).pack(side="left", padx=5)
+    
+    def _selecionar_arquivo(self):
+        """Abre o diálogo para selecionar a planilha do cliente"""
+        arquivo = filedialog.askopenfilename(filetypes=[
+            ("Planilhas de quantitativos", "*.xlsx;*.csv"),
+            ("Excel files", "*.xlsx"),
+            ("Arquivos CSV", "*.csv")
+        ])
+        if arquivo:
+            self.arquivo_var.set(arquivo)
+    
+    def _processar(self):
+        """Encontra os candidatos de todas as linhas (em vários processos)"""
+        arquivo = self.arquivo_var.get().strip()
+        if not arquivo or not os.path.exists(arquivo):
+            messagebox.showerror("Erro", "Arquivo não encontrado")
+            return
+        
+        self.lbl_status.configure(text="Processando a planilha...")
+        self.btn_processar.configure(state="disabled")
+        self.update()
+        
+        try:
+            # A janela continua respondendo enquanto os processos trabalham
+            self.correspondencias = self.db.corresponder_planilha(arquivo, ao_aguardar=self.update)
+        except Exception as e:
+            self.correspondencias = []
+            messagebox.showerror("Erro", f"Erro ao processar a planilha: {str(e)}")
+        finally:
+            if self.winfo_exists():
+                self.btn_processar.configure(state="normal")
+        
+        if not self.winfo_exists():
+            return
+        
+        # As linhas entram na lista aos poucos, conforme ela é rolada
+        self.tree_linhas.delete(*self.tree_linhas.get_children())
+        self.tree_candidatos.delete(*self.tree_candidatos.get_children())
+        self._itens = {}
+        self._carregadas = 0
+        self._carregar_linhas()
+        
+        sem_candidato = sum(1 for c in self.correspondencias if not c.candidatos)
+        self.lbl_status.configure(
+            text=f"{len(self.correspondencias)} linhas processadas; {sem_candidato} sem candidato"
+        )
+    
+    def _carregar_linhas(self):
+        """Acrescenta à lista o próximo lote de linhas"""
+        fim = min(self._carregadas + self.LINHAS_POR_CARGA, len(self.correspondencias))
+        for indice in range(self._carregadas, fim):
+            item_id = self.tree_linhas.insert("", "end", values=self._valores_linha(self.correspondencias[indice]))
+            self._itens[item_id] = indice
+        self._carregadas = fim
+        
+        mais = self._carregadas < len(self.correspondencias)
+        self.tree_linhas.ativar_paginacao(self._carregar_linhas if mais else None)
+    
+    def _valores_linha(self, correspondencia):
+        """Valores de uma linha na lista (com o candidato escolhido)"""
+        escolha = correspondencia.escolha
+        if escolha is None:
+            return (correspondencia.linha.numero, correspondencia.linha.descricao, "", "(sem correspondência)", "")
+        return (
+            correspondencia.linha.numero, correspondencia.linha.descricao,
+            escolha.codigo, escolha.descricao, f"{escolha.pontuacao:.0%}"
+        )
+    
+    def _linha_selecionada(self):
+        """Item e correspondência da linha selecionada (ou None, None)"""
+        selecao = self.tree_linhas.selection()
+        if not selecao or selecao[0] not in self._itens:
+            return None, None
+        return selecao[0], self.correspondencias[self._itens[selecao[0]]]
+    
+    def _mostrar_candidatos(self, event=None):
+        """Mostra os candidatos da linha selecionada"""
+        self.tree_candidatos.delete(*self.tree_candidatos.get_children())
+        _, correspondencia = self._linha_selecionada()
+        if correspondencia is None:
+            return
+        
+        for posicao, candidato in enumerate(correspondencia.candidatos):
+            self.tree_candidatos.insert("", "end", values=(
+                posicao + 1, candidato.tipo, candidato.codigo, candidato.descricao,
+                candidato.unidade, f"R$ {candidato.preco or 0:.2f}", f"{candidato.pontuacao:.0%}"
+            ))
+    
+    def _escolher(self):
+        """Usa o candidato selecionado para a linha selecionada"""
+        item_id, correspondencia = self._linha_selecionada()
+        selecao = self.tree_candidatos.selection()
+        if correspondencia is None or not selecao:
+            messagebox.showerror("Erro", "Selecione uma linha e um candidato")
+            return
+        
+        correspondencia.escolhido = int(self.tree_candidatos.item(selecao[0])['values'][0]) - 1
+        self.tree_linhas.item(item_id, values=self._valores_linha(correspondencia))
+    
+    def _descartar(self):
+        """Marca a linha selecionada como sem correspondência"""
+        item_id, correspondencia = self._linha_selecionada()
+        if correspondencia is None:
+            messagebox.showerror("Erro", "Selecione uma linha")
+            return
+        
+        correspondencia.escolhido = None
+        self.tree_linhas.item(item_id, values=self._valores_linha(correspondencia))
+    
+    def _exportar(self):
+        """Grava os candidatos e as escolhas em Excel ou CSV"""
+        if not self.correspondencias:
+            messagebox.showerror("Erro", "Processe uma planilha antes de exportar")
+            return
+        
+        caminho = filedialog.asksaveasfilename(
+            defaultextension=".xlsx",
+            filetypes=[("Excel files", "*.xlsx"), ("Arquivos CSV", "*.csv")],
+            initialfile=f"correspondencias_{datetime.now().strftime('%Y%m%d')}.xlsx"
+        )
+        if not caminho:
+            return
+        
+        try:
+            registros = exportar_correspondencias(self.correspondencias, caminho)
+            messagebox.showinfo("Sucesso", f"{registros} candidatos exportados para {caminho}")
+        except Exception as e:
+            messagebox.showerror("Erro", f"Erro ao exportar: {str(e)}")
+
+
+class UsoItem(DialogBase):
+    """Diálogo que mostra as composições que usam um insumo e o impacto de uma variação do seu preço"""
+    
+    def __init__(self, parent, db, codigo, descricao=""):
+        super().__init__(parent, f"Onde é Usado - {codigo}", (1000, 600))
+        self.db = db
+        self.codigo = codigo
+        self.usos = []
+        
+        # Variáveis
+        self.transitivo_var = tk.BooleanVar(value=True)
+        self.variacao_var = tk.StringVar(value="10")
+        
+        # Widgets
+        ctk.CTkLabel(self.main_frame, text=f"{codigo} - {descricao}", 
+                   font=("Segoe UI", 12, "bold")).pack(anchor="w", pady=(0, 10))
+        
+        opcoes_frame = ctk.CTkFrame(self.main_frame)
+        opcoes_frame.pack(fill="x", pady=(0, 10))
+        
+        ctk.CTkCheckBox(opcoes_frame, text="Incluir o uso por meio de sub-composições",
+                      variable=self.transitivo_var, command=self._consultar).pack(side="left", padx=5)
+        
+        ctk.CTkLabel(opcoes_frame, text="Variação do preço do item (%):").pack(side="left", padx=(20, 5))
+        entry_variacao = ctk.CTkEntry(opcoes_frame, textvariable=self.variacao_var, width=70)
+        entry_variacao.pack(side="left")
+        entry_variacao.bind("<Return>", lambda event: self._mostrar())
+        ctk.CTkButton(opcoes_frame, text="Calcular", width=80, command=self._mostrar).pack(side="left", padx=5)
+        
+        usos_frame = ctk.CTkFrame(self.main_frame)
+        usos_frame.pack(fill="both", expand=True, pady=(0, 10))
+        
+        self.tree_usos = ScrollableTreeView(
+            usos_frame,
+            columns=("codigo", "descricao", "unidade", "nivel", "coeficiente", "custo", "participacao", "novo"),
+            headings=["Código", "Descrição", "Un", "Nível", "Coeficiente", "Custo", "Participação", "Novo Custo"],
+            column_widths=[70, 380, 40, 50, 90, 100, 90, 100]
+        )
+        self.tree_usos.pack(fill="both", expand=True)
+        
+        self.lbl_status = ctk.CTkLabel(self.main_frame, text="")
+        self.lbl_status.pack(anchor="w", pady=(0, 5))
+        
+        ctk.CTkButton(self.main_frame, text="Fechar", command=self.destroy).pack(side="right")
+        
+        self._consultar()
+    
+    def _consultar(self):
+        """Busca as composições que usam o item (pelo índice inverso)"""
+        try:
+            self.usos = self.db.composicoes_que_usam(self.codigo, transitivo=self.transitivo_var.get())
+        except Exception as e:
+            self.usos = []
+            messagebox.showerror("Erro", f"Erro ao consultar: {str(e)}")
+        self._mostrar()
+    
+    def _mostrar(self):
+        """Mostra as composições com o custo recalculado pela variação informada"""
+        try:
+            variacao = float(self.variacao_var.get().replace(",", ".") or 0) / 100
+        except ValueError:
+            messagebox.showerror("Erro", "Variação inválida")
+            return
+        
+        self.tree_usos.delete(*self.tree_usos.get_children())
+        for codigo, descricao, unidade, custo, nivel, coeficiente, custo_item in self.usos:
+            custo = custo or 0
+            custo_item = custo_item or 0
+            participacao = custo_item / custo if custo else 0
+            self.tree_usos.insert("", "end", values=(
+                codigo, descricao, unidade, nivel, f"{coeficiente:.4f}", f"R$ {custo:.2f}",
+                f"{participacao:.1%}", f"R$ {custo + custo_item * variacao:.2f}"
+            ))
+        
+        diretas = sum(1 for uso in self.usos if uso[4] == 1)
+        self.lbl_status.configure(text=f"{len(self.usos)} composições usam o item ({diretas} diretamente)")
+
+
+class RelatorioInsumos(DialogBase):
+    """
+    Diálogo com o orçamento desdobrado nos insumos (quantidades somadas por código)
+    
+    Com codigo_composicao, mostra uma única composição desdobrada, com os
+    coeficientes por unidade dela ("ver composição").
+    """
+    
+    # Linhas acrescentadas à lista de cada vez, conforme ela é rolada
+    LINHAS_POR_CARGA = 200
+    
+    def __init__(self, parent, db, projeto_id=None, nome_projeto="", codigo_composicao=None):
+        if codigo_composicao is None:
+            titulo, legenda = f"Relatório de Insumos - {nome_projeto}", "Insumos do orçamento (composições desdobradas):"
+        else:
+            titulo, legenda = f"Composição {nome_projeto}", "Insumos por unidade da composição (desdobrada):"
+        super().__init__(parent, titulo, (1000, 650))
+        self.db = db
+        self.nome_projeto = nome_projeto
+        self.linhas = []
+        self._carregadas = 0
+        
+        # Widgets
+        ctk.CTkLabel(self.main_frame, text=legenda, 
+                   font=("Segoe UI", 12, "bold")).pack(anchor="w", pady=(0, 5))
+        
+        insumos_frame = ctk.CTkFrame(self.main_frame)
+        insumos_frame.pack(fill="both", expand=True, pady=(0, 10))
+        
+        self.tree_insumos = ScrollableTreeView(
+            insumos_frame,
+            columns=("tipo", "codigo", "descricao", "unidade", "quantidade", "preco", "total"),
+            headings=["Tipo", "Código", "Descrição", "Un",
+                      "Quantidade" if codigo_composicao is None else "Coeficiente", "Preço", "Total"],
+            column_widths=[80, 70, 400, 40, 100, 100, 120]
+        )
+        self.tree_insumos.pack(fill="both", expand=True)
+        
+        self.lbl_status = ctk.CTkLabel(self.main_frame, text="")
+        self.lbl_status.pack(anchor="w", pady=(0, 5))
+        
+        # Botões
+        btn_frame = ctk.CTkFrame(self.main_frame)
+        btn_frame.pack(fill="x")
+        
+        ctk.CTkButton(btn_frame, text="Fechar", command=self.destroy).pack(side="right", padx=5)
+        ctk.CTkButton(btn_frame, text="Exportar...", command=self._exportar).pack(side="right", padx=5)
+        
+        try:
+            if codigo_composicao is None:
+                self.linhas = self.db.explodir_orcamento(projeto_id)
+            else:
+                self.linhas = self.db.obter_explosao_composicao(codigo_composicao)
+        except Exception as e:
+            messagebox.showerror("Erro", f"Erro ao desdobrar: {str(e)}")
+        
+        self._carregar_linhas()
+        total = sum(linha[6] for linha in self.linhas)
+        self.lbl_status.configure(text=f"{len(self.linhas)} itens; total R$ {total:.2f}")
+    
+    def _carregar_linhas(self):
+        """Acrescenta à lista o próximo lote de linhas"""
+        fim = min(self._carregadas + self.LINHAS_POR_CARGA, len(self.linhas))
+        for tipo, codigo, descricao, unidade, quantidade, preco, total in self.linhas[self._carregadas:fim]:
+            self.tree_insumos.insert("", "end", values=(
+                NOMES_TIPOS.get(tipo, tipo), codigo, descricao, unidade,
+                f"{quantidade:.4f}", f"R$ {preco:.2f}", f"R$ {total:.2f}"
+            ))
+        self._carregadas = fim
+        
+        mais = self._carregadas < len(self.linhas)
+        self.tree_insumos.ativar_paginacao(self._carregar_linhas if mais else None)
+    
+    def _exportar(self):
+        """Grava o relatório em Excel ou CSV"""
+        if not self.linhas:
+            messagebox.showerror("Erro", "Não há itens para exportar")
+            return
+        
+        caminho = filedialog.asksaveasfilename(
+            defaultextension=".xlsx",
+            filetypes=[("Excel files", "*.xlsx"), ("Arquivos CSV", "*.csv")],
+            initialfile=f"{self.nome_projeto.replace(' ', '_')[:40]}_insumos.xlsx"
+        )
+        if not caminho:
+            return
+        
+        try:
+            registros = exportar_relatorio_insumos(self.linhas, caminho)
+            messagebox.showinfo("Sucesso", f"{registros} itens exportados para {caminho}")
+        except Exception as e:
+            messagebox.showerror("Erro", f"Erro ao exportar: {str(e)}")
+
+
+class RelatorioCurvaABC(DialogBase):
+    """Diálogo com a curva ABC do orçamento (serviços ou insumos desdobrados)"""
+    
+    # Linhas acrescentadas à lista de cada vez, conforme ela é rolada
+    LINHAS_POR_CARGA = 200
+    
+    def __init__(self, parent, db, projeto_id, nome_projeto=""):
+        super().__init__(parent, f"Curva ABC - {nome_projeto}", (1100, 650))
+        self.db = db
+        self.projeto_id = projeto_id
+        self.nome_projeto = nome_projeto
+        self.curva = None
+        self._carregadas = 0
+        
+        # Variáveis
+        self.insumos_var = tk.BooleanVar(value=False)
+        self.limite_a_var = tk.StringVar(value=f"{LIMITES_ABC[0]:g}")
+        self.limite_b_var = tk.StringVar(value=f"{LIMITES_ABC[1]:g}")
+        
+        # Widgets
+        opcoes_frame = ctk.CTkFrame(self.main_frame)
+        opcoes_frame.pack(fill="x", pady=(0, 10))
+        
+        ctk.CTkRadioButton(opcoes_frame, text="Serviços do orçamento", variable=self.insumos_var,
+                         value=False, command=self._calcular).pack(side="left", padx=5)
+        ctk.CTkRadioButton(opcoes_frame, text="Insumos (composições desdobradas)", variable=self.insumos_var,
+                         value=True, command=self._calcular).pack(side="left", padx=5)
+        
+        ctk.CTkLabel(opcoes_frame, text="Classe A até (%):").pack(side="left", padx=(20, 5))
+        entry_a = ctk.CTkEntry(opcoes_frame, textvariable=self.limite_a_var, width=50)
+        entry_a.pack(side="left")
+        ctk.CTkLabel(opcoes_frame, text="Classe B até (%):").pack(side="left", padx=(10, 5))
+        entry_b = ctk.CTkEntry(opcoes_frame, textvariable=self.limite_b_var, width=50)
+        entry_b.pack(side="left")
+        for entry in (entry_a, entry_b):
+            entry.bind("<Return>", lambda event: self._calcular())
+        ctk.CTkButton(opcoes_frame, text="Calcular", width=80, command=self._calcular).pack(side="left", padx=5)
+        
+        curva_frame = ctk.CTkFrame(self.main_frame)
+        curva_frame.pack(fill="both", expand=True, pady=(0, 10))
+        
+        self.tree_curva = ScrollableTreeView(
+            curva_frame,
+            columns=("classe", "tipo", "codigo", "descricao", "unidade", "quantidade", "preco", "total",
+                     "participacao", "acumulado"),
+            headings=["Classe", "Tipo", "Código", "Descrição", "Un", "Quantidade", "Preço", "Total",
+                      "Part. %", "Acum. %"],
+            column_widths=[50, 80, 70, 360, 40, 90, 90, 110, 70, 70]
+        )
+        self.tree_curva.pack(fill="both", expand=True)
+        
+        self.lbl_status = ctk.CTkLabel(self.main_frame, text="")
+        self.lbl_status.pack(anchor="w", pady=(0, 5))
+        
+        # Botões
+        btn_frame = ctk.CTkFrame(self.main_frame)
+        btn_frame.pack(fill="x")
+        
+        ctk.CTkButton(btn_frame, text="Fechar", command=self.destroy).pack(side="right", padx=5)
+        ctk.CTkButton(btn_frame, text="Exportar...", command=self._exportar).pack(side="right", padx=5)
+        
+        self._calcular()
+    
+    def _calcular(self):
+        """Recalcula a curva com o tipo de item e os limites informados"""
+        try:
+            limites = (float(self.limite_a_var.get().replace(",", ".")),
+                       float(self.limite_b_var.get().replace(",", ".")))
+            self.curva = self.db.curva_abc_orcamento(self.projeto_id, self.insumos_var.get(), limites)
+        except ValueError as e:
+            messagebox.showerror("Erro", f"Limites inválidos: {str(e)}")
+            return
+        except Exception as e:
+            messagebox.showerror("Erro", f"Erro ao calcular a curva ABC: {str(e)}")
+            return
+        
+        self.tree_curva.ativar_paginacao(None)
+        self.tree_curva.delete(*self.tree_curva.get_children())
+        self._carregadas = 0
+        self._carregar_linhas()
+        
+        resumo = "; ".join(
+            f"{classe}: {quantidade} itens, R$ {total:.2f} ({participacao:.1f}%)"
+            for classe, (quantidade, total, participacao) in self.curva.resumo().items()
+        )
+        self.lbl_status.configure(text=f"Total R$ {self.curva.total:.2f} | {resumo}")
+    
+    def _carregar_linhas(self):
+        """Acrescenta à lista o próximo lote de linhas"""
+        linhas = self.curva.linhas
+        fim = min(self._carregadas + self.LINHAS_POR_CARGA, len(linhas))
+        for (tipo, codigo, descricao, unidade, quantidade, preco, total,
+             participacao, acumulado, classe) in linhas[self._carregadas:fim]:
+            self.tree_curva.insert("", "end", values=(
+                classe, NOMES_TIPOS.get(tipo, tipo), codigo, descricao, unidade,
+                f"{quantidade:.4f}", f"R$ {preco:.2f}", f"R$ {total:.2f}",
+                f"{participacao:.2f}", f"{min(acumulado, 100):.2f}"
+            ))
+        self._carregadas = fim
+        
+        mais = self._carregadas < len(linhas)
+        self.tree_curva.ativar_paginacao(self._carregar_linhas if mais else None)
+    
+    def _exportar(self):
+        """Grava a curva em Excel ou CSV"""
+        if not self.curva or not self.curva.linhas:
+            messagebox.showerror("Erro", "Não há itens para exportar")
+            return
+        
+        sufixo = "insumos" if self.insumos_var.get() else "servicos"
+        caminho = filedialog.asksaveasfilename(
+            defaultextension=".xlsx",
+            filetypes=[("Excel files", "*.xlsx"), ("Arquivos CSV", "*.csv")],
+            initialfile=f"{self.nome_projeto.replace(' ', '_')[:40]}_curva_abc_{sufixo}.xlsx"
+        )
+        if not caminho:
+            return
+        
+        try:
+            registros = exportar_curva_abc(self.curva, caminho)
+            messagebox.showinfo("Sucesso", f"{registros} itens exportados para {caminho}")
+        except Exception as e:
+            messagebox.showerror("Erro", f"Erro ao exportar: {str(e)}")